@@ -1 +1 @@
-from .fastaccesslimiter import FastAccessLimiter
\ No newline at end of file
+from .fastaccesslimiter import FastAccessLimiter, RateLimited, Rule, __version__
\ No newline at end of file
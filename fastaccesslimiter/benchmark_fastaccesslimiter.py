@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""Benchmarks for FastAccessLimiter. Run `python3 benchmark_fastaccesslimiter.py --help` to see the options."""
+import sys, os, socket, struct, random, time, argparse, threading, tempfile, json, platform, ipaddress
+from fastaccesslimiter import FastAccessLimiter, __version__
+
+def randomipv4network():
+    prefixlen = random.randint(16,32)
+    return socket.inet_ntoa(struct.pack('>L',random.randint(16777216,3758096383) & (0xFFFFFFFF << (32-prefixlen)) & 0xFFFFFFFF))+f"/{prefixlen}"
+
+def randomipv6network():
+    prefixlen = random.choice([32,48,56,64,64,64,128])
+    return socket.inet_ntop(socket.AF_INET6,((random.getrandbits(125) | (1 << 125)) & ((1 << 128)-(1 << (128-prefixlen)))).to_bytes(16,'big'))+f"/{prefixlen}"
+
+def random_network_list(size:int,ipv6_ratio:float=0.0)->list:
+    return [randomipv6network() if random.random() < ipv6_ratio else randomipv4network() for _ in range(size)]
+
+def merged_feed_list(size:int)->list:
+    """A list like several public feeds merged together: runs of adjacent /24 and /32, large blocks, and /24 and /32 
+    already covered by the large blocks or repeated by more than one feed."""
+    network_list = []
+    while len(network_list) < size:
+        choice = random.random()
+        if choice < 0.1:
+            prefixlen = random.randint(12,20)
+            network_list.append(socket.inet_ntoa(struct.pack('>L',random.randint(16777216,3758096383) & (0xFFFFFFFF << (32-prefixlen)) & 0xFFFFFFFF))+f"/{prefixlen}")
+        elif choice < 0.6:
+            first, prefixlen = random.randint(16777216,3758096383) & 0xFFFFFF00, random.choice([24,24,24,32])
+            for position in range(random.randint(1,64)):
+                network_list.append(socket.inet_ntoa(struct.pack('>L',first+(position << (32-prefixlen))))+f"/{prefixlen}")
+        elif network_list:
+            # a network of another feed inside or equal to a network that is already in the list
+            address, prefixlen = random.choice(network_list).split("/")
+            prefixlen = random.randint(int(prefixlen),32)
+            iplong = struct.unpack('>L',socket.inet_aton(address))[0] & (0xFFFFFFFF << (32-prefixlen)) & 0xFFFFFFFF
+            network_list.append(socket.inet_ntoa(struct.pack('>L',iplong))+f"/{prefixlen}")
+    return network_list[:size]
+
+def benchmark_compact(sizes:list,lookups:int):
+    """Size of the lookup table (as a binary snapshot), prepare time and check time of merged feeds with and without compact=True."""
+    print(f"- Compaction of merged feeds (lookups={lookups:,}):")
+    for size in sizes:
+        network_list = merged_feed_list(size)
+        ip_list = [socket.inet_ntoa(struct.pack('>L',struct.unpack('>L',socket.inet_aton(random.choice(network_list).split("/")[0]))[0]+random.randint(0,255))) 
+                   for _ in range(lookups // 2)]+[network.split("/")[0] for network in random_network_list(lookups-lookups // 2)]
+        print(f"  {size:>10,} networks:")
+        for compact in (False,True):
+            start_time = time.monotonic()
+            accessLimiter = FastAccessLimiter(ip_network_list=network_list,with_stats=False,cache_size=0,compact=compact)
+            prepare_time = time.monotonic()-start_time
+            with tempfile.TemporaryDirectory() as temp_dir:
+                accessLimiter.save_ip_network_list(os.path.join(temp_dir,"table.bin"))
+                table_size = os.path.getsize(os.path.join(temp_dir,"table.bin"))
+            start_time = time.monotonic()
+            for ipaddr in ip_list:
+                accessLimiter(ipaddr)
+            check_time = time.monotonic()-start_time
+            print(f"    compact={str(compact):<5} {len(accessLimiter.get_ip_network_list()):>10,} networks - table {table_size/1048576:>8.2f} MiB - "
+                  f"prepare {prepare_time:.3f} seconds - check {check_time/lookups*1000000:.3f} µs per call")
+            if compact:
+                info = accessLimiter.compaction_info()
+                print(f"    {info.networks-info.compacted_networks:,} networks removed ({(info.networks-info.compacted_networks)/max(info.networks,1)*100:.1f}%): "
+                      f"{info.contained:,} contained and {info.merged:,} merges of adjacent networks")
+            del accessLimiter
+
+def benchmark_prepare(sizes:list,workers:int,ipv6_ratio:float):
+    """Time to prepare (parse, validate, sort and flatten) lists of random networks."""
+    print(f"- Prepare time (workers={workers}, ipv6_ratio={ipv6_ratio}):")
+    for size in sizes:
+        ip_network_list = random_network_list(size,ipv6_ratio)
+        start_time = time.monotonic()
+        accessLimiter = FastAccessLimiter(ip_network_list=ip_network_list,workers=workers)
+        elapsed_time = time.monotonic()-start_time
+        print(f"  {size:>10,} networks: {elapsed_time:.3f} seconds - {elapsed_time/size*1000000:.3f} µs per network - "
+              f"{len(accessLimiter.get_ip_network_list()):,} valid networks")
+        del accessLimiter, ip_network_list
+
+def benchmark_check(sizes:list,lookups:int,ipv6_ratio:float,cache_size:int):
+    """Time per call of the string path (__call__) against the integer (check_int) and packed (check_packed) paths."""
+    print(f"- Check time per call (lookups={lookups:,}, ipv6_ratio={ipv6_ratio}, cache_size={cache_size}):")
+    for size in sizes:
+        accessLimiter = FastAccessLimiter(ip_network_list=random_network_list(size,ipv6_ratio),with_stats=False,cache_size=cache_size)
+        ip_list = [network.split("/")[0] for network in random_network_list(lookups,ipv6_ratio)]
+        packed_list = [socket.inet_pton(socket.AF_INET6 if ipaddr.find(":") >= 0 else socket.AF_INET,ipaddr) for ipaddr in ip_list]
+        int_list = [(int.from_bytes(packed,'big'),socket.AF_INET6 if len(packed) == 16 else socket.AF_INET) for packed in packed_list]
+        timings = {}
+        start_time = time.monotonic()
+        for ipaddr in ip_list:
+            accessLimiter(ipaddr)
+        timings["__call__(str)"] = time.monotonic()-start_time
+        check_int = accessLimiter.check_int
+        start_time = time.monotonic()
+        for iplong, family in int_list:
+            check_int(iplong,family)
+        timings["check_int(int,family)"] = time.monotonic()-start_time
+        check_packed = accessLimiter.check_packed
+        start_time = time.monotonic()
+        for packed in packed_list:
+            check_packed(packed)
+        timings["check_packed(bytes)"] = time.monotonic()-start_time
+        print(f"  {size:>10,} networks:")
+        for name, elapsed_time in timings.items():
+            print(f"    {name:<24} {elapsed_time/lookups*1000000:.3f} µs per call - {timings['__call__(str)']/elapsed_time:.2f}x")
+        del accessLimiter, ip_list, packed_list, int_list
+
+def benchmark_jump(sizes:list,lookups:int,cache_size:int):
+    """Time per call of the IPv4 lookups with the first-level table (ipv4_jump_table=True) against the plain binary search, 
+    with random IPs (mostly misses), and the time to prepare the list and to add an IP with the table."""
+    print(f"- IPv4 first-level table (lookups={lookups:,}, cache_size={cache_size}):")
+    for size in sizes:
+        network_list = random_network_list(size)
+        ip_list = [network.split("/")[0] for network in random_network_list(lookups)]
+        print(f"  {size:>10,} networks:")
+        timings = {}
+        for jump_table in (False,True):
+            start_time = time.monotonic()
+            accessLimiter = FastAccessLimiter(ip_network_list=network_list,with_stats=False,cache_size=cache_size,ipv4_jump_table=jump_table)
+            prepare_time = time.monotonic()-start_time
+            start_time = time.monotonic()
+            for ipaddr in ip_list:
+                accessLimiter(ipaddr)
+            timings[jump_table] = time.monotonic()-start_time
+            start_time = time.monotonic()
+            accessLimiter.add_ip(randomipv4network())
+            add_time = time.monotonic()-start_time
+            print(f"    ipv4_jump_table={str(jump_table):<5} check {timings[jump_table]/lookups*1000000:.3f} µs per call - {timings[False]/timings[jump_table]:.2f}x - "
+                  f"prepare {prepare_time:.3f} seconds - add_ip {add_time*1000:.3f} ms")
+            del accessLimiter
+
+def benchmark_ipv6(sizes:list,lookups:int,cache_size:int,long_ratios:list,repeat:int):
+    """Throughput of the IPv6 lookups against lists of IPv6 networks of /32 to /64 with a ratio of networks longer than /64 
+    (/80 to /128), that are the only ones that need the low halves of the addresses. Half of the lookups are inside the list."""
+    print(f"- IPv6 lookups (lookups={lookups:,}, cache_size={cache_size}, best of {repeat}):")
+    for size in sizes:
+        print(f"  {size:>10,} networks:")
+        for long_ratio in long_ratios:
+            network_list = []
+            for _ in range(size):
+                prefixlen = random.choice([80,96,112,128]) if random.random() < long_ratio else random.choice([32,40,48,56,64])
+                iplong = (random.getrandbits(125) | (1 << 125)) & ((1 << 128)-(1 << (128-prefixlen)))
+                network_list.append(socket.inet_ntop(socket.AF_INET6,iplong.to_bytes(16,'big'))+f"/{prefixlen}")
+            accessLimiter = FastAccessLimiter(ip_network_list=network_list,with_stats=False,cache_size=cache_size)
+            ip_list = lookup_list(network_list,lookups,0.5,lookups,1.0)
+            packed_list = [socket.inet_pton(socket.AF_INET6,ipaddr) for ipaddr in ip_list]
+            int_list = [int.from_bytes(packed,'big') for packed in packed_list]
+            timings = {"__call__(str)":time_calls(accessLimiter,ip_list,repeat)}
+            for name, function, argument_list in (("check_int(int)",lambda iplong: accessLimiter.check_int(iplong,socket.AF_INET6),int_list),
+                                                  ("check_packed(bytes)",accessLimiter.check_packed,packed_list)):
+                best_time = float("inf")
+                for _ in range(repeat):
+                    start_time = time.perf_counter()
+                    for argument in argument_list:
+                        function(argument)
+                    best_time = min(best_time,time.perf_counter()-start_time)
+                timings[name] = best_time
+            print(f"    {long_ratio:>5.0%} longer than /64: "+" - ".join(f"{name} {elapsed_time/lookups*1000000:.3f} µs ({lookups/elapsed_time/1000000:.2f}M/s)" for name, elapsed_time in timings.items()))
+            del accessLimiter, ip_list, packed_list, int_list
+
+def benchmark_threads(sizes:list,lookups:int,ipv6_ratio:float,cache_size:int,threads_list:list):
+    """Lookup throughput with 1 to N threads sharing the same object, and the hits counted by stats_info() against the 
+    real number of hits. The throughput only scales with the number of threads in a free-threaded Python (3.13t+)."""
+    gil_enabled = sys._is_gil_enabled() if hasattr(sys,"_is_gil_enabled") else True
+    print(f"- Multi-thread check throughput (lookups per thread={lookups:,}, ipv6_ratio={ipv6_ratio}, cache_size={cache_size}, GIL={'enabled' if gil_enabled else 'disabled'}):")
+    for size in sizes:
+        network_list = random_network_list(size,ipv6_ratio)
+        ip_list = [network.split("/")[0] for network in random.sample(network_list,min(lookups // 2,size))]
+        ip_list = (ip_list+[network.split("/")[0] for network in random_network_list(lookups-len(ip_list),ipv6_ratio)])[:lookups]
+        print(f"  {size:>10,} networks:")
+        for threads in threads_list:
+            accessLimiter = FastAccessLimiter(ip_network_list=network_list,cache_size=cache_size)
+            expected_hits = sum(1 for ipaddr in ip_list if accessLimiter(ipaddr))*threads
+            accessLimiter.stats_reset()
+            barrier = threading.Barrier(threads+1)
+            def worker():
+                barrier.wait()
+                for ipaddr in ip_list:
+                    accessLimiter(ipaddr)
+            thread_list = [threading.Thread(target=worker) for _ in range(threads)]
+            for thread in thread_list:
+                thread.start()
+            barrier.wait()
+            start_time = time.monotonic()
+            for thread in thread_list:
+                thread.join()
+            elapsed_time = time.monotonic()-start_time
+            hits = accessLimiter.stats_info().hits
+            print(f"    {threads:>3} threads: {lookups*threads/elapsed_time:>12,.0f} lookups/s - "
+                  f"hits counted {hits:,} of {expected_hits:,} ({'lossless' if hits == expected_hits else 'LOST '+str(expected_hits-hits)})")
+            del accessLimiter
+
+def peak_rss_mib()->float:
+    """The peak resident memory of this process in MiB, or None without the resource module (ex: on Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/(1048576 if sys.platform == "darwin" else 1024)
+
+def rss_mib()->float:
+    """The current resident memory of this process in MiB (from /proc on Linux), or the peak resident memory elsewhere, 
+    or None if none of them is available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")/1048576
+    except (OSError,ValueError,IndexError,AttributeError):
+        return peak_rss_mib()
+
+def lookup_list(network_list:list,lookups:int,hit_ratio:float,unique_ips:int,ipv6_ratio:float)->list:
+    """A list of lookups drawn from a pool of unique_ips IPs: hit_ratio of the pool are IPs inside random networks of the list 
+    and the others are random IPs (that can also fall inside a network by chance). The repeated IPs are the hits of the cache."""
+    pool = []
+    for network in random.choices(network_list,k=round(unique_ips*hit_ratio)):
+        network = ipaddress.ip_network(network)
+        pool.append(str(network[random.randint(0,network.num_addresses-1)]))
+    pool.extend(network.split("/")[0] for network in random_network_list(unique_ips-len(pool),ipv6_ratio))
+    return [random.choice(pool) for _ in range(lookups)]
+
+def time_calls(accessLimiter:FastAccessLimiter,ip_list:list,repeat:int)->float:
+    """The best time of repeat loops over the whole list, in seconds. There is no timer call inside the loop."""
+    best_time = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for ipaddr in ip_list:
+            accessLimiter(ipaddr)
+        best_time = min(best_time,time.perf_counter()-start_time)
+    return best_time
+
+def benchmark_suite(sizes:list,ipv6_ratios:list,hit_ratios:list,cache_sizes:list,with_stats_list:list,lookups:int,unique_ratio:float,repeat:int,seed:int,json_filename:str):
+    """Sweep the list size, the ratio of IPv6 networks, the hit ratio, the cache size and with_stats. For each list: the prepare 
+    time and the resident memory of the object, the time to reload it (load_ip_network_list) and to save and open a binary 
+    snapshot. For each combination: the time per call of the best of repeat loops, the measured hit ratio and the hit ratio 
+    of the cache. The results are written as JSON to compare versions with `compare`."""
+    results = {"benchmark":"suite","version":__version__,"python":sys.version.split()[0],"platform":platform.platform(),
+               "seed":seed,"lookups":lookups,"unique_ratio":unique_ratio,"repeat":repeat,"results":[]}
+    print(f"- Benchmark suite (lookups={lookups:,}, unique_ratio={unique_ratio}, repeat={repeat}, seed={seed}):")
+    for size in sizes:
+        for ipv6_ratio in ipv6_ratios:
+            random.seed(f"{seed}-{size}-{ipv6_ratio}")
+            network_list = random_network_list(size,ipv6_ratio)
+            rss_before = rss_mib()
+            start_time = time.perf_counter()
+            accessLimiter = FastAccessLimiter(ip_network_list=network_list,with_stats=False,cache_size=0)
+            prepare_time = time.perf_counter()-start_time
+            rss = rss_mib()
+            rss = rss-rss_before if rss is not None and rss_before is not None else None
+            start_time = time.perf_counter()
+            accessLimiter.load_ip_network_list(network_list)
+            reload_time = time.perf_counter()-start_time
+            with tempfile.TemporaryDirectory() as temp_dir:
+                snapshot_filename = os.path.join(temp_dir,"list.bin")
+                start_time = time.perf_counter()
+                accessLimiter.save_ip_network_list(snapshot_filename)
+                snapshot_save_time = time.perf_counter()-start_time
+                start_time = time.perf_counter()
+                FastAccessLimiter().open_ip_network_list(snapshot_filename)
+                snapshot_open_time = time.perf_counter()-start_time
+                networks = len(accessLimiter.get_ip_network_list())
+                del accessLimiter
+                results["results"].append({"benchmark":"prepare","size":size,"ipv6_ratio":ipv6_ratio,"networks":networks,"prepare_seconds":prepare_time,
+                                           "reload_seconds":reload_time,"snapshot_save_seconds":snapshot_save_time,"snapshot_open_seconds":snapshot_open_time,"rss_mib":rss})
+                print(f"  {size:>10,} networks, ipv6_ratio={ipv6_ratio}: prepare {prepare_time:.3f} seconds - reload {reload_time:.3f} seconds - "
+                      f"snapshot save {snapshot_save_time:.3f} / open {snapshot_open_time:.3f} seconds - RSS {'n/a' if rss is None else f'{rss:.1f} MiB'}")
+                for hit_ratio in hit_ratios:
+                    ip_list = lookup_list(network_list,lookups,hit_ratio,max(int(lookups*unique_ratio),1),ipv6_ratio)
+                    for cache_size in cache_sizes:
+                        for with_stats in with_stats_list:
+                            # each combination opens the snapshot of the list, that takes milliseconds even for millions of networks
+                            accessLimiter = FastAccessLimiter(with_stats=with_stats,cache_size=cache_size)
+                            accessLimiter.open_ip_network_list(snapshot_filename)
+                            elapsed_time = time_calls(accessLimiter,ip_list,repeat)
+                            measured_hit_ratio = sum(1 for ipaddr in ip_list if accessLimiter(ipaddr))/len(ip_list)
+                            cache_hit_ratio = accessLimiter.cache_info().hit_ratio
+                            results["results"].append({"benchmark":"check","size":size,"ipv6_ratio":ipv6_ratio,"hit_ratio":hit_ratio,"cache_size":cache_size,
+                                                       "with_stats":with_stats,"ns_per_call":elapsed_time/lookups*1e9,"calls_per_second":lookups/elapsed_time,
+                                                       "measured_hit_ratio":measured_hit_ratio,"cache_hit_ratio":cache_hit_ratio})
+                            print(f"    hit_ratio={hit_ratio:<4} cache_size={cache_size:<6} with_stats={str(with_stats):<5} {elapsed_time/lookups*1e9:>9.1f} ns per call - "
+                                  f"{lookups/elapsed_time:>12,.0f} calls/s - hits {measured_hit_ratio:.1%} - cache hits {cache_hit_ratio:.1%}")
+                            del accessLimiter
+            del network_list
+    results["peak_rss_mib"] = peak_rss_mib()
+    if json_filename:
+        with open(json_filename,"w") as f:
+            json.dump(results,f,indent=1)
+        print(f"- Results saved in {json_filename}")
+    return results
+
+# the metrics compared by `compare` and if a lower value is better
+SUITE_METRICS = {"prepare":[("prepare_seconds",True),("reload_seconds",True),("snapshot_save_seconds",True),("snapshot_open_seconds",True),("rss_mib",True)],
+                 "check":[("ns_per_call",True),("cache_hit_ratio",False)]}
+
+def benchmark_compare(old_filename:str,new_filename:str,threshold:float)->int:
+    """Compare the results of 2 runs of the suite (ex: 2 versions) with the same parameters. Prints each metric with the 
+    change from the old to the new result and marks the regressions above threshold (0.1 = 10%). Returns the number of regressions."""
+    with open(old_filename) as f:
+        old_results = json.load(f)
+    with open(new_filename) as f:
+        new_results = json.load(f)
+    def result_key(result:dict)->tuple:
+        return tuple((name,value) for name, value in result.items() if name in ("benchmark","size","ipv6_ratio","hit_ratio","cache_size","with_stats"))
+    old_dict = {result_key(result):result for result in old_results["results"]}
+    print(f"- Compare {old_filename} (version {old_results.get('version')}) with {new_filename} (version {new_results.get('version')}), threshold {threshold:.0%}:")
+    regressions = 0
+    for result in new_results["results"]:
+        old_result = old_dict.get(result_key(result))
+        if old_result is None:
+            continue
+        for metric, lower_is_better in SUITE_METRICS[result["benchmark"]]:
+            old_value, new_value = old_result[metric], result[metric]
+            # a metric that is missing in one of the results (ex: the RSS on Windows) is not compared
+            if not old_value or new_value is None:
+                continue
+            change = (new_value-old_value)/old_value
+            regression = (change > threshold) if lower_is_better else (change < -threshold)
+            regressions += regression
+            print(f"  {' '.join(f'{name}={value}' for name, value in result_key(result)):<88} {metric:<22} {old_value:>12.4f} -> {new_value:>12.4f} "
+                  f"{change:>+8.1%}{'  REGRESSION' if regression else ''}")
+    print(f"- {regressions} regressions")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FastAccessLimiter benchmarks")
+    parser.add_argument("benchmark",choices=["prepare","check","threads","compact","jump","ipv6","suite","compare"],help="the benchmark to run")
+    parser.add_argument("--sizes",type=int,nargs="+",default=None,help="the sizes of the network lists (default 10000 1000000 5000000, or 1000 10000 100000 1000000 5000000 for the suite)")
+    parser.add_argument("--workers",type=int,default=0,help="the number of processes used to parse the network lists")
+    parser.add_argument("--ipv6-ratio",type=float,default=0.0,help="the ratio of IPv6 networks in the network lists (0.0 to 1.0)")
+    parser.add_argument("--lookups",type=int,default=100000,help="the number of lookups of the check benchmark")
+    parser.add_argument("--cache-size",type=int,default=0,help="the cache size of the check benchmark (0 = no cache)")
+    parser.add_argument("--threads",type=int,nargs="+",default=[1,2,4,8],help="the number of threads of the threads benchmark")
+    parser.add_argument("--long-ratios",type=float,nargs="+",default=[0.0,0.05,0.5],help="the ratios of IPv6 networks longer than /64 of the ipv6 benchmark")
+    parser.add_argument("--seed",type=int,default=None,help="the seed of the random generator (the suite saves a random seed in the results if it's not given)")
+    parser.add_argument("--ipv6-ratios",type=float,nargs="+",default=[0.0,0.5],help="the ratios of IPv6 networks of the suite")
+    parser.add_argument("--hit-ratios",type=float,nargs="+",default=[0.0,0.5,0.95],help="the ratios of lookups inside the list of the suite")
+    parser.add_argument("--cache-sizes",type=int,nargs="+",default=[0,1024,65536],help="the cache sizes of the suite")
+    parser.add_argument("--with-stats",type=lambda value: value.lower() in ("1","true","yes"),nargs="+",default=[False,True],help="with_stats of the suite (true/false)")
+    parser.add_argument("--unique-ratio",type=float,default=0.1,help="the ratio of unique IPs in the lookups of the suite, the others are repeated")
+    parser.add_argument("--repeat",type=int,default=3,help="the suite and the ipv6 benchmark keep the best time of this number of loops")
+    parser.add_argument("--json",default=None,help="save the results of the suite in this JSON file")
+    parser.add_argument("--files",nargs=2,default=None,help="the old and the new JSON results of `compare`")
+    parser.add_argument("--threshold",type=float,default=0.1,help="the change of `compare` that is a regression (0.1 = 10%%)")
+    args = parser.parse_args()
+    if args.sizes is None:
+        args.sizes = [1000,10000,100000,1000000,5000000] if args.benchmark == "suite" else [10000,1000000,5000000]
+    if args.benchmark == "suite" and args.seed is None:
+        args.seed = random.randrange(2**32)
+    random.seed(args.seed)
+    if args.benchmark == "prepare":
+        benchmark_prepare(args.sizes,args.workers,args.ipv6_ratio)
+    elif args.benchmark == "check":
+        benchmark_check(args.sizes,args.lookups,args.ipv6_ratio,args.cache_size)
+    elif args.benchmark == "threads":
+        benchmark_threads(args.sizes,args.lookups,args.ipv6_ratio,args.cache_size,args.threads)
+    elif args.benchmark == "compact":
+        benchmark_compact(args.sizes,args.lookups)
+    elif args.benchmark == "jump":
+        benchmark_jump(args.sizes,args.lookups,args.cache_size)
+    elif args.benchmark == "ipv6":
+        benchmark_ipv6(args.sizes,args.lookups,args.cache_size,args.long_ratios,args.repeat)
+    elif args.benchmark == "suite":
+        benchmark_suite(args.sizes,args.ipv6_ratios,args.hit_ratios,args.cache_sizes,args.with_stats,args.lookups,args.unique_ratio,args.repeat,args.seed,args.json)
+    elif args.benchmark == "compare":
+        if args.files is None:
+            parser.error("compare needs --files old.json new.json")
+        sys.exit(1 if benchmark_compare(*args.files,args.threshold) > 0 else 0)
+    sys.exit(0)
@@ -20,13 +20,910 @@ __appname__ = 'FastAccessLimiter'
 __version__ = '1.0.0'
 __release__ = '10/August/2024'
 
-import os, json, socket, struct, binascii, itertools, time, gzip, threading, functools, bisect, ipaddress
+import os, json, socket, struct, binascii, itertools, time, gzip, bz2, lzma, csv, threading, bisect, ipaddress, mmap, heapq, operator, asyncio, weakref, functools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory, resource_tracker
 from typing import List, Union
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from array import array
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # import etimedecorator
 
-__all__ = ['FastAccessLimiter']
+__all__ = ['FastAccessLimiter','RateLimited','Rule']
+
+# IPv4 networks are kept in 32-bit unsigned arrays. IPv6 networks are split in 2 arrays of 64-bit
+# unsigned integers (the high and the low half of the address) because there is no 128-bit array type.
+# The arrays hold non-overlapping intervals, and each interval points (rule) to the most specific CIDR that covers it.
+# The CIDRs are kept in a table of slots (cidr, prefixlen and parent). The parent of a CIDR is the slot of the most specific 
+# CIDR that contains it, or -1. Each slot also has the payload of its rule: an action code (0-255), a limit (0-4294967295) 
+# and a label, that are all 0 or empty by default, the bitset of the named lists of the CIDR (lists) and the time.time() 
+# when the CIDR expires (expires, 0 = never, see add_ip()). The lists of an interval are the lists of its rule and of all 
+# the parents of its rule. The slots of a published index are never changed: add_ip and remove_ip build new interval 
+# arrays and copy the arrays of the slots they change (copy on write), a new CIDR is appended to the slot table and the 
+# slots of the removed CIDRs (free) are not reused until the next full rebuild, so a lookup that still holds an older 
+# index always resolves its slots to the right CIDRs.
+# An IPv4 index can also have a first-level table (jump) indexed by the upper 16 bits of the address, see _ipv4_jump_table().
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+# flag added to the IPv6 keys of the statistics dictionary to keep them apart from the IPv4 keys (ex: ::a00:1 and 10.0.0.1)
+_IPV6_KEY_FLAG = 1 << 128
+
+class _IPv4Index(namedtuple("_IPv4Index", ["first","last","rule","cidr","prefixlen","parent","action","limit","lists","expires","label","free","jump"],defaults=(None,))):
+    __slots__ = ()
+    def search(self,iplong:int)->int:
+        """Returns the position of the last interval that starts at or before iplong, or -1."""
+        # an integer out of the IPv4 range has no item in the first-level table
+        if self.jump is None or not 0 <= iplong <= 0xFFFFFFFF:
+            return bisect.bisect_right(self.first, iplong)-1
+        low, high = self.jump[iplong >> 16], self.jump[(iplong >> 16)+1]
+        return (bisect.bisect_right(self.first, iplong, low, high) if low < high else low)-1
+    def interval(self,position:int)->tuple:
+        return self.first[position], self.last[position]
+    def splice(self,start:int,stop:int,first:list,last:list,rule:list):
+        """Returns a new index with the intervals from start to stop (exclusive) replaced by the given intervals."""
+        return self._replace(first=_splice_array(self.first,start,stop,array('I',first)),last=_splice_array(self.last,start,stop,array('I',last)),
+                             rule=_splice_array(self.rule,start,stop,array('I',rule)),jump=None)
+    def splice_in_place(self,start:int,stop:int,first:list,last:list,rule:list):
+        """Replace the intervals from start to stop (exclusive) by the given intervals in the arrays of this index. Only 
+        for a private copy of the index that is not published yet (see _copy_index)."""
+        self.first[start:stop], self.last[start:stop], self.rule[start:stop] = array('I',first), array('I',last), array('I',rule)
+        return self
+
+class _IPv6Index(namedtuple("_IPv6Index", ["first_hi","first_lo","last_hi","last_lo","rule","cidr","prefixlen","parent","action","limit","lists","expires","label","free"])):
+    """The intervals of a network of /64 or shorter start and end on /64 boundaries (the low halves are 0 and 2**64-1), so 
+    the high halves are enough to find them. The low halves are the secondary key, compared only inside the /64s that hold 
+    the first or the last IP of an interval of a network longer than /64."""
+    __slots__ = ()
+    def search(self,iplong:int)->int:
+        """Returns the position of the last interval that starts at or before iplong, or -1. The high halves are searched 
+        first, and the low halves only if the /64 of iplong has an interval that starts after iplong (see _IPv6Index)."""
+        iplong_hi = iplong >> 64
+        position = bisect.bisect_right(self.first_hi, iplong_hi)-1
+        if position >= 0 and self.first_hi[position] == iplong_hi:
+            iplong_lo = iplong & _MASK64
+            if iplong_lo < self.first_lo[position]:
+                position = bisect.bisect_right(self.first_lo, iplong_lo, bisect.bisect_left(self.first_hi, iplong_hi, 0, position), position)-1
+        return position
+    def interval(self,position:int)->tuple:
+        return (self.first_hi[position] << 64) | self.first_lo[position], (self.last_hi[position] << 64) | self.last_lo[position]
+    def splice(self,start:int,stop:int,first:list,last:list,rule:list):
+        """Returns a new index with the intervals from start to stop (exclusive) replaced by the given intervals."""
+        return self._replace(first_hi=_splice_array(self.first_hi,start,stop,array('Q',[iplong >> 64 for iplong in first])),
+                             first_lo=_splice_array(self.first_lo,start,stop,array('Q',[iplong & _MASK64 for iplong in first])),
+                             last_hi=_splice_array(self.last_hi,start,stop,array('Q',[iplong >> 64 for iplong in last])),
+                             last_lo=_splice_array(self.last_lo,start,stop,array('Q',[iplong & _MASK64 for iplong in last])),
+                             rule=_splice_array(self.rule,start,stop,array('I',rule)))
+    def splice_in_place(self,start:int,stop:int,first:list,last:list,rule:list):
+        """Replace the intervals from start to stop (exclusive) by the given intervals in the arrays of this index. Only 
+        for a private copy of the index that is not published yet (see _copy_index)."""
+        self.first_hi[start:stop], self.first_lo[start:stop] = array('Q',[iplong >> 64 for iplong in first]), array('Q',[iplong & _MASK64 for iplong in first])
+        self.last_hi[start:stop], self.last_lo[start:stop] = array('Q',[iplong >> 64 for iplong in last]), array('Q',[iplong & _MASK64 for iplong in last])
+        self.rule[start:stop] = array('I',rule)
+        return self
+
+class _Index(namedtuple("_Index", ["ipv4","ipv6","generation","ip_network_list"])):
+    """All the lookup state of a FastAccessLimiter: the IPv4 index, the IPv6 index, the generation and the sorted 
+    ip_network_list (the positions returned by check_many()). A new _Index is built aside on every change and published 
+    with one reference assignment, so a lookup that reads it once sees one consistent generation without taking a lock. 
+    Only the ip_network_list is changed in place by a change of a few CIDRs (see check_many())."""
+    __slots__ = ()
+
+def _splice_array(source,start:int,stop:int,items:array)->array:
+    """Returns a new array with the items from start to stop (exclusive) of source replaced by items. The source is not 
+    changed, it can be an array in use by the lookups or a memoryview of a snapshot."""
+    result = array(items.typecode)
+    result.frombytes(memoryview(source)[:start].cast('B'))
+    result.extend(items)
+    result.frombytes(memoryview(source)[stop:].cast('B'))
+    return result
+
+def _copy_index(index):
+    """Returns a private copy of an IPv4 or IPv6 index, that can be changed in place by a batch of changes before it is 
+    published. The arrays and the label table are copied once, the CIDR table is shared because it is append-only. The 
+    first-level table of an IPv4 index is dropped, it's built again when the index is published."""
+    index = index._replace(**{name:value[:] for name, value in zip(index._fields,index) if isinstance(value,array) and name != "jump"},label=list(index.label),free=list(index.free))
+    return index._replace(jump=None) if isinstance(index,_IPv4Index) else index
+
+def _ipv4_jump_table(first)->array:
+    """Returns the first-level table of the IPv4 intervals (DIR-16): the item h is the number of intervals that start at or 
+    before the address h << 16, so an address of the /16 h is searched only among the intervals jump[h] to jump[h+1]. If no 
+    interval starts inside a /16 (ex: it's covered by a /16 or shorter network, or by no network at all), the interval 
+    jump[h]-1 is the answer without any search. The table has 65537 items (256 KiB). With numpy, the 65537 binary searches 
+    are done by searchsorted."""
+    if np is not None:
+        return array('I',np.searchsorted(np.frombuffer(first,dtype=np.uint32),np.arange(65537,dtype=np.uint64) << 16,side='right').astype(np.uint32).tobytes())
+    return array('I',[bisect.bisect_right(first,bucket << 16) for bucket in range(65537)])
+
+def _ipv4_jump_table_update(jump:array,first,ranges:list)->array:
+    """Returns the first-level table of the IPv4 intervals first from the table jump of the previous intervals, when they 
+    changed only inside the ranges [(first,last),...] (the intervals of a CIDR that was added or removed start between its 
+    first IP and its last IP+1). Only the /16 boundaries inside the ranges are searched again, the others are moved by the 
+    number of intervals added or removed before them."""
+    if not ranges:
+        return jump
+    merged_ranges = []
+    for range_first, range_last in sorted(ranges):
+        if merged_ranges and range_first <= merged_ranges[-1][1]+1:
+            merged_ranges[-1][1] = max(merged_ranges[-1][1],range_last)
+        else:
+            merged_ranges.append([range_first,range_last])
+    new_jump, moved, delta = array('I',jump), 0, 0
+    for range_first, range_last in merged_ranges:
+        # the boundaries from the first one at or after the first IP to the first one at or after the last IP+1 are searched again
+        start, stop = (range_first+0xFFFF) >> 16, min((range_last+0x10000) >> 16,65536)+1
+        if delta != 0 and moved < start:
+            new_jump[moved:start] = array('I',[count+delta for count in jump[moved:start]])
+        new_jump[start:stop] = array('I',[bisect.bisect_right(first,bucket << 16) for bucket in range(start,stop)])
+        moved, delta = stop, new_jump[stop-1]-jump[stop-1]
+    if delta != 0 and moved < len(jump):
+        new_jump[moved:] = array('I',[count+delta for count in jump[moved:]])
+    return new_jump
+
+class _SpaceSaving:
+    """Space-Saving sketch of the most hit IPs with a fixed number of counters (capacity). When a new IP arrives and the 
+    sketch is full, the IP with the smallest count is evicted and the new IP takes over its counter. A count is 
+    overestimated by at most hits/capacity, and an IP with more than hits/capacity hits is never evicted. The smallest 
+    counter is found with a min-heap of (count,iplong) whose entries are refreshed only when they reach the top."""
+    __slots__ = ("capacity","counts","heap")
+    def __init__(self,capacity:int):
+        self.capacity, self.counts, self.heap = capacity, {}, []
+    def add(self,iplong:int,count:int=1):
+        counts = self.counts
+        if iplong in counts:
+            counts[iplong] += count
+        elif len(counts) < self.capacity:
+            counts[iplong] = count
+            heapq.heappush(self.heap,(count,iplong))
+        else:
+            heap = self.heap
+            while heap[0][0] != counts[heap[0][1]]:
+                heapq.heapreplace(heap,(counts[heap[0][1]],heap[0][1]))
+            min_count, min_iplong = heap[0]
+            del counts[min_iplong]
+            counts[iplong] = min_count+count
+            heapq.heapreplace(heap,(min_count+count,iplong))
+    def copy(self)->dict:
+        return self.counts.copy()
+
+class _StatsShard:
+    """The hit counters of one thread: the number of hits and the hits per IP (a dict or a _SpaceSaving sketch). 
+    Only the owner thread writes them, so they don't need a lock and no hit is lost."""
+    __slots__ = ("hits","ips")
+    def __init__(self,ips):
+        self.hits, self.ips = 0, ips
+    def merge(self,shard:'_StatsShard'):
+        self.hits += shard.hits
+        if isinstance(self.ips,_SpaceSaving):
+            for iplong, count in shard.ips.copy().items():
+                self.ips.add(iplong,count)
+        else:
+            for iplong, count in shard.ips.copy().items():
+                self.ips[iplong] = self.ips.get(iplong,0)+count
+
+class _Stats:
+    """The counters of all the threads (the hits, or the latencies of the metrics): a thread-local shard for each thread 
+    and the set of all the shards. When a thread finishes, its shard is merged into the shard of the finished threads 
+    (retired) and dropped, so a thread per request doesn't leave a shard behind. The lock keeps the readers from 
+    counting a shard twice while it is merged. The counters are reset by replacing the whole object."""
+    __slots__ = ("local","shards","new_shard","retired","lock","__weakref__")
+    def __init__(self,new_shard):
+        self.local, self.shards, self.new_shard, self.retired, self.lock = threading.local(), set(), new_shard, None, threading.RLock()
+    def thread_shard(self):
+        """Create the shard of the current thread on its first count."""
+        shard = self.local.shard = self.new_shard()
+        self.local.owner = _ShardOwner(self,shard)
+        with self.lock:
+            self.shards.add(shard)
+        return shard
+    def retire(self,shard):
+        """Merge the shard of a finished thread into the shard of the finished threads and drop it."""
+        with self.lock:
+            if shard not in self.shards:
+                return
+            if self.retired is None:
+                self.retired = self.new_shard()
+                self.shards.add(self.retired)
+            self.retired.merge(shard)
+            self.shards.discard(shard)
+
+class _ShardOwner:
+    """Kept in the thread-local storage next to the shard of a thread: it is released when the thread finishes, and 
+    then it retires the shard. It doesn't keep the _Stats alive, so a reset doesn't wait for the threads to finish."""
+    __slots__ = ("stats","shard")
+    def __init__(self,stats:_Stats,shard):
+        self.stats, self.shard = weakref.ref(stats), shard
+    def __del__(self):
+        stats = self.stats()
+        if stats is not None:
+            stats.retire(self.shard)
+
+class _LatencyShard:
+    """The latency histogram of the lookups of one thread. The bucket n counts the lookups that took from 2**(n-1) to 
+    2**n-1 nanoseconds (the bit length of the duration), so 65 buckets cover any duration with 1 addition per lookup."""
+    __slots__ = ("buckets","sum_ns")
+    def __init__(self):
+        self.buckets, self.sum_ns = [0]*65, 0
+    def merge(self,shard:'_LatencyShard'):
+        self.buckets = [count+shard_count for count, shard_count in zip(self.buckets,shard.buckets)]
+        self.sum_ns += shard.sum_ns
+
+class _BuildInfo:
+    """The number and the duration in seconds of the last full builds of the index (the lists prepared by the constructor, 
+    load_ip_network_list(), open_ip_network_list(), ...) and of the last incremental updates (add_ip(), remove_ip() and 
+    apply_changes())."""
+    __slots__ = ("rebuilds","rebuild_duration","updates","update_duration")
+    def __init__(self):
+        self.rebuilds, self.rebuild_duration, self.updates, self.update_duration = 0, 0.0, 0, 0.0
+
+# the upper bounds in nanoseconds of the buckets of the latency histogram exported to Prometheus (128ns to 134ms). The 
+# buckets of the histogram are merged into these, and the longer lookups are only counted by the +Inf bucket
+_METRICS_BUCKETS = range(7,28)
+
+# the result of a lookup of an IP that is not in a segment of _LookupCache (a cached result can be False)
+_NOT_CACHED = object()
+
+class _LRUCache:
+    """The cache of the results of the checks of one address family with cache_policy="lru": a functools.lru_cache of the 
+    check, whose hits don't run any Python code. An lru_cache can't forget a single IP, so it's replaced by a new one (see wrap()) after 
+    each change of the index, and a check that was running during the change saves its result in the replaced cache. 
+    The hits and the misses of the replaced caches are kept."""
+    __slots__ = ("size","lookup","generation","base_hits","base_misses")
+    def __init__(self,size:int,generation:int):
+        self.size, self.lookup, self.generation, self.base_hits, self.base_misses = size, None, generation, 0, 0
+    def wrap(self,check):
+        """Returns a new lru_cache of the check, that replaces the previous one."""
+        if self.lookup is not None:
+            info = self.lookup.cache_info()
+            self.base_hits, self.base_misses = self.base_hits+info.hits, self.base_misses+info.misses
+        self.lookup = functools.lru_cache(maxsize=self.size)(check)
+        return self.lookup
+    @property
+    def hits(self)->int:
+        return self.base_hits+(self.lookup.cache_info().hits if self.lookup is not None else 0)
+    @property
+    def misses(self)->int:
+        return self.base_misses+(self.lookup.cache_info().misses if self.lookup is not None else 0)
+    def __len__(self)->int:
+        return self.lookup.cache_info().currsize if self.lookup is not None else 0
+
+class _LookupCache:
+    """The default cache of the results of the checks of one address family, a segmented LRU with a bounded size. A new 
+    IP enters the probation segment, and only an IP that is found again is moved to the protected segment (80% of the size), so a 
+    scan of random IPs only replaces the probation segment and never evicts the hot clients. The LRU of the protected 
+    segment goes back to the probation segment. The IPs evicted from the probation segment are remembered without their 
+    results (history, twice as many IPs as the size of the cache), and an IP that is checked again while it's remembered goes 
+    straight to the protected segment, so more hot clients than the probation segment also get there. The cache belongs 
+    to one generation of the index: a new list replaces the segments and a result checked with another generation is not saved."""
+    __slots__ = ("probation","protected","history","probation_size","protected_size","history_size","generation","hits","misses")
+    def __init__(self,size:int,generation:int):
+        self.protected_size = size*4 // 5
+        self.probation_size = max(size-self.protected_size,1)
+        self.history_size = max(size*2,1)
+        self.hits = self.misses = 0
+        self.reset(generation)
+    def reset(self,generation:int):
+        """Discard all the results, replacing the segments, and move the cache to the given generation."""
+        self.probation, self.protected, self.history, self.generation = OrderedDict(), OrderedDict(), OrderedDict(), generation
+    def __len__(self)->int:
+        return len(self.probation)+len(self.protected)
+    def __iter__(self):
+        return itertools.chain(list(self.probation),list(self.protected))
+    def pop(self,iplong:int):
+        self.probation.pop(iplong,None)
+        self.protected.pop(iplong,None)
+        self.history.pop(iplong,None)
+    def promote(self,iplong:int):
+        """Returns the result of an IP of the probation segment and moves it to the protected segment, or _NOT_CACHED if the 
+        IP is not in the probation segment (without raising KeyError, that costs more than the rest of a miss)."""
+        result = self.probation.pop(iplong,_NOT_CACHED)
+        if result is not _NOT_CACHED:
+            self.protect(iplong,result)
+        return result
+    def protect(self,iplong:int,result):
+        """Save the result of an IP in the protected segment, moving its LRU to the probation segment if it's full."""
+        self.protected[iplong] = result
+        if len(self.protected) > self.protected_size:
+            try:
+                demoted_iplong, demoted_result = self.protected.popitem(last=False)
+                self.admit(demoted_iplong,demoted_result)
+            except KeyError:
+                pass
+    def admit(self,iplong:int,result):
+        """Save the result of an IP in the probation segment, or in the protected segment if the IP is remembered by the 
+        history. The LRU of a full probation segment is evicted to the history."""
+        if self.history.pop(iplong,None) is not None:
+            return self.protect(iplong,result)
+        self.probation[iplong] = result
+        if len(self.probation) > self.probation_size:
+            try:
+                self.history[self.probation.popitem(last=False)[0]] = True
+                if len(self.history) > self.history_size:
+                    self.history.popitem(last=False)
+            except KeyError:
+                pass
+
+# the result of check_rule(): the matched CIDR and the payload of its rule
+Rule = namedtuple("Rule", ["cidr","action","limit","label"])
+
+class _Compaction(namedtuple("_Compaction", ["networks","compacted_networks","contained","merged","origins"])):
+    """The result of the compaction of a list (see the parameter compact): the number of networks before and after the 
+    compaction, the number of contained and merged networks, and a dictionary {cidr:[original cidrs]} with the original 
+    CIDRs of the networks that replaced other networks."""
+    __slots__ = ()
+
+class RateLimited(str):
+    """Result of a check of an IP address that is not in the IP list but exceeded the rate limit. It's the client network 
+    (ex: 10.1.2.0/24 with rate_limit_prefixlen=(24,64)), so it's a True value like the CIDR returned for the IPs in the list."""
+    __slots__ = ()
+
+class _RateLimiter:
+    """Rate limiter with the Generic Cell Rate Algorithm, the token bucket with a single number per client: the theoretical 
+    arrival time (tat) of the next request. A client can make `requests` requests at once (the burst) and then one request 
+    every seconds/requests seconds. A client whose tat is in the past has a full bucket, so it's the same as a new client 
+    and its slot can be reused. The tats are kept in an array of slots, and the client keys in a dict {key:slot}. When 
+    all the slots are in use, the slots are swept like a clock (limited to _RATE_LIMIT_SWEEP slots per new client): the 
+    slots of the idle clients are released, or, if none is idle, the slot closest to a full bucket is reused."""
+    __slots__ = ("interval","tolerance","max_clients","prefixlen","netmask","clients","slot_key","tat","free","hand","lock")
+    def __init__(self,requests:int,seconds:float,max_clients:int,prefixlen:tuple):
+        if not requests > 0 or not seconds > 0:
+            raise ValueError(f"Invalid rate_limit ({requests},{seconds}), the requests and the seconds must be greater than 0.")
+        if len(prefixlen) != 2 or any(not isinstance(value,int) for value in prefixlen) or not 0 <= prefixlen[0] <= 32 or not 0 <= prefixlen[1] <= 128:
+            raise ValueError(f"Invalid rate_limit_prefixlen {prefixlen}, it must be (IPv4 prefix length from 0 to 32,IPv6 prefix length from 0 to 128).")
+        self.interval = seconds/requests
+        self.tolerance = seconds-self.interval
+        self.max_clients, self.prefixlen = max(max_clients,1), prefixlen
+        # the IPv6 keys have the _IPV6_KEY_FLAG, that is kept by the netmask
+        self.netmask = (0xFFFFFFFF ^ _HOSTMASK[4][prefixlen[0]], _IPV6_KEY_FLAG | (((1 << 128)-1) ^ _HOSTMASK[6][prefixlen[1]]))
+        self.clients, self.slot_key, self.tat, self.free, self.hand = {}, [], array('d'), [], 0
+        self.lock = threading.Lock()
+    def __call__(self,iplong:int,now:float)->bool:
+        """Count a request of the IP (a statistics key). Returns True if the client exceeded the rate limit."""
+        key = iplong & self.netmask[iplong >= _IPV6_KEY_FLAG]
+        with self.lock:
+            slot = self.clients.get(key)
+            if slot is None:
+                slot = self.__new_slot(key,now)
+                tat = now
+            else:
+                tat = max(self.tat[slot],now)
+                if tat-now > self.tolerance:
+                    return True
+            self.tat[slot] = tat+self.interval
+        return False
+    def network(self,iplong:int)->str:
+        """Returns the client network of the IP (a statistics key) in CIDR format."""
+        if iplong >= _IPV6_KEY_FLAG:
+            return socket.inet_ntop(socket.AF_INET6,((iplong & self.netmask[1]) ^ _IPV6_KEY_FLAG).to_bytes(16,byteorder='big'))+f"/{self.prefixlen[1]}"
+        return socket.inet_ntoa(struct.pack('>L',iplong & self.netmask[0]))+f"/{self.prefixlen[0]}"
+    def __new_slot(self,key:int,now:float)->int:
+        if not self.free:
+            if len(self.tat) < self.max_clients:
+                self.slot_key.append(None), self.tat.append(0.0)
+                self.free.append(len(self.tat)-1)
+            else:
+                self.__sweep(now)
+        slot = self.free.pop()
+        self.clients[key], self.slot_key[slot] = slot, key
+        return slot
+    def __sweep(self,now:float):
+        """Release the slots of the idle clients, starting from the clock hand. If no client is idle, release the 
+        slot with the smallest tat among the swept slots."""
+        tat, slot_key, size, oldest = self.tat, self.slot_key, len(self.tat), None
+        for _ in range(min(_RATE_LIMIT_SWEEP,size)):
+            slot, self.hand = self.hand, (self.hand+1) % size
+            if slot_key[slot] is None:
+                continue
+            if tat[slot] <= now:
+                del self.clients[slot_key[slot]]
+                slot_key[slot] = None
+                self.free.append(slot)
+            elif oldest is None or tat[slot] < tat[oldest]:
+                oldest = slot
+        if not self.free:
+            del self.clients[slot_key[oldest]]
+            slot_key[oldest] = None
+            self.free.append(oldest)
+
+class _SharedMemory:
+    """The shared memory segments of an index shared by share_ip_network_list() (owner) or attached by attach_ip_network_list(). 
+    The segments of the previous generations that are still in use by a lookup are kept in retired until they can be closed."""
+    __slots__ = ("name","control","owner","generation","segment","retired","stop")
+    def __init__(self,name:str,control:shared_memory.SharedMemory,owner:bool):
+        self.name, self.control, self.owner = name, control, owner
+        self.generation, self.segment, self.retired = 0, None, []
+        self.stop = threading.Event()
+    def control_generation(self)->int:
+        return _SHARED_CONTROL.unpack_from(self.control.buf,0)[1]
+    def release(self):
+        """Close the retired segments that are not used anymore."""
+        for segment in list(self.retired):
+            try:
+                segment.close()
+                self.retired.remove(segment)
+            except BufferError:
+                pass
+
+_shared_memory_inherited_tracker = {}
+def _shared_memory_attach(name:str,size:int=0)->shared_memory.SharedMemory:
+    """Attach an existing shared memory segment, or create a new one if size > 0, without tracking it. Before Python 3.13, a resource tracker started by 
+    this process would remove the segment when this process exits, while the other processes are still using it. A 
+    tracker inherited from the owner (ex: forked workers) only removes the segments that are left when all the processes exit."""
+    try:
+        return shared_memory.SharedMemory(name,create=size > 0,size=size,track=False)
+    except TypeError:
+        # the tracker is checked once per process, before the first attach starts a tracker of its own
+        inherited_tracker = _shared_memory_inherited_tracker.setdefault(os.getpid(),getattr(resource_tracker._resource_tracker,"_fd",None) is not None)
+        segment = shared_memory.SharedMemory(name,create=size > 0,size=size)
+        if os.name == "posix" and not inherited_tracker:
+            resource_tracker.unregister(segment._name,"shared_memory")
+        return segment
+
+class _SharedStats:
+    """The statistics of all the processes in a shared memory segment, see share_stats(). Each process writes only its 
+    own slot, and the hits and top hits of an exited process are carried over by the process that takes its slot."""
+    __slots__ = ("segment","values","slots","top_hits","slot_size","slot","pid","epoch","base_hits","base_counts","stop","thread")
+    def __init__(self,segment:shared_memory.SharedMemory):
+        self.segment = segment
+        _, self.slots, self.top_hits, _ = _SHARED_STATS_HEADER.unpack_from(segment.buf,0)
+        self.values = segment.buf[_SHARED_STATS_HEADER.size:].cast("Q")
+        self.slot_size = _SHARED_STATS_SLOT_FIELDS+4*self.top_hits
+        self.slot, self.pid, self.epoch, self.base_hits, self.base_counts = -1, os.getpid(), 0, 0, {}
+        self.stop, self.thread = threading.Event(), None
+    def current_epoch(self)->int:
+        return _SHARED_STATS_EPOCH.unpack_from(self.segment.buf,_SHARED_STATS_EPOCH_OFFSET)[0]
+    def reset(self)->int:
+        epoch = self.current_epoch()+1
+        _SHARED_STATS_EPOCH.pack_into(self.segment.buf,_SHARED_STATS_EPOCH_OFFSET,epoch)
+        return epoch
+    def claim(self,name:str):
+        """Take a never used slot, or the slot of an exited process. The slots are claimed under a lock, that is a 
+        shared memory segment created exclusively."""
+        deadline = time.monotonic()+1.0
+        while True:
+            try:
+                lock = shared_memory.SharedMemory(f"{name}_lock",create=True,size=1)
+                break
+            except FileExistsError:
+                # a process that died while holding the lock left it behind
+                if time.monotonic() > deadline:
+                    try:
+                        _shared_memory_attach(f"{name}_lock").unlink()
+                    except FileNotFoundError:
+                        pass
+                    deadline = time.monotonic()+1.0
+                time.sleep(0.001)
+        try:
+            slot_list = [self.read(slot) for slot in range(self.slots)]
+            free_slots = [slot for slot, data in enumerate(slot_list) if data is not None and data[0] == 0]
+            free_slots += [slot for slot, data in enumerate(slot_list) if data is not None and data[0] != 0 and not _process_alive(data[0])]
+            if not free_slots:
+                raise RuntimeError(f"All the {self.slots} slots of the shared statistics {name} are in use.")
+            self.slot, self.epoch = free_slots[0], self.current_epoch()
+            pid, epoch, hits, counts = slot_list[self.slot]
+            if pid != 0 and epoch == self.epoch:
+                self.base_hits, self.base_counts = hits, dict(counts)
+            self.write(self.base_hits,list(self.base_counts.items()))
+        finally:
+            lock.close()
+            lock.unlink()
+    def write(self,hits:int,top_list:list):
+        values, start = self.values, self.slot*self.slot_size
+        data = array("Q",[self.pid,self.epoch,hits,len(top_list)])
+        for key, count in top_list:
+            data.extend((key >> 128,(key >> 64) & _MASK64,key & _MASK64,count))
+        # the sequence is odd while the slot is being written
+        values[start] += 1
+        values[start+1:start+1+len(data)] = data
+        values[start] += 1
+    def read(self,slot:int)->Union[tuple,None]:
+        """Returns (pid,epoch,hits,top_list) of a slot, or None if the slot is being written all the time."""
+        values, start = self.values, slot*self.slot_size
+        for _ in range(1000):
+            sequence = values[start]
+            if sequence & 1 == 0:
+                pid, epoch, hits, count = values[start+1:start+_SHARED_STATS_SLOT_FIELDS].tolist()
+                entries = values[start+_SHARED_STATS_SLOT_FIELDS:start+_SHARED_STATS_SLOT_FIELDS+4*min(count,self.top_hits)].tolist()
+                if values[start] == sequence:
+                    return pid, epoch, hits, [((entries[item] << 128) | (entries[item+1] << 64) | entries[item+2],entries[item+3]) for item in range(0,len(entries),4)]
+            time.sleep(0)
+        return None
+
+class _Reloader:
+    """The state of the reloads of the IP list: the file watched by watch_ip_network_list() and the results of the 
+    reloads done by the watcher or by open_ip_network_list_async()."""
+    __slots__ = ("filename","stop","reloads","errors","last_reload","duration","last_error")
+    def __init__(self):
+        self.filename, self.stop = None, threading.Event()
+        self.reloads, self.errors, self.last_reload, self.duration, self.last_error = 0, 0, None, 0.0, None
+
+class _Journal:
+    """The append-only journal of the changes of the IP list opened by open_journal(), and the snapshot it is compacted into."""
+    __slots__ = ("lock","filename","file","snapshot_filename","max_records","fsync","records","compactions","last_compaction")
+    def __init__(self):
+        self.lock, self.filename, self.file, self.snapshot_filename = threading.Lock(), None, None, None
+        self.max_records, self.fsync, self.records, self.compactions, self.last_compaction = 0, False, 0, 0, None
+
+class _Expiry:
+    """The expiry times of the CIDRs added with a TTL (see add_ip()) in a min-heap of (expires,cidr), and the daemon thread 
+    that removes the expired CIDRs in batches. An entry is stale if its CIDR was removed or got another expiry time since 
+    it was pushed, it's discarded when it reaches the top of the heap."""
+    __slots__ = ("heap","wakeup","thread","interval","callback","expired","batches","last_batch","duration")
+    def __init__(self,interval:float,callback=None):
+        self.heap, self.wakeup, self.thread, self.interval, self.callback = [], threading.Event(), None, interval, callback
+        self.expired, self.batches, self.last_batch, self.duration = 0, 0, None, 0.0
+
+def _process_alive(pid:int)->bool:
+    """Check if a process exists. Only POSIX can check it without side effects, the other systems assume it exists."""
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid,0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+class _StringTable:
+    """Read-only list of strings stored in a buffer as an array of offsets and a blob of UTF-8 bytes, used to serve the
+    CIDRs straight from a memory-mapped snapshot. A string is only decoded when it is read."""
+    __slots__ = ("offsets","blob","start","stop")
+    def __init__(self,offsets,blob,start:int=0,stop:int=None):
+        self.offsets, self.blob, self.start = offsets, blob, start
+        self.stop = len(offsets)-1 if stop is None else stop
+    def __len__(self)->int:
+        return self.stop-self.start
+    def __getitem__(self,position):
+        if isinstance(position,slice):
+            return [self[item] for item in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("string table index out of range")
+        position += self.start
+        return str(self.blob[self.offsets[position]:self.offsets[position+1]],"utf-8")
+    def __iter__(self):
+        return (self[position] for position in range(len(self)))
+
+# Binary snapshot: a header followed by the index arrays in native byte order, each section aligned to 8 bytes:
+# IPv4 first, last, rule, prefixlen, parent, action, limit, lists, expires / IPv6 first_hi, first_lo, last_hi, last_lo, rule, 
+# prefixlen, parent, action, limit, lists, expires / the offsets (uint64) and the UTF-8 blob of the CIDRs of both families in the order of 
+# get_ip_network_list(), followed by their labels in the same order and by the names of the named lists in the order of their bits.
+# The CIDR slots of the snapshot are the positions of the CIDRs in get_ip_network_list() (the IPv6 slots start after the IPv4 slots).
+_SNAPSHOT_MAGIC = b"FALSNAP\0"
+_SNAPSHOT_VERSION = 4
+_SNAPSHOT_BYTEORDER = 0x01020304
+_SNAPSHOT_HEADER = struct.Struct("=8sIIQQQQQQ")  # magic, version, byteorder, ipv4 intervals, ipv4 cidrs, ipv6 intervals, ipv6 cidrs, list names, blob size
+_SNAPSHOT_SECTIONS = {4:[("first","I"),("last","I"),("rule","I"),("prefixlen","B"),("parent","i"),("action","B"),("limit","I"),("lists","Q"),("expires","d")],
+                      6:[("first_hi","Q"),("first_lo","Q"),("last_hi","Q"),("last_lo","Q"),("rule","I"),("prefixlen","B"),("parent","i"),("action","B"),("limit","I"),("lists","Q"),("expires","d")]}
+# the sections with one item per CIDR, the other sections have one item per interval
+_SNAPSHOT_SLOT_SECTIONS = ("prefixlen","parent","action","limit","lists","expires")
+
+# Shared memory: a control segment with a magic and the generation of the shared index, and one segment per generation 
+# named <name>_<generation> with the index as a binary snapshot. A generation is written before the control segment 
+# points to it and is never changed after that, so the workers only read complete segments.
+_SHARED_MAGIC = b"FALSHM\0\0"
+_SHARED_CONTROL = struct.Struct("=8sQ")  # magic, generation (0 = nothing shared yet)
+
+# Shared statistics: a header (magic, number of slots, top hits per slot and the epoch, that is incremented by stats_reset()) 
+# followed by one slot per process as uint64: sequence, pid, epoch, hits, count and count entries of (key >> 128, key >> 64 
+# and key of the IP, hits) with the top hits of the process. The sequence is odd while the slot is being written, so a 
+# reader retries until it reads the same even sequence before and after the slot.
+_SHARED_STATS_MAGIC = b"FALSTAT\0"
+_SHARED_STATS_HEADER = struct.Struct("=8sIIQ")  # magic, slots, top hits per slot, epoch
+_SHARED_STATS_EPOCH = struct.Struct("=Q")
+_SHARED_STATS_EPOCH_OFFSET = 16
+_SHARED_STATS_SLOT_FIELDS = 5
+
+# maximum number of slots swept by the rate limiter to find a slot for a new client when all the slots are in use
+_RATE_LIMIT_SWEEP = 16
+# the index is rebuilt when the slots of the removed CIDRs are more than this and more than the half of the slots
+_FREE_SLOTS_MIN_REBUILD = 1024
+# a batch with less added and removed CIDRs than this changes the ip_network_list in place, a bigger batch is merged
+_LIST_MERGE_MIN_CHANGES = 32
+# the number of times check_many(return_index=True) is run without the lock while the ip_network_list changes
+_CHECK_MANY_RETRIES = 3
+# the payload of a CIDR without a rule: action, limit, label, the names of its named lists and its expiry time (0 = never)
+_DEFAULT_PAYLOAD = (0,0,"",(),0)
+# the maximum number of named lists, one bit each in the lists of the index
+_MAX_NAMED_LISTS = 64
+# lists with less CIDRs than this are always parsed in the current process
+_PARALLEL_PARSE_MIN_SIZE = 100000
+_unpack_ipv4 = struct.Struct("!L").unpack
+
+_HOSTMASK = {4:[(1 << (32-prefixlen))-1 for prefixlen in range(33)],6:[(1 << (128-prefixlen))-1 for prefixlen in range(129)]}
+
+def _ip_key(ipaddr:str)->int:
+    """Returns the key of an IP address in the statistics: the integer of an IPv4 address, or the integer of an IPv6 
+    address with the _IPV6_KEY_FLAG. An invalid IP is 0 of its family, like in ip2int(). The object call keeps the last 
+    keys in its own lru_cache of this function. Anything else than a string (ex: None, an integer or bytes) is 0."""
+    try:
+        if ipaddr.find(":") < 0:
+            return _unpack_ipv4(socket.inet_aton(ipaddr))[0]
+    except (AttributeError,TypeError,OSError,ValueError):
+        return 0
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET6,ipaddr),byteorder='big') | _IPV6_KEY_FLAG
+    except (TypeError,OSError,ValueError):
+        return _IPV6_KEY_FLAG
+
+def _parse_network(cidr:str)->Union[tuple,None]:
+    """Parse a CIDR with STRICT MODE using integer arithmetic only (ex: 10.0.0.10/8 is INVALID, 10.0.0.0/8 is VALID). 
+    An IP address without a suffix is parsed as /32 (IPv4) or /128 (IPv6).
+    
+    Returns a tuple (version,first_iplong,last_iplong,prefixlen) or None if the CIDR is invalid."""
+    try:
+        address, slash, prefixlen = cidr.partition("/")
+        if address.find(":") < 0:
+            version, first = 4, _unpack_ipv4(socket.inet_pton(socket.AF_INET,address))[0]
+        else:
+            version, first = 6, int.from_bytes(socket.inet_pton(socket.AF_INET6,address),byteorder='big')
+        if slash and not prefixlen.isdigit():
+            return None
+        prefixlen = int(prefixlen) if slash else (32 if version == 4 else 128)
+        hostmask = _HOSTMASK[version][prefixlen]
+        if first & hostmask:
+            return None
+        return version, first, first | hostmask, prefixlen
+    except (OSError,ValueError,IndexError,AttributeError,TypeError):
+        return None
+
+def _parse_networks(an_ip_list:list)->tuple:
+    """Parse a list of CIDRs with STRICT MODE like _parse_network(), inlined for speed. The networks are keyed by 
+    (first_iplong << 8 | prefixlen), a single integer that sorts in ascending order of IP with the largest network 
+    first, and removes the duplicated networks.
+    
+    Returns 2 dictionaries {key:cidr}, one for IPv4 and one for IPv6, and the list of the invalid CIDRs."""
+    ipv4_dict, ipv6_dict, invalid_list = {}, {}, []
+    ipv4_setdefault, ipv6_setdefault, invalid_append = ipv4_dict.setdefault, ipv6_dict.setdefault, invalid_list.append
+    inet_pton, unpack_ipv4, from_bytes, AF_INET, AF_INET6 = socket.inet_pton, _unpack_ipv4, int.from_bytes, socket.AF_INET, socket.AF_INET6
+    ipv4_hostmask, ipv6_hostmask = _HOSTMASK[4], _HOSTMASK[6]
+    for cidr in an_ip_list:
+        try:
+            address, slash, prefixlen = cidr.partition("/")
+            if slash and not prefixlen.isdigit():
+                invalid_append(cidr)
+            elif address.find(":") < 0:
+                first = unpack_ipv4(inet_pton(AF_INET,address))[0]
+                prefixlen = int(prefixlen) if slash else 32
+                if first & ipv4_hostmask[prefixlen]:
+                    invalid_append(cidr)
+                else:
+                    ipv4_setdefault((first << 8) | prefixlen,cidr if slash else cidr+"/32")
+            else:
+                first = from_bytes(inet_pton(AF_INET6,address),byteorder='big')
+                prefixlen = int(prefixlen) if slash else 128
+                if first & ipv6_hostmask[prefixlen]:
+                    invalid_append(cidr)
+                else:
+                    ipv6_setdefault((first << 8) | prefixlen,cidr if slash else cidr+"/128")
+        except (OSError,ValueError,IndexError,AttributeError,TypeError):
+            invalid_append(cidr)
+    return ipv4_dict, ipv6_dict, invalid_list
+
+def _parse_payload(action:int=0,limit:int=0,label:str="",lists=(),expires:float=0)->Union[tuple,None]:
+    """Validate the payload of a rule. Returns a tuple (action,limit,label,lists,expires) with the names of the named lists 
+    of the rule sorted and without duplicates, or None if the payload is invalid. expires is the time.time() when the rule 
+    expires, 0 = never."""
+    if type(action) is not int or type(limit) is not int or not isinstance(label,str) or not 0 <= action <= 255 or not 0 <= limit <= 0xFFFFFFFF:
+        return None
+    if not isinstance(lists,(list,tuple)) or not all(isinstance(name,str) and name for name in lists):
+        return None
+    if type(expires) not in (int,float) or not 0 <= expires < float("inf"):
+        return None
+    return action, limit, label, tuple(sorted(set(lists))), expires
+
+def _rule_item(cidr:str,payload:tuple):
+    """Returns a CIDR and its payload as saved in the JSON files and in the journal: the CIDR alone without a payload, 
+    [cidr,action,limit,label] without named lists and expiry time, [cidr,action,limit,label,[lists]] or 
+    [cidr,action,limit,label,[lists],expires]."""
+    if payload == _DEFAULT_PAYLOAD:
+        return cidr
+    if payload[4]:
+        return [cidr,*payload[:3],list(payload[3]),payload[4]]
+    return [cidr,*payload[:3],list(payload[3])] if payload[3] else [cidr,*payload[:3]]
+
+def _parse_rules(an_ip_list:list)->tuple:
+    """Split a list of CIDRs and rules into a list of CIDRs and the payloads of the rules. A rule is a tuple or a list 
+    (cidr,action,limit,label,lists,expires) where action, limit, label, lists (the names of the named lists) and expires 
+    (the time.time() when the rule expires) are optional.
+    
+    Returns the list of CIDRs, a dictionary {(version,first_iplong << 8 | prefixlen):(action,limit,label,lists,expires)} with the 
+    payloads (the first payload of a network wins, but the named lists of all its rules are kept) and the list of the invalid rules."""
+    payloads, invalid_list = {}, []
+    return list(_split_rules(an_ip_list,payloads,invalid_list)), payloads, invalid_list
+
+def _split_rules(an_ip_list,payloads:dict,invalid_list:list):
+    """Generator of the CIDRs of an iterable of CIDRs and rules. The payloads of the rules are saved in payloads and 
+    the invalid rules in invalid_list, as they are read."""
+    for item in an_ip_list:
+        if isinstance(item,str):
+            yield item
+            continue
+        try:
+            network, payload = _parse_network(item[0]), _parse_payload(*item[1:])
+        except (TypeError,IndexError,KeyError):
+            network = payload = None
+        if network is None or payload is None:
+            invalid_list.append(item)
+            continue
+        key = (network[0],(network[1] << 8) | network[3])
+        first_payload = payloads.setdefault(key,payload)
+        if payload[3] and first_payload is not payload and not set(payload[3]) <= set(first_payload[3]):
+            payloads[key] = first_payload[:3]+(tuple(sorted(set(first_payload[3]+payload[3]))),)+first_payload[4:]
+        yield item[0]
+
+def _named_list_rules(named_lists:dict)->list:
+    """Returns the CIDRs and rules of the named lists {name:ip_network_list} as rules [cidr,action,limit,label,lists] 
+    with the name of their list. The invalid items are kept as they are, to be discarded with the invalid rules."""
+    rules = []
+    for name, ip_network_list in named_lists.items():
+        for item in ip_network_list:
+            if isinstance(item,str):
+                rules.append((item,0,0,"",(name,)))
+            elif isinstance(item,(list,tuple)) and item:
+                lists = item[4] if len(item) > 4 else ()
+                rules.append((item[0],*item[1:4],*_DEFAULT_PAYLOAD[len(item[1:4]):3],(*lists,name) if isinstance(lists,(list,tuple)) else lists,*item[5:6]))
+            else:
+                rules.append(item)
+    return rules
+
+def _index_lists(index,slot:int)->int:
+    """Returns the bitset of the named lists of a CIDR slot and all its parents, that is the bitset of the named lists 
+    that contain the intervals of the CIDR."""
+    lists, parent, bitset = index.lists, index.parent, 0
+    while slot >= 0:
+        bitset |= lists[slot]
+        slot = parent[slot]
+    return bitset
+
+def _open_text_file(filename:str):
+    """Open a text file for reading, decompressed on the fly if the name ends with .gz, .bz2 or .xz."""
+    opener = {".gz":gzip.open,".bz2":bz2.open,".xz":lzma.open}.get(os.path.splitext(filename)[1],open)
+    return opener(filename,"rt",encoding="utf-8-sig",errors="replace")
+
+def _read_feed(lines):
+    """Generator of the CIDRs of a line-based feed (ex: FireHOL netsets, Spamhaus DROP): the first word of each line, 
+    without the comments that start with # or ;."""
+    for line in lines:
+        line = line.partition("#")[0].partition(";")[0].strip()
+        if line:
+            yield line.split(None,1)[0]
+
+def _read_csv(lines):
+    """Generator of the CIDRs and rules of a CSV file with the columns cidr[,action,limit,label]. The lines that start 
+    with # or ; are comments, and a header line is discarded as an invalid CIDR."""
+    for row in csv.reader(line for line in lines if not line.lstrip().startswith(("#",";"))):
+        row = [cell.strip() for cell in row]
+        if not row or not row[0]:
+            continue
+        if len(row) == 1:
+            yield row[0]
+        else:
+            yield (row[0],*[int(cell) if cell.isdigit() else (0 if cell == "" else cell) for cell in row[1:3]],*row[3:4])
+
+def _payload_tables(version:int,keys:list,payloads:dict,list_mask)->tuple:
+    """Returns the action, limit, lists, expires and label tables of the networks of one IP version given by their sorted 
+    keys. list_mask gives the bitset of a tuple of names of named lists."""
+    action, limit, lists, expires, label = array('B',bytes(len(keys))), array('I',[0])*len(keys), array('Q',[0])*len(keys), array('d',[0])*len(keys), [""]*len(keys)
+    for (payload_version,key), payload in payloads.items():
+        if payload_version == version:
+            slot = bisect.bisect_left(keys,key)
+            action[slot], limit[slot], label[slot], expires[slot] = *payload[:3], payload[4]
+            if payload[3]:
+                lists[slot] = list_mask(payload[3])
+    return action, limit, lists, expires, label
+
+def _compact_networks(version:int,network_dict:dict,payloads:dict,old_origins:dict)->tuple:
+    """Collapse the networks of one IP version {key:cidr} into the minimal set of networks with the same lookups, in place:
+    - a network is removed if the most specific network that contains it has the same payload (contained).
+    - 2 adjacent networks of the same size with the same payload are replaced by the network that contains them 
+      both (merged), unless this network is already in the list with another payload. It's repeated from the smallest 
+      networks to the largest, so 256 adjacent /24 become a single /16.
+    The payloads of the removed networks are removed from payloads, and the payloads of the new networks are added.
+    
+    Returns the number of contained and merged networks, and a dictionary {key:[original cidrs]} with the original CIDRs 
+    of each network that replaced other networks. old_origins {cidr:[original cidrs]} are the original CIDRs of a 
+    previous compaction, if the networks were already compacted."""
+    width, default_payload = (32 if version == 4 else 128), _DEFAULT_PAYLOAD
+    origins, contained, merged = {}, 0, 0
+    def origin_list(key:int)->list:
+        return origins.pop(key,None) or old_origins.get(network_dict[key]) or [network_dict[key]]
+    # remove the networks that have the same payload of their most specific parent
+    stack_last, stack_key = [], []
+    for key in sorted(network_dict):
+        first = key >> 8
+        while stack_last and stack_last[-1] < first:
+            stack_last.pop(), stack_key.pop()
+        payload = payloads.get((version,key),default_payload)
+        if stack_key and payloads.get((version,stack_key[-1]),default_payload) == payload:
+            if stack_key[-1] not in origins:
+                origins[stack_key[-1]] = list(origin_list(stack_key[-1]))
+            origins[stack_key[-1]].extend(origin_list(key))
+            del network_dict[key]
+            payloads.pop((version,key),None)
+            contained += 1
+            continue
+        stack_last.append(first | _HOSTMASK[version][key & 0xFF]), stack_key.append(key)
+    # merge the adjacent networks from the smallest to the largest
+    levels = [[] for _ in range(width+1)]
+    for key in network_dict:
+        levels[key & 0xFF].append(key)
+    for prefixlen in range(width,0,-1):
+        size = 1 << (width-prefixlen)
+        for key in levels[prefixlen]:
+            first = key >> 8
+            if first & size or key not in network_dict:
+                continue
+            sibling_key, parent_key = ((first | size) << 8) | prefixlen, (first << 8) | (prefixlen-1)
+            if sibling_key not in network_dict or parent_key in network_dict:
+                continue
+            payload = payloads.get((version,key),default_payload)
+            if payloads.get((version,sibling_key),default_payload) != payload:
+                continue
+            if version == 4:
+                network_dict[parent_key] = f"{socket.inet_ntoa(struct.pack('>L',first))}/{prefixlen-1}"
+            else:
+                network_dict[parent_key] = f"{socket.inet_ntop(socket.AF_INET6,first.to_bytes(16,'big'))}/{prefixlen-1}"
+            origins[parent_key] = origin_list(key)+origin_list(sibling_key)
+            del network_dict[key], network_dict[sibling_key]
+            payloads.pop((version,key),None), payloads.pop((version,sibling_key),None)
+            if payload != default_payload:
+                payloads[(version,parent_key)] = payload
+            levels[prefixlen-1].append(parent_key)
+            merged += 1
+    # the networks that were not changed keep the original CIDRs of the previous compaction
+    for key, cidr in network_dict.items():
+        if key not in origins and cidr in old_origins:
+            origins[key] = old_origins[cidr]
+    return contained, merged, origins
+
+def _flatten_networks(first_list:list,last_list:list,typecode:str=None)->tuple:
+    """Flatten the networks given by their first and last IPs, sorted by first IP ascending and last IP descending 
+    into non-overlapping intervals. CIDRs never partially overlap, they are nested or disjoint, so a stack of the 
+    open networks is enough: the network on the top of the stack is always the most specific one.
+    
+    Returns 4 lists: the first IP, the last IP and the index in first_list of the most specific network of each 
+    interval, and the index in first_list of the parent of each network (-1 if the network has no parent). If typecode 
+    is given, they are arrays of typecode, typecode, 'I' and 'i' instead of lists, that are smaller for large lists."""
+    if typecode is None:
+        interval_first, interval_last, interval_rule, parent_list = [], [], [], []
+    else:
+        interval_first, interval_last, interval_rule, parent_list = array(typecode), array(typecode), array('I'), array('i')
+    append_first, append_last, append_rule, append_parent = interval_first.append, interval_last.append, interval_rule.append, parent_list.append
+    stack_last, stack_rule, position = [], [], 0
+    for rule, (first, last) in enumerate(zip(first_list,last_list)):
+        # close the networks that end before this one starts
+        while stack_last and stack_last[-1] < first:
+            closed_last, closed_rule = stack_last.pop(), stack_rule.pop()
+            if position <= closed_last:
+                append_first(position), append_last(closed_last), append_rule(closed_rule)
+            position = closed_last+1
+        if stack_rule:
+            # the gap between the last interval and this network belongs to the enclosing network
+            if position < first:
+                append_first(position), append_last(first-1), append_rule(stack_rule[-1])
+            append_parent(stack_rule[-1])
+        else:
+            append_parent(-1)
+        stack_last.append(last), stack_rule.append(rule)
+        position = first
+    while stack_last:
+        closed_last, closed_rule = stack_last.pop(), stack_rule.pop()
+        if position <= closed_last:
+            append_first(position), append_last(closed_last), append_rule(closed_rule)
+        position = closed_last+1
+    return interval_first, interval_last, interval_rule, parent_list
+
+def _append_interval(intervals:tuple,first:int,last:int,rule:int):
+    """Append an interval to a tuple of 3 lists (first,last,rule), merging it with the previous interval if they are contiguous and have the same rule."""
+    if intervals[2] and intervals[2][-1] == rule and intervals[1][-1]+1 == first:
+        intervals[1][-1] = last
+    else:
+        intervals[0].append(first), intervals[1].append(last), intervals[2].append(rule)
 
 class FastAccessLimiter:
     def __init__(self,ip_network_list:list=[],with_stats:bool=True,**kwargs):
@@ -39,62 +936,200 @@ class FastAccessLimiter:
         - **kwargs: Additional keyword arguments.
             - debug (bool): Enable or disable debug mode. Default is False.
             - top_hits (int): The maximum number of top hits to be saved in the statistics. Default is 100.
-            - cache_size (int): The maximum number of items in the cache. Default is 1024. 0 = no cache.
+            - cache_size (int): The maximum number of items in the cache of each address family. Default is 1024. 0 = no cache. 
+            - cache_policy (str): "slru" (a segmented LRU: an IP is kept in the protected part of the cache only if it's found 
+              again, so a scan of random IPs doesn't evict the hot clients, and a change only removes the IPs of the changed 
+              CIDRs) or "lru" (a functools.lru_cache, emptied by each change of the list). The hits of the lru cache are 
+              faster, the slru cache has more hits with scanners and keeps its IPs on add_ip()/remove_ip(). Default is "slru" 
+              (see cache_info()).
+            - workers (int): The number of processes used to parse lists with more than 100.000 CIDRs. Default is 0 (no process pool).
+            - stats_sketch_size (int): The number of counters used to track the hits per IP with fixed memory (Space-Saving sketch). 
+              The counts in top_hits are overestimated by at most hits/stats_sketch_size, so a bigger sketch is more accurate. 
+              Default is 0 (exact statistics, one counter per IP). Minimum is top_hits.
+            - rate_limit (tuple): Limit the rate of requests of the IPs that are NOT in the IP list as (requests,seconds), ex: 
+              (100,60) allows bursts of 100 requests and 100 requests per minute. A client over the limit gets a RateLimited 
+              result (a True value) instead of False. The requests and the seconds must be greater than 0, otherwise a 
+              ValueError is raised. Default is None (no rate limit).
+            - rate_limit_prefixlen (tuple): The prefix length of the client networks of the rate limit as (ipv4,ipv6), ex: 
+              (24,64) shares the limit among all the IPs of a /24 or /64 network. The prefix lengths must be integers from 0 
+              to 32 and from 0 to 128, otherwise a ValueError is raised. Default is (32,128) (per IP address).
+            - rate_limit_clients (int): The maximum number of clients tracked by the rate limit. Default is 1000000.
+            - compact (bool): Collapse the adjacent and the contained networks with the same payload into the minimal set 
+              of networks when the list is prepared, ex: 10.0.0.0/24 and 10.0.1.0/24 become 10.0.0.0/23. The lookups 
+              return the compacted networks, and get_original_cidrs() returns their original CIDRs. Default is False.
+            - named_lists (dict): Several named lists {name:ip_network_list} merged in the same index, ex: {"allow":[...],
+              "deny":[...]}. The calls return the names of the lists that contain the IP instead of the CIDR (see 
+              load_named_lists()). The names get their order from this dict, so a dict of empty lists enables the named 
+              lists, in this order, for a list opened later. Default is None.
+            - precedence (list): The names of the named lists in order of precedence, ex: ["allow","deny"] (allow wins). 
+              The calls return only the name of the first list of the precedence that contains the IP. Default is None.
+            - ipv4_jump_table (bool): Keep a first-level table indexed by the upper 16 bits of the IPv4 addresses (256 KiB), so 
+              a lookup searches only the intervals of its /16 network, or none if a /16 or shorter network covers it. 
+              Default is False.
+            - metrics (bool): Time each lookup in a latency histogram, see metrics_info() and metrics_prometheus(). Default 
+              is False (the lookups are not timed and cost nothing more).
+            - expiry_interval (float): The tick of the removal of the expired CIDRs in seconds: the CIDRs are removed in one 
+              update of the index per tick, when the tick of their expiry time ends, so the CIDRs that expire in a burst are 
+              removed together (see add_ip()). A CIDR is removed at most expiry_interval seconds late. Default is 1.0.
+            - expiry_callback (callable): Called with this object after each batch of removal of the expired CIDRs (ex: to 
+              call share_ip_network_list()). Default is None.
         """
         self._lock = threading.Lock()
         # enable the debug mode if the environment variable FASTACCESSLIMITER_DEBUG is set OR if the debug parameter is True
         if (os.environ.get("FASTACCESSLIMITER_DEBUG","") != "") or (kwargs.get("debug",False) == True):
             self.__debug = self.__debug_enabled
-        # reset the hit counter and the IP statistics dictionary
-        self.__hit_counter = itertools.count()
-        self.__hit_counter_access = itertools.count()
-        self.__stats_ip_dict = {}
-        # if with_stats is True, the statistics will be saved, otherwise the statistics will be a null function
-        if with_stats:
-            self.__stats_save = self.__stats_save_enabled
+        # reset the hit counters. Each thread counts its hits in its own shard, that are summed by stats_info()
+        self.__stats = _Stats(self.__stats_empty_shard)
+        self.__stats_sketch_size = 0
+        # the statistics of all the processes in shared memory, see share_stats(). None = statistics of this process only
+        self.__shared_stats = None
         # define the maximum number of top hits to be saved in the statistics. Minimum is 1
         self.__top_hits_size = kwargs.get("top_hits",100)
         self.__top_hits_size = 1 if self.__top_hits_size < 0 else self.__top_hits_size
-        # define the maximum number of items in the cache. 0 = no cache
-        self.__cache_size = kwargs.get("cache_size",1024)
-        if self.__cache_size > 0:
-            self.__check_iplong_access = functools.lru_cache(maxsize=self.__cache_size)(self.__check_iplong_access)
-        # prepare the IP Network list
-        self.__ip_network_list, self.__ip_network_list_first_iplong, self.__ip_network_list_last_iplong = self.__prepare_ip_list(ip_network_list)
+        # if with_stats is True, the statistics will be saved, otherwise the statistics will be a null function. With 
+        # stats_sketch_size > 0, the hits per IP are counted by a Space-Saving sketch with a fixed number of counters
+        if with_stats:
+            self.__stats_save = self.__stats_save_enabled
+            self.__stats_save_many = self.__stats_save_many_enabled
+            if kwargs.get("stats_sketch_size",0) > 0:
+                self.__stats_sketch_size = max(kwargs["stats_sketch_size"],self.__top_hits_size)
+                self.__stats_save = self.__stats_save_sketch
+                self.__stats_save_many = self.__stats_save_many_sketch
+        # define the maximum number of items in the cache. 0 = no cache. The cache of each address family belongs to a 
+        # generation of the index, that is incremented on each change. The default segmented LRU is invalidated partially when 
+        # a CIDR is added or removed. The lru_cache (cache_policy="lru") is replaced on each change
+        self.__cache_size, self.__cache_policy = kwargs.get("cache_size",1024), kwargs.get("cache_policy","slru")
+        if self.__cache_policy not in ("lru","slru"):
+            raise ValueError(f"Invalid cache_policy {self.__cache_policy}, it must be 'lru' or 'slru'.")
+        cache_class = _LRUCache if self.__cache_policy == "lru" else _LookupCache
+        self.__ipv4_cache, self.__ipv6_cache = cache_class(max(self.__cache_size,0),1), cache_class(max(self.__cache_size,0),1)
+        # the last IP addresses of the object call and their keys, in an lru_cache of each object
+        self.__ip_key = functools.lru_cache(maxsize=1024)(_ip_key)
+        # if metrics is True, the checks are timed by a wrapper, otherwise they are called directly and cost nothing more. 
+        # The durations of the builds of the index are always saved, once per build
+        self.__metrics, self.__latency, self.__build_info = kwargs.get("metrics",False), _Stats(_LatencyShard), _BuildInfo()
+        self.__bind_checks()
+        # define the number of processes used to parse very large lists. 0 or 1 = no process pool
+        self.__workers = kwargs.get("workers",0)
+        # the rate limit is a null function unless the parameter rate_limit is given
+        self.__rate_limiter = None
+        if kwargs.get("rate_limit") is not None:
+            requests, seconds = kwargs["rate_limit"]
+            self.__rate_limiter = _RateLimiter(requests,seconds,kwargs.get("rate_limit_clients",1000000),kwargs.get("rate_limit_prefixlen",(32,128)))
+            self.__rate_limit = self.__rate_limit_enabled
+        # compact the lists when they are prepared. The result of the last compaction is kept in __compaction
+        self.__compact = kwargs.get("compact",False)
+        # the IPv4 lookups start from the first-level table of the index, that is built or updated each time an index is published
+        self.__ipv4_jump_table = kwargs.get("ipv4_jump_table",False)
+        if self.__ipv4_jump_table:
+            self.__check_ipv4_access = self.__check_ipv4_access_jump
+            self.__bind_checks()
+        # the names of the named lists in the order of their bits. A name keeps its bit for the life of the object, so 
+        # a lookup never maps a bit to another name. The result of each bitset of the lookups is kept in __list_results
+        self.__list_names, self.__list_lock, self.__precedence, self.__list_results = [], threading.Lock(), None, {}
+        if kwargs.get("named_lists") is not None or kwargs.get("precedence") is not None:
+            self.__enable_named_lists(kwargs.get("precedence"))
+            self.__list_mask(tuple(kwargs.get("named_lists") or {}))
+            ip_network_list = list(ip_network_list)+_named_list_rules(kwargs.get("named_lists") or {})
+        # prepare the IP Network list. All the lookup state is kept in one immutable _Index that is replaced on each change
+        self.__ip_network_list, ipv4_index, ipv6_index, self.__compaction = self.__prepare_ip_list(ip_network_list)
+        self.__index = _Index(self.__with_jump_table(ipv4_index),ipv6_index,1,self.__ip_network_list)
+        # incremented before and after the ip_network_list is changed in place, odd while it's being changed (see check_many())
+        self.__list_version = 0
+        # the shared memory of share_ip_network_list() or attach_ip_network_list(). None = not shared
+        self.__shared = None
+        # the file watched by watch_ip_network_list() and the results of the reloads
+        self.__reloader = _Reloader()
+        # the journal of the changes opened by open_journal(). Its lock is always taken before the lock of the index
+        self.__journal = _Journal()
+        # the CIDRs added with a TTL are removed in batches by a daemon thread that runs only while there are CIDRs to expire
+        self.__expiry = _Expiry(kwargs.get("expiry_interval",1.0),kwargs.get("expiry_callback"))
+        with self._lock:
+            self.__expiry_schedule(self.__expiry_entries(ipv4_index,ipv6_index),replace=True)
     ##──── DEBUG MODE ────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     def __debug(self, msg:str):...
     def __debug_enabled(self, msg:str):
         print(f"\033[38;2;0;255;0m[FASTACCESSLIMITER_DEBUG] {str(msg)}\033[0m")
     ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     ##──── IP LIST FUNCTIONS ─────────────────────────────────────────────────────────────────────────────────────────────────────────
-    def __prepare_ip_list(self,an_ip_list)->list:
+    def __prepare_ip_list(self,an_ip_list,origins:dict=None)->tuple:
         """Prepare the list of IPs. Remove invalid IPs, convert IPs to CIDR format, remove duplicates, sort the list of IPs in ascending order of IP and remove blank items.
         
-        Returns the list of IPs in CIDR format, the list of the first IP of the CIDR and the list of the last IP of the CIDR."""
+        Returns the list of IPs in CIDR format, the IPv4 index, the IPv6 index and the result of the compaction (None if the 
+        parameter compact is False). With compact, the networks are collapsed by _compact_networks() and origins are the 
+        original CIDRs of a previous compaction of the same networks. Nested and overlapping CIDRs are flattened 
+        into non-overlapping intervals, and each index keeps the first IP, the last IP and the most specific CIDR of these 
+        intervals in compact arrays, sorted by the first IP. A lookup is always 1 binary search and 1 IF. 
+        
+        Nothing is changed here, the result is published by __publish()."""
         start_time = time.monotonic()
-        an_ip_list = [self.get_cidr_format(item) for item in an_ip_list if self.ip2int(item.split("/")[0]) != 0]
-        # remove invalid CIDRs from the list (ex: 10.0.0.10/8 is INVALID, 10.0.0.0/8 is VALID, 10.0.0.10/32 is VALID)
-        new_list = [item for item in an_ip_list if self.is_valid_cidr(item)]
-        # sort the list of IPs in ascending order of IP, remove duplicates and blank items
-        self.__ip_network_list = new_list = sorted(list(filter(None,sorted(list(dict.fromkeys(new_list))))),key=lambda ip:self.ip2int(ip.split("/")[0]))
-        # get the first and last IP of the CIDR and convert them to integer. Keep 2 lists: one with the first IP and another with the last IP
-        new_list_first_iplong = [self.ip2int(item.split("/")[0]) for item in new_list]
-        new_list_last_iplong = [int(ipaddress.ip_network(item,strict=False)[-1]) for item in new_list]
-        # clear the cache of the __check_iplong_access method because the list was changed
-        if self.__cache_size > 0:
-            self.__check_iplong_access.cache_clear()
-        # show the invalid CIDRs if they exist and DEBUG is enabled
-        invalid_cidrs = list(set(an_ip_list) - set(new_list))
-        if len(invalid_cidrs) > 0:
-            self.__debug(f"Invalid CIDRs: {invalid_cidrs}")
-        self.__debug(f"Valid ip_netork_list.: {new_list}")
-        # self.__debug(f"ip_netork_list_first_iplong: {new_list_first_iplong}")
-        # self.__debug(f"ip_netork_list_last_iplong.: {new_list_last_iplong}")
-        self.__debug(f"Elapsed time to prepare the IP Network list: {time.monotonic()-start_time:.9f} seconds")
-        return new_list, new_list_first_iplong, new_list_last_iplong
+        # split the rules (cidr,action,limit,label) into CIDRs and payloads. An iterator (ex: a file read line by line) 
+        # is parsed in one pass, without making a list of its items
+        payloads, invalid_rules = {}, []
+        if not isinstance(an_ip_list,(list,tuple)):
+            an_ip_list = _split_rules(an_ip_list,payloads,invalid_rules)
+        elif not all(isinstance(item,str) for item in an_ip_list):
+            an_ip_list, payloads, invalid_rules = _parse_rules(an_ip_list)
+        # parse and validate the CIDRs, remove duplicates and blank items, and split the networks by address family
+        ipv4_dict, ipv6_dict, invalid_cidrs = self.__parse_ip_list(an_ip_list)
+        invalid_cidrs += invalid_rules
+        compaction = None
+        if self.__compact:
+            networks = len(ipv4_dict)+len(ipv6_dict)
+            ipv4_contained, ipv4_merged, ipv4_origins = _compact_networks(4,ipv4_dict,payloads,origins or {})
+            ipv6_contained, ipv6_merged, ipv6_origins = _compact_networks(6,ipv6_dict,payloads,origins or {})
+            compaction = _Compaction(networks,len(ipv4_dict)+len(ipv6_dict),ipv4_contained+ipv6_contained,ipv4_merged+ipv6_merged,
+                                     {**{ipv4_dict[key]:origin for key, origin in ipv4_origins.items()},**{ipv6_dict[key]:origin for key, origin in ipv6_origins.items()}})
+            self.__debug(f"Compaction of the IP Network list: {networks} networks, {compaction.compacted_networks} compacted networks")
+        # sort each family once by its integer key: in ascending order of IP, the largest network first. The temporary 
+        # dictionaries and lists are released as soon as they are used, to keep the peak of memory low with large lists
+        ipv4_keys = sorted(ipv4_dict)
+        ipv4_cidr = [ipv4_dict[key] for key in ipv4_keys]
+        del ipv4_dict
+        # flatten the nested networks into non-overlapping intervals tagged with their most specific CIDR
+        prefixlen, hostmask = array('B',[key & 0xFF for key in ipv4_keys]), _HOSTMASK[4]
+        first = array('I',[key >> 8 for key in ipv4_keys])
+        first, last, rule, parent = _flatten_networks(first,array('I',[iplong | hostmask[bits] for iplong, bits in zip(first,prefixlen)]),'I')
+        ipv4_index = _IPv4Index(first,last,rule,ipv4_cidr,prefixlen,parent,*_payload_tables(4,ipv4_keys,payloads,self.__list_mask),[])
+        del ipv4_keys, first, last, rule, parent
+        ipv6_keys = sorted(ipv6_dict)
+        ipv6_cidr = [ipv6_dict[key] for key in ipv6_keys]
+        del ipv6_dict
+        prefixlen, hostmask = array('B',[key & 0xFF for key in ipv6_keys]), _HOSTMASK[6]
+        first = [key >> 8 for key in ipv6_keys]
+        first, last, rule, parent = _flatten_networks(first,[iplong | hostmask[bits] for iplong, bits in zip(first,prefixlen)])
+        ipv6_index = _IPv6Index(array('Q',[iplong >> 64 for iplong in first]),array('Q',[iplong & _MASK64 for iplong in first]),
+                                array('Q',[iplong >> 64 for iplong in last]),array('Q',[iplong & _MASK64 for iplong in last]),array('I',rule),
+                                ipv6_cidr,prefixlen,array('i',parent),*_payload_tables(6,ipv6_keys,payloads,self.__list_mask),[])
+        del ipv6_keys, first, last, rule, parent
+        new_list = ipv4_cidr + ipv6_cidr
+        # show the invalid CIDRs if they exist and DEBUG is enabled. The lists are only formatted in the debug mode
+        if self.__debug == self.__debug_enabled:
+            if len(invalid_cidrs) > 0:
+                self.__debug(f"Invalid CIDRs: {invalid_cidrs}")
+            self.__debug(f"Valid ip_netork_list.: {new_list}")
+        self.__build_info.rebuilds, self.__build_info.rebuild_duration = self.__build_info.rebuilds+1, time.monotonic()-start_time
+        self.__debug(f"Elapsed time to prepare the IP Network list: {self.__build_info.rebuild_duration:.9f} seconds")
+        return new_list, ipv4_index, ipv6_index, compaction
+    def __parse_ip_list(self,an_ip_list)->tuple:
+        """Parse the list of CIDRs with _parse_networks(). Very large lists are split in chunks and parsed by a pool of 
+        processes if the parameter workers is greater than 1. An iterator is always parsed in the current process."""
+        if self.__workers <= 1 or not isinstance(an_ip_list,(list,tuple)) or len(an_ip_list) < _PARALLEL_PARSE_MIN_SIZE:
+            return _parse_networks(an_ip_list)
+        an_ip_list = list(an_ip_list)
+        chunk_size = -(-len(an_ip_list) // (self.__workers*4))
+        ipv4_dict, ipv6_dict, invalid_list = {}, {}, []
+        with ProcessPoolExecutor(max_workers=self.__workers) as executor:
+            for chunk_ipv4_dict, chunk_ipv6_dict, chunk_invalid_list in executor.map(_parse_networks,[an_ip_list[position:position+chunk_size] for position in range(0,len(an_ip_list),chunk_size)]):
+                # keep the first occurrence of a network, like in a single process
+                for key, cidr in chunk_ipv4_dict.items():
+                    ipv4_dict.setdefault(key,cidr)
+                for key, cidr in chunk_ipv6_dict.items():
+                    ipv6_dict.setdefault(key,cidr)
+                invalid_list.extend(chunk_invalid_list)
+        return ipv4_dict, ipv6_dict, invalid_list
     ##───────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     ##──── IP/CIDR MANIPULATION FUNCTIONS ────────────────────────────────────────────────────────────────────────────────────────────
-    @functools.lru_cache(maxsize=1024)
     def ip2int(self,ipaddr:str)->int:
         """Converts an IPv4 or IPv6 address to an integer."""
         try:
@@ -104,7 +1139,6 @@ class FastAccessLimiter:
                 return int.from_bytes(socket.inet_pton(socket.AF_INET6,ipaddr),byteorder='big')
         except:
             return 0
-    @functools.lru_cache(maxsize=1024)
     def is_valid_ip(self,ipaddr:str)->bool:
         """Check if an IPv4 or IPv6 address is valid. Try to convert the IP address to an integer. If it fails, the IP address is invalid. 
         This is the fastest way to check if an IP address is valid, much better than using regular expressions."""
@@ -116,7 +1150,6 @@ class FastAccessLimiter:
             return True
         except:
             return False
-    @functools.lru_cache(maxsize=1024)
     def is_valid_cidr(self,cidr:str)->bool:
         """Check if a CIDR is valid with STRICT MODE. Ex: 
         
@@ -127,7 +1160,6 @@ class FastAccessLimiter:
             return True
         except: 
             return False
-    @functools.lru_cache(maxsize=1024)
     def get_valid_cidr(self,cidr:str)->Union[str,None]:
         """Convert an invalid CIDR to a valid CIDR. Returns None if the CIDR is completely invalid."""
         try:
@@ -135,7 +1167,6 @@ class FastAccessLimiter:
             return str(network)
         except ValueError:
             return None
-    @functools.lru_cache(maxsize=1024)
     def get_cidr_format(self,ipaddr:str)->str:
         """Converts an IP address to CIDR format. Add /32 to the IPv4 address if it is not present or add /128 to the IPv6 address if it is not present."""
         if (ipaddr.find(":") >= 0 and ipaddr.find("/") < 0):    # IPv6
@@ -147,12 +1178,15 @@ class FastAccessLimiter:
     ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     ##──── STATS ─────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     def stats_reset(self)->bool:
-        """Reset the hit counter."""
+        """Reset the hit counters of all the threads at once, replacing all the shards with one reference assignment. 
+        With share_stats(), the statistics of all the processes are reset."""
         try:
             with self._lock:
-                self.__hit_counter = itertools.count()
-                self.__hit_counter_access = itertools.count()
-                self.__stats_ip_dict.clear()
+                self.__stats = _Stats(self.__stats_empty_shard)
+                shared = self.__shared_stats
+                if shared is not None:
+                    shared.epoch, shared.base_hits, shared.base_counts = shared.reset(), 0, {}
+                    shared.write(0,[])
             return True
         except:
             return False
@@ -165,56 +1199,261 @@ class FastAccessLimiter:
             stats = access_limiter.stats_info()
             print(f"Total hits: {stats.hits}")
             print(f"Top100 IPs: {json.dumps(stats.top_hits,indent=3,sort_keys=False)}")
-            
+        
+        With share_stats(), the hits are the hits of all the processes, and the top hits are the sum of the top hits 
+        of each process, saved in the shared memory every flush_interval seconds.
         """
         Stats = namedtuple("Stats", ["hits","top_hits"])
         def int_to_ipv4(iplong):
             return socket.inet_ntoa(struct.pack('>L', iplong))
         def int_to_ipv6(iplong):
             return socket.inet_ntop(socket.AF_INET6, binascii.unhexlify(hex(iplong)[2:].zfill(32)))
-        return Stats(next(self.__hit_counter)-next(self.__hit_counter_access),
-                     {int_to_ipv6(key) if str(key).find(":")>=0 else int_to_ipv4(key):val for key,val in dict(sorted(self.__stats_ip_dict.items(), key=lambda item: item[1], reverse=True)[:self.__top_hits_size]).items()})
+        shared = self.__shared_stats
+        hits, ip_counts = self.__stats_merge(shared)
+        if shared is not None:
+            epoch = shared.current_epoch()
+            for slot in range(shared.slots):
+                if slot == shared.slot and shared.pid == os.getpid():
+                    continue
+                data = shared.read(slot)
+                if data is not None and data[0] != 0 and data[1] == epoch:
+                    hits += data[2]
+                    for iplong, count in data[3]:
+                        ip_counts[iplong] = ip_counts.get(iplong,0)+count
+        return Stats(hits,
+                     {int_to_ipv6(key ^ _IPV6_KEY_FLAG) if key >= _IPV6_KEY_FLAG else int_to_ipv4(key):val for key,val in heapq.nlargest(self.__top_hits_size,ip_counts.items(),key=operator.itemgetter(1))})
+    def __stats_merge(self,shared:_SharedStats=None)->tuple:
+        """Returns the hits and a dict with the hits per IP of all the threads of this process, including the hits 
+        carried over from the slot of the shared statistics."""
+        # the shards are copied with dict.copy(), that is atomic, while their threads keep counting
+        hits, ip_counts, stats = 0, {}, self.__stats
+        with stats.lock:
+            for shard in list(stats.shards):
+                hits += shard.hits
+                if not ip_counts:
+                    ip_counts = shard.ips.copy()
+                else:
+                    for iplong, count in shard.ips.copy().items():
+                        ip_counts[iplong] = ip_counts.get(iplong,0)+count
+        if shared is not None and shared.base_hits > 0:
+            hits += shared.base_hits
+            for iplong, count in shared.base_counts.items():
+                ip_counts[iplong] = ip_counts.get(iplong,0)+count
+        return hits, ip_counts
+    def share_stats(self,shm_name:str,max_processes:int=256,flush_interval:float=1.0,raise_on_error:bool=False)->bool:
+        """Save the statistics of this process in a slot of the shared memory shm_name every flush_interval seconds, so 
+        stats_info() and stats_reset() of any process that called share_stats(shm_name) work with the statistics of all 
+        the processes. The lookups don't change, they count the hits in this process as before. The shared memory 
+        is created by the first process with room for max_processes processes and top_hits IPs per process. In a 
+        pre-fork server, call it in each worker after the fork.
+        
+        Returns :
+        - True if the statistics are shared
+        - False if the statistics could not be shared. If raise_on_error is True, an exception will be raised.
+        """
+        try:
+            self.close_shared_stats()
+            try:
+                segment = _shared_memory_attach(shm_name,_SHARED_STATS_HEADER.size+8*max_processes*(_SHARED_STATS_SLOT_FIELDS+4*self.__top_hits_size))
+                _SHARED_STATS_HEADER.pack_into(segment.buf,0,bytes(len(_SHARED_STATS_MAGIC)),max_processes,self.__top_hits_size,0)
+                segment.buf[:len(_SHARED_STATS_MAGIC)] = _SHARED_STATS_MAGIC
+            except FileExistsError:
+                segment = _shared_memory_attach(shm_name)
+                # wait for the process that is creating the shared memory
+                deadline = time.monotonic()+1.0
+                while bytes(segment.buf[:len(_SHARED_STATS_MAGIC)]) != _SHARED_STATS_MAGIC:
+                    if time.monotonic() > deadline:
+                        segment.close()
+                        raise ValueError(f"The shared memory {shm_name} is not a FastAccessLimiter shared statistics.") from None
+                    time.sleep(0.001)
+            shared = _SharedStats(segment)
+            try:
+                shared.claim(shm_name)
+            except Exception:
+                shared.values.release()
+                segment.close()
+                raise
+            with self._lock:
+                # the hits counted by this process before sharing are saved in its slot
+                self.__shared_stats = shared
+            self.__stats_flush(shared)
+            if flush_interval > 0:
+                shared.thread = threading.Thread(target=self.__stats_flush_loop,args=(shared,flush_interval),daemon=True,
+                                                 name=f"FastAccessLimiter-{shm_name}")
+                shared.thread.start()
+            return True
+        except Exception as ERR:
+            if raise_on_error:
+                raise ERR from None
+            return False
+    def close_shared_stats(self,unlink:bool=False)->bool:
+        """Save the statistics of this process in the shared memory for the last time and stop sharing them. With 
+        unlink=True, the shared memory is removed (call it in the last process, ex: the master of a pre-fork server).
+        
+        Returns :
+        - True if the shared statistics were closed
+        - False if the statistics are not shared.
+        """
+        with self._lock:
+            shared, self.__shared_stats = self.__shared_stats, None
+        if shared is None:
+            return False
+        shared.stop.set()
+        if shared.thread is not None and shared.thread is not threading.current_thread():
+            shared.thread.join()
+        self.__stats_flush(shared)
+        shared.values.release()
+        shared.segment.close()
+        if unlink:
+            try:
+                shared.segment.unlink()
+            except FileNotFoundError:
+                pass
+        return True
+    def __stats_flush(self,shared:_SharedStats):
+        """Save the hits and the top hits of this process in its slot. If the statistics were reset by another 
+        process, the statistics of this process are reset first."""
+        with self._lock:
+            if shared.current_epoch() != shared.epoch:
+                self.__stats = _Stats(self.__stats_empty_shard)
+                shared.epoch, shared.base_hits, shared.base_counts = shared.current_epoch(), 0, {}
+            hits, ip_counts = self.__stats_merge(shared)
+            shared.write(hits,heapq.nlargest(shared.top_hits,ip_counts.items(),key=operator.itemgetter(1)))
+    def __stats_flush_loop(self,shared:_SharedStats,flush_interval:float):
+        while not shared.stop.wait(flush_interval):
+            try:
+                self.__stats_flush(shared)
+            except Exception as ERR:
+                self.__debug(f"Failed to save the shared statistics: {str(ERR)}")
+    def __stats_empty_shard(self)->_StatsShard:
+        return _StatsShard(_SpaceSaving(self.__stats_sketch_size) if self.__stats_sketch_size > 0 else {})
     def __stats_save(self,iplong):...
     def __stats_save_enabled(self,iplong):
-        next(self.__hit_counter)
-        self.__stats_ip_dict[iplong] = self.__stats_ip_dict.get(iplong,0)+1
+        try:
+            shard = self.__stats.local.shard
+        except AttributeError:
+            shard = self.__stats.thread_shard()
+        shard.hits += 1
+        shard.ips[iplong] = shard.ips.get(iplong,0)+1
+    def __stats_save_many(self,iplong_counts:dict):...
+    def __stats_save_many_enabled(self,iplong_counts:dict):
+        try:
+            shard = self.__stats.local.shard
+        except AttributeError:
+            shard = self.__stats.thread_shard()
+        shard.hits += sum(iplong_counts.values())
+        for iplong, count in iplong_counts.items():
+            shard.ips[iplong] = shard.ips.get(iplong,0)+count
+    def __stats_save_sketch(self,iplong):
+        try:
+            shard = self.__stats.local.shard
+        except AttributeError:
+            shard = self.__stats.thread_shard()
+        shard.hits += 1
+        shard.ips.add(iplong)
+    def __stats_save_many_sketch(self,iplong_counts:dict):
+        try:
+            shard = self.__stats.local.shard
+        except AttributeError:
+            shard = self.__stats.thread_shard()
+        shard.hits += sum(iplong_counts.values())
+        for iplong, count in iplong_counts.items():
+            shard.ips.add(iplong,count)
     ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     ##──── MANAGE IP/CIDR LIST ───────────────────────────────────────────────────────────────────────────────────────────────────────
-    def get_ip_network_list(self)->list:
-        """Get the list of IPs in the accept list."""
+    def get_ip_network_list(self,with_rules:bool=False)->list:
+        """Get the list of IPs in the accept list. If with_rules is True, returns a list of Rule(cidr,action,limit,label) 
+        with the payload of each CIDR."""
+        if with_rules:
+            with self._lock:
+                return self.__rule_list(self.__index.ipv4,self.__index.ipv6)
+        if isinstance(self.__ip_network_list,_StringTable):
+            return list(self.__ip_network_list)
         return self.__ip_network_list
-    def add_ip(self,ipaddr_cidr:str)->bool:
+    def compaction_info(self)->namedtuple:
+        """Returns the result of the compaction of the current list as CompactionInfo(networks,compacted_networks,contained,merged): 
+        the number of valid networks before and after the compaction, the number of networks removed because they are 
+        contained in a network with the same payload, and the number of merges of 2 adjacent networks. Returns None if the 
+        parameter compact is False or if the list was opened from a binary snapshot."""
+        compaction = self.__compaction
+        if compaction is None:
+            return None
+        CompactionInfo = namedtuple("CompactionInfo", ["networks","compacted_networks","contained","merged"])
+        return CompactionInfo(*compaction[:4])
+    def get_original_cidrs(self,cidr:str)->List[str]:
+        """Returns the original CIDRs of a network of the compacted list (ex: the result of a check), in the order they were 
+        collapsed. A network that was not compacted returns itself, and a network that is not in the list returns an empty list."""
+        cidr = self.get_cidr_format(cidr)
+        if _parse_network(cidr) is None:
+            return []
+        with self._lock:
+            position = self.__ip_network_list_position(self.__ip_network_list,cidr)
+            if position >= len(self.__ip_network_list) or self.__ip_network_list[position] != cidr:
+                return []
+            compaction = self.__compaction
+        return list(compaction.origins.get(cidr,[cidr])) if compaction is not None else [cidr]
+    def __compaction_origins(self)->Union[dict,None]:
+        """Returns the original CIDRs of the current compaction, to keep them when the compacted list is prepared again."""
+        return self.__compaction.origins if self.__compaction is not None else None
+    def add_ip(self,ipaddr_cidr:str,action:int=0,limit:int=0,label:str="",lists:list=(),ttl:float=None)->bool:
         """Add an IP/CIDR to the accept list. 
         
+        Parameters :
+        - ipaddr_cidr (str): The IP address or the CIDR.
+        - action (int): The action code of the rule, from 0 to 255, returned by check_rule(). If the CIDR is already in the 
+          IP list, its action, limit and label are replaced. Default is 0.
+        - limit (int): The limit of the rule, from 0 to 4294967295, returned by check_rule(). Default is 0.
+        - label (str): The label of the rule, returned by check_rule(). Default is "".
+        - lists (list): The names of the named lists of the CIDR (see load_named_lists()). If the CIDR is already in the 
+          IP list, it is added to these lists. Default is ().
+        - ttl (float): The number of seconds before the CIDR is removed from the IP list (ex: a temporary ban). If the CIDR 
+          is already in the IP list with a TTL, its expiry time is replaced, and without ttl it becomes permanent. A CIDR 
+          already in the IP list without a TTL stays permanent (remove it first to add it with a TTL). Default is None (the 
+          CIDR never expires).
+        
         Returns :
-        - True if the IP/CIDR was added to the IP list 
-        - False if the IP/CIDR is invalid 
-        - None if the IP/CIDR already in the IP list.
+        - True if the IP/CIDR was added to the IP list (or to a named list, or got a new action, limit, label or expiry 
+          time, or became permanent)
+        - False if the IP/CIDR, the payload or the ttl is invalid 
+        - None if the IP/CIDR already in the IP list with the same rule.
         """
-        ipaddr_cidr = self.get_cidr_format(ipaddr_cidr)
-        if not self.is_valid_cidr(ipaddr_cidr):
+        if ttl is not None and (type(ttl) not in (int,float) or not 0 < ttl < float("inf")):
             return False
-        with self._lock:
-            self.__ip_network_list.append(ipaddr_cidr)
-            self.__update_ip_list()
-        return True
-    def remove_ip(self,ipaddr_cidr:str)->bool:
-        """Remove an IP/CIDR from the accept list. 
+        added, removed, invalid = self.__apply_batch([[ipaddr_cidr,action,limit,label,lists,time.time()+ttl if ttl is not None else 0]],[])
+        return False if invalid else (True if added else None)
+    def remove_ip(self,ipaddr_cidr:str,lists:list=None)->bool:
+        """Remove an IP/CIDR from the accept list. If lists is given, the IP/CIDR is only removed from these named lists, 
+        and it's removed from the IP list when it's no longer in any named list.
         
         Returns :
-        - True if the IP/CIDR was removed from the IP list 
+        - True if the IP/CIDR was removed from the IP list (or from a named list)
         - False if the IP/CIDR is invalid 
         - None if the IP/CIDR was not in the IP list.
         """
-        ipaddr_cidr = self.get_cidr_format(ipaddr_cidr)
-        if not self.is_valid_cidr(ipaddr_cidr):
-            return False
-        with self._lock:
-            if ipaddr_cidr in self.__ip_network_list:
-                self.__ip_network_list.remove(ipaddr_cidr)
-                self.__update_ip_list()
-                return True
-            return None
+        added, removed, invalid = self.__apply_batch([],[ipaddr_cidr if lists is None else [ipaddr_cidr,lists]])
+        return False if invalid else (True if removed else None)
+    def apply_changes(self,add_list:list=[],remove_list:list=[])->namedtuple:
+        """Apply a batch of changes to the accept list at once: the CIDRs of remove_list are removed first, then the CIDRs 
+        and rules [cidr,action,limit,label,lists,expires] of add_list are added (expires is the time.time() when the CIDR 
+        is removed, see add_ip()). An item [cidr,lists] of remove_list only removes the 
+        CIDR from these named lists. The index is copied once for the whole batch and each change only costs a binary 
+        search and the rebuild of its own intervals, so a batch of k changes is much faster than k calls of add_ip() and 
+        remove_ip(). The lookups see the whole batch at once. If a journal is open, the batch is appended to it as one 
+        record (see open_journal()).
+        
+        Returns ChangesInfo(added,removed,invalid): the number of CIDRs added (to the list or to a named list), the number of 
+        CIDRs removed (from the list or from a named list) and the number of invalid items. The CIDRs already in the list are 
+        not added again (a new rule or expiry time replaces theirs, and counts as added, see add_ip() for the expiry times), and the CIDRs not in the list are 
+        not removed."""
+        ChangesInfo = namedtuple("ChangesInfo", ["added","removed","invalid"])
+        return ChangesInfo(*self.__apply_batch(add_list,remove_list))
+    def __apply_batch(self,add_list:list,remove_list:list)->tuple:
+        """Apply and journal one batch of changes, and compact the journal if it's full."""
+        with self.__journal.lock:
+            with self._lock:
+                changes = self.__apply_changes([(add_list,remove_list)],journal=True)
+            self.__journal_compact_if_full()
+        return changes
     def load_ip_network_list(self,ip_network_list:List[str])->bool:
         """Load a new list of IPs from a variable of type List[str]. Individual IPs will be converted to CIDR /32 format.
         
@@ -225,10 +1464,11 @@ class FastAccessLimiter:
         - False if the IP list is invalid.
         """
         try:
+            # the new index is prepared aside, the lookups keep using the current one until it is published
+            new_index = self.__prepare_ip_list(ip_network_list)
             with self._lock:
-                self.__ip_network_list = ip_network_list
-                self.__update_ip_list()
-                return True
+                self.__publish(*new_index)
+            return True
         except:
             return False
     def extend_ip_network_list(self,ip_network_list:List[str])->bool:
@@ -240,26 +1480,36 @@ class FastAccessLimiter:
         """
         try:
             with self._lock:
-                self.__ip_network_list.extend(ip_network_list)
-                self.__update_ip_list()
+                self.__publish(*self.__prepare_ip_list(self.__rule_list(self.__index.ipv4,self.__index.ipv6,only_payloads=True)+list(ip_network_list),self.__compaction_origins()))
                 return True
         except:
             return False
-    def save_ip_network_list(self,json_filename:str,gzipped:bool=False,compresslevel:int=9,overwrite_if_exists:bool=True,raise_on_error:bool=False)->bool:
+    def save_ip_network_list(self,json_filename:str,gzipped:bool=False,compresslevel:int=9,overwrite_if_exists:bool=True,raise_on_error:bool=False,snapshot:bool=False)->bool:
         """Save the list of IPs to a file. 
         
         Parameters :
         - json_filename (str): The name of the file to save the IP list. If the file ends with .gz, it will be considered a gzipped file automatically.
+          The CIDRs with a payload are saved as lists [cidr,action,limit,label], the others as strings.
+          If the file ends with .bin, it will be considered a binary snapshot automatically.
         - gzipped (bool): Flag to save the file in gzipped format. Default is False.
         - compresslevel (int): The compression level of the gzipped file. Default is 9.
         - overwrite_if_exists (bool): Flag to overwrite the file if it already exists. Default is True.
         - raise_on_error (bool): Flag to raise an exception if an error occurs. Default is False.
+        - snapshot (bool): Flag to save the already validated and sorted index as a binary snapshot, that can be memory-mapped 
+          by open_ip_network_snapshot() without any parsing. A snapshot can't be gzipped. Default is False.
         
         Returns :
         - True if the IP list was saved to the file 
         - False if the file could not be saved. If raise_on_error is True, an exception will be raised.
         """
         try:
+            if snapshot or json_filename[-4:] == ".bin":
+                if not overwrite_if_exists and os.path.exists(json_filename):
+                    if raise_on_error:
+                        raise FileExistsError(f"The file {json_filename} already exists.") from None
+                    return False
+                self.__save_snapshot(json_filename)
+                return True
             if gzipped and json_filename[-3:] != ".gz":
                 json_filename += ".gz"
             elif json_filename[-3:] == ".gz":
@@ -268,19 +1518,30 @@ class FastAccessLimiter:
                 if raise_on_error:
                     raise FileExistsError(f"The file {json_filename} already exists.") from None
                 return False
+            with self._lock:
+                json_list = self.__rule_list(self.__index.ipv4,self.__index.ipv6,only_payloads=True)
             if gzipped:
                 with gzip.open(json_filename, "wb",compresslevel=compresslevel) as f:
-                    f.write(json.dumps(self.__ip_network_list,sort_keys=False,ensure_ascii=False,separators=(",",":")).encode())
+                    f.write(json.dumps(json_list,sort_keys=False,ensure_ascii=False,separators=(",",":")).encode())
             else:
                 with open(json_filename, "w") as f:
-                    f.write(json.dumps(self.__ip_network_list,sort_keys=False,ensure_ascii=False,separators=(",",":")))
+                    f.write(json.dumps(json_list,sort_keys=False,ensure_ascii=False,separators=(",",":")))
             return True
         except Exception as ERR:
             if raise_on_error:
                 raise ERR from None
             return False
-    def open_ip_network_list(self,json_filename:str,raise_on_error:bool=False)->bool:
-        """Open the list of IPs from a file. If the file ends with .gz, it will be considered a gzipped file automatically.
+    def open_ip_network_list(self,json_filename:str,raise_on_error:bool=False,file_format:str=None)->bool:
+        """Open the list of IPs from a file. If the file ends with .gz, .bz2 or .xz, it will be decompressed automatically.
+        If the file is a binary snapshot, it will be memory-mapped with open_ip_network_snapshot().
+        
+        The format of the file is given by file_format:
+        - "json": a JSON array of CIDRs and rules [cidr,action,limit,label], like the files of save_ip_network_list().
+        - "text": a line-based feed (ex: FireHOL netsets, Spamhaus DROP) with one CIDR or IP per line, the first word of 
+          each line is used and the comments that start with # or ; are discarded.
+        - "csv": a CSV file with the columns cidr[,action,limit,label].
+        - None (default): "csv" if the file name has .csv, otherwise "json" if the file starts with [ or "text".
+        The text and CSV files are read line by line and parsed as they are read, so the whole file is never in memory.
         
         Returns :
         - True if the IP list was opened from the file 
@@ -291,51 +1552,1539 @@ class FastAccessLimiter:
                 if raise_on_error:
                     raise FileNotFoundError(f"The file {json_filename} does not exist.") from None
                 return False
-            gzipped = True if json_filename[-3:] == ".gz" else False
-            if gzipped:
-                with gzip.open(json_filename, "rb") as f:
-                    self.__ip_network_list = json.loads(f.read().decode())
-            else:
-                with open(json_filename, "r") as f:
-                    self.__ip_network_list = json.loads(f.read())
-            self.__update_ip_list()
+            with open(json_filename, "rb") as f:
+                if f.read(len(_SNAPSHOT_MAGIC)) == _SNAPSHOT_MAGIC:
+                    return self.open_ip_network_snapshot(json_filename,raise_on_error=raise_on_error)
+            if file_format is None and ".csv" in os.path.basename(json_filename).lower():
+                file_format = "csv"
+            with _open_text_file(json_filename) as f:
+                first_char = f.read(1)
+                while first_char.isspace():
+                    first_char = f.read(1)
+                if file_format is None:
+                    file_format = "json" if first_char == "[" else "text"
+                if file_format == "json":
+                    new_index = self.__prepare_ip_list(json.loads(first_char+f.read()))
+                elif file_format in ("text","csv"):
+                    lines = itertools.chain([first_char+f.readline()],f)
+                    new_index = self.__prepare_ip_list(_read_feed(lines) if file_format == "text" else _read_csv(lines))
+                else:
+                    raise ValueError(f"Unknown file format {file_format}.")
+            with self._lock:
+                self.__publish(*new_index)
             return True
         except Exception as ERR:
             if raise_on_error:
                 raise ERR from None
             return False
-    def __update_ip_list(self):
-        self.__ip_network_list, self.__ip_network_list_first_iplong, self.__ip_network_list_last_iplong = self.__prepare_ip_list(self.__ip_network_list)
+    def open_ip_network_snapshot(self,snapshot_filename:str,raise_on_error:bool=False)->bool:
+        """Open a binary snapshot saved by save_ip_network_list(snapshot=True). The file is memory-mapped read-only and the 
+        lookups are served straight from the mapped pages, without parsing or copying anything, so all the processes 
+        that open the same snapshot (ex: forked workers) share the same memory. The index is copied to memory only if 
+        the IP list is changed later (add_ip, remove_ip, ...).
+        
+        Returns :
+        - True if the snapshot was opened
+        - False if the snapshot could not be opened. If raise_on_error is True, an exception will be raised.
+        """
+        try:
+            start_time = time.monotonic()
+            with open(snapshot_filename, "rb") as f:
+                snapshot = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+            new_index = self.__snapshot_index(memoryview(snapshot),f"the file {snapshot_filename}")
+            with self._lock:
+                self.__publish(*new_index)
+            self.__debug(f"Elapsed time to open the snapshot {snapshot_filename}: {time.monotonic()-start_time:.9f} seconds")
+            return True
+        except Exception as ERR:
+            if raise_on_error:
+                raise ERR from None
+            return False
+    def __snapshot_index(self,buffer:memoryview,source:str)->tuple:
+        """Returns the (ip_network_list,ipv4_index,ipv6_index) of a binary snapshot as views of the buffer, without copying anything."""
+        magic, version = struct.unpack_from("=8sI",buffer,0)
+        if magic != _SNAPSHOT_MAGIC:
+            raise ValueError(f"The {source} is not a FastAccessLimiter snapshot.")
+        if version != _SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version} in the {source}.")
+        magic, version, byteorder, *counts, list_count, blob_size = _SNAPSHOT_HEADER.unpack_from(buffer,0)
+        # a snapshot saved in a machine with another byte order is copied to arrays and swapped
+        swapped = (byteorder != _SNAPSHOT_BYTEORDER)
+        position, sections = _SNAPSHOT_HEADER.size, {}
+        def read_section(typecode:str,length:int):
+            nonlocal position
+            size = array(typecode).itemsize*length
+            section = buffer[position:position+size]
+            position += -(-size // 8)*8
+            if swapped:
+                section = array(typecode,bytes(section))
+                section.byteswap()
+                return section
+            return section.cast(typecode)
+        for family, interval_count, cidr_count in ((4,counts[0],counts[1]),(6,counts[2],counts[3])):
+            sections[family] = [read_section(typecode,cidr_count if name in _SNAPSHOT_SLOT_SECTIONS else interval_count) for name, typecode in _SNAPSHOT_SECTIONS[family]]
+        # the string table has the CIDRs of both families followed by their labels and by the names of the named lists
+        cidr_count = counts[1]+counts[3]
+        offsets = read_section("Q",cidr_count*2+list_count+1)
+        cidr_table = _StringTable(offsets,buffer[position:position+blob_size],0,cidr_count)
+        # the bits of the named lists of the snapshot are mapped to the bits of this object, the lists are copied only if they differ
+        list_bits = [self.__list_mask((name,)).bit_length()-1 for name in _StringTable(offsets,cidr_table.blob,cidr_count*2,cidr_count*2+list_count)]
+        if list_bits != list(range(list_count)):
+            for family in (4,6):
+                lists_section = [name for name, typecode in _SNAPSHOT_SECTIONS[family]].index("lists")
+                sections[family][lists_section] = array("Q",[sum(1 << list_bits[bit] for bit in range(list_count) if lists >> bit & 1) for lists in sections[family][lists_section]])
+        ipv4_index = _IPv4Index(*sections[4][:3],_StringTable(offsets,cidr_table.blob,0,counts[1]),*sections[4][3:],
+                                _StringTable(offsets,cidr_table.blob,cidr_count,cidr_count+counts[1]),[])
+        ipv6_index = _IPv6Index(*sections[6][:5],_StringTable(offsets,cidr_table.blob,counts[1],cidr_count),*sections[6][5:],
+                                _StringTable(offsets,cidr_table.blob,cidr_count+counts[1],cidr_count*2),[])
+        return cidr_table, ipv4_index, ipv6_index
+    def __save_snapshot(self,snapshot_filename:str):
+        """Write the index as a binary snapshot. The snapshot is written to a temporary file that replaces the file, because 
+        the processes that opened the previous snapshot (this one included) still have its pages memory-mapped. Rewriting 
+        the mapped file in place would crash them with SIGBUS. The temporary file is unique per thread."""
+        temp_filename = f"{snapshot_filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_filename, "wb") as f:
+                f.writelines(self.__snapshot_chunks())
+            os.replace(temp_filename,snapshot_filename)
+        finally:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+    def __snapshot_chunks(self)->list:
+        """Returns the index as the list of byte strings of a binary snapshot. The CIDR slots are renumbered to their 
+        positions in the sorted ip_network_list."""
+        with self._lock:
+            ipv4_index, ipv6_index, generation, ip_network_list = self.__index
+            ip_network_list = list(ip_network_list)
+        position_dict = {cidr:position for position, cidr in enumerate(ip_network_list)}
+        ipv4_count = len(ipv4_index.cidr)-len(ipv4_index.free)
+        sections, label_list = [], []
+        for family, index, base in ((4,ipv4_index,0),(6,ipv6_index,ipv4_count)):
+            # slot_map gives the new slot of each slot, and slot_order the slot of each new slot
+            free = set(index.free)
+            slot_map = [position_dict[cidr]-base if slot not in free else -1 for slot, cidr in enumerate(index.cidr)]
+            slot_order = [0]*(len(index.cidr)-len(free))
+            for slot, new_slot in enumerate(slot_map):
+                if new_slot >= 0:
+                    slot_order[new_slot] = slot
+            for name, typecode in _SNAPSHOT_SECTIONS[family]:
+                if name == "rule":
+                    sections.append(array("I",[slot_map[slot] for slot in index.rule]))
+                elif name == "parent":
+                    sections.append(array("i",[slot_map[index.parent[slot]] if index.parent[slot] >= 0 else -1 for slot in slot_order]))
+                elif name in _SNAPSHOT_SLOT_SECTIONS:
+                    sections.append(array(typecode,[getattr(index,name)[slot] for slot in slot_order]))
+                else:
+                    sections.append(array(typecode,getattr(index,name)))
+            label_list.extend(index.label[slot] for slot in slot_order)
+        list_names = list(self.__list_names)
+        offsets, strings = array("Q",[0]), [string.encode() for string in itertools.chain(ip_network_list,label_list,list_names)]
+        for string in strings:
+            offsets.append(offsets[-1]+len(string))
+        blob = b"".join(strings)
+        chunks = [_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC,_SNAPSHOT_VERSION,_SNAPSHOT_BYTEORDER,len(ipv4_index.rule),ipv4_count,
+                                        len(ipv6_index.rule),len(ip_network_list)-ipv4_count,len(list_names),len(blob))]
+        for section in sections+[offsets]:
+            data = section.tobytes()
+            chunks.append(data+bytes(-len(data) % 8))
+        chunks.append(blob)
+        return chunks
+    def __rule_list(self,ipv4_index:_IPv4Index,ipv6_index:_IPv6Index,only_payloads:bool=False)->list:
+        """Returns the list of Rule(cidr,action,limit,label) of the given indexes in the order of the ip_network_list. Must be called 
+        with the lock held. If only_payloads is True, the CIDRs and their payloads are returned like in the saved JSON files 
+        (see _rule_item), with the names of their named lists."""
+        slot_dict = {}
+        for index in (ipv4_index,ipv6_index):
+            free = set(index.free)
+            slot_dict.update({cidr:(index,slot) for slot, cidr in enumerate(index.cidr) if slot not in free})
+        if only_payloads:
+            return [_rule_item(cidr,(index.action[slot],index.limit[slot],index.label[slot],self.__list_names_of(index.lists[slot]),index.expires[slot]))
+                    for cidr, (index, slot) in zip(self.__ip_network_list,map(slot_dict.get,self.__ip_network_list))]
+        return [Rule(cidr,index.action[slot],index.limit[slot],index.label[slot]) for cidr, (index, slot) in zip(self.__ip_network_list,map(slot_dict.get,self.__ip_network_list))]
+    def __publish(self,ip_network_list:list,ipv4_index:_IPv4Index,ipv6_index:_IPv6Index,compaction:_Compaction=None,invalidate:list=None):
+        """Publish a new index with one reference assignment. Must be called with the lock held. The lookups read the 
+        index once, so they see either the previous or the new generation, never a mix of both. The cache is cleared, 
+        or only the IPs of the changed CIDRs are removed if invalidate=[(version,first,last),...] is given. 
+        A new list replaces the result of the compaction and the expiry times, a change of some CIDRs (invalidate) keeps them."""
+        self.__ip_network_list = ip_network_list
+        self.__index = _Index(self.__with_jump_table(ipv4_index,invalidate),ipv6_index,self.__index.generation+1,ip_network_list)
+        if invalidate is None:
+            self.__compaction = compaction
+            self.__cache_reset(self.__index.generation)
+            self.__expiry_schedule(self.__expiry_entries(ipv4_index,ipv6_index),replace=True)
+        else:
+            self.__cache_invalidate(invalidate,self.__index.generation)
+    def __with_jump_table(self,ipv4_index:_IPv4Index,invalidate:list=None)->_IPv4Index:
+        """Returns the IPv4 index with its first-level table if ipv4_jump_table is True. The table of the published index is 
+        updated only around the changed CIDRs if invalidate=[(version,first,last),...] is given, otherwise it's built again."""
+        if not self.__ipv4_jump_table:
+            return ipv4_index
+        if invalidate is not None and self.__index.ipv4.jump is not None:
+            return ipv4_index._replace(jump=_ipv4_jump_table_update(self.__index.ipv4.jump,ipv4_index.first,[(first,last) for version, first, last in invalidate if version == 4]))
+        return ipv4_index._replace(jump=_ipv4_jump_table(ipv4_index.first))
+    def __publish_changes(self,ipv4_index:_IPv4Index,ipv6_index:_IPv6Index,invalidate:list):
+        """Publish the indexes changed by add_ip, remove_ip or apply_changes with the current ip_network_list. Must be called 
+        with the lock held. If the removed CIDRs left too many free slots, the whole index is rebuilt to release them."""
+        if any(len(index.free) > max(_FREE_SLOTS_MIN_REBUILD,len(index.cidr) // 2) for index in (ipv4_index,ipv6_index)):
+            self.__publish(*self.__prepare_ip_list(self.__rule_list(ipv4_index,ipv6_index,only_payloads=True),self.__compaction_origins()))
+        else:
+            self.__publish(self.__ip_network_list,ipv4_index,ipv6_index,invalidate=invalidate)
+    def __apply_changes(self,batches:list,journal:bool=False)->tuple:
+        """Apply the batches of changes (add_list,remove_list) in order to a private copy of the indexes, that is published 
+        once. A single change (ex: add_ip or remove_ip) builds the new index by copy on write instead, so it only copies the 
+        arrays it changes. Must be called with the lock held. The net changes of all the batches are applied to the 
+        ip_network_list at once. If journal is True, the changes that were applied are appended to the journal before they 
+        are published.
+        
+        Returns the number of CIDRs added, the number of CIDRs removed and the number of invalid items."""
+        start_time = time.monotonic()
+        self.__materialize()
+        ipv4_index, ipv6_index, generation, ip_network_list = self.__index
+        # the private copy of each family is made on its first change. added and removed are the net changes of the 
+        # ip_network_list by network, a change of the named lists of a CIDR that stays in the list is not in them
+        indexes, added, removed, invalidate, journal_add, journal_remove, expiry_entries = {4:None,6:None}, {}, {}, [], [], [], []
+        in_place = sum(len(add_list)+len(remove_list) for add_list, remove_list in batches) > 1
+        added_count = removed_count = invalid_count = 0
+        for add_list, remove_list in batches:
+            for item in remove_list:
+                try:
+                    cidr, names = (item,None) if isinstance(item,str) else (item[0],item[1])
+                    cidr = self.get_cidr_format(cidr)
+                    network = _parse_network(cidr) if names is None or _parse_payload(lists=names) is not None else None
+                except (TypeError,IndexError,KeyError,AttributeError):
+                    network = None
+                if network is None:
+                    invalid_count += 1
+                    continue
+                version, first, last, prefixlen = network
+                if indexes[version] is None:
+                    index = ipv4_index if version == 4 else ipv6_index
+                    indexes[version] = _copy_index(index) if in_place else index
+                free_count = len(indexes[version].free)
+                index = self.__index_remove(indexes[version],first,last,prefixlen,in_place,None if names is None else self.__list_mask(names,register=False))
+                if index is None:
+                    continue
+                indexes[version] = index
+                journal_remove.append(cidr if names is None else [cidr,list(names)])
+                if len(indexes[version].free) > free_count and added.pop((version,first,prefixlen),None) is None:
+                    removed[(version,first,prefixlen)] = cidr
+                invalidate.append((version,first,last))
+                removed_count += 1
+            for item in add_list:
+                try:
+                    cidr, payload = (item,_DEFAULT_PAYLOAD) if isinstance(item,str) else (item[0],_parse_payload(*item[1:]))
+                    cidr = self.get_cidr_format(cidr)
+                    network = _parse_network(cidr)
+                except (TypeError,IndexError,KeyError,AttributeError):
+                    network = payload = None
+                if network is None or payload is None:
+                    invalid_count += 1
+                    continue
+                version, first, last, prefixlen = network
+                if indexes[version] is None:
+                    index = ipv4_index if version == 4 else ipv6_index
+                    indexes[version] = _copy_index(index) if in_place else index
+                slot_count = len(indexes[version].cidr)
+                index = self.__index_add(indexes[version],first,last,prefixlen,cidr,payload,in_place)
+                if index is None:
+                    continue
+                indexes[version] = index
+                journal_add.append(_rule_item(cidr,payload))
+                if payload[4]:
+                    expiry_entries.append((payload[4],cidr))
+                if len(indexes[version].cidr) > slot_count:
+                    added[(version,first,prefixlen)] = cidr
+                invalidate.append((version,first,last))
+                added_count += 1
+        if not invalidate:
+            return added_count, removed_count, invalid_count
+        if journal:
+            self.__journal_write(journal_add,journal_remove)
+        if added or removed:
+            self.__list_version += 1
+            try:
+                self.__ip_network_list = self.__ip_network_list_merge(self.__ip_network_list,list(added.values()),list(removed.values()))
+                self.__publish_changes(indexes[4] or ipv4_index,indexes[6] or ipv6_index,invalidate)
+            finally:
+                self.__list_version += 1
+        else:
+            self.__publish_changes(indexes[4] or ipv4_index,indexes[6] or ipv6_index,invalidate)
+        self.__expiry_schedule(expiry_entries)
+        self.__build_info.updates, self.__build_info.update_duration = self.__build_info.updates+1, time.monotonic()-start_time
+        return added_count, removed_count, invalid_count
+    def __ip_network_list_merge(self,ip_network_list:list,added_list:list,removed_list:list)->list:
+        """Returns the sorted ip_network_list without the CIDRs of removed_list and with the CIDRs of added_list. The 
+        positions are found by binary search. A few changes are applied to the list in place from its end, so each one 
+        only moves the items after it and the list is never copied. Many changes are merged into a new list instead."""
+        inserts = sorted((self.__ip_network_list_position(ip_network_list,cidr),0,self.__network_sort_key(cidr),cidr) for cidr in added_list)
+        deletes = sorted((self.__ip_network_list_position(ip_network_list,cidr),1,None,None) for cidr in removed_list)
+        # an insert comes before the delete of the same position: it goes before the deleted CIDR (ex: a CIDR added again)
+        changes = list(heapq.merge(inserts,deletes))
+        if len(changes) < _LIST_MERGE_MIN_CHANGES:
+            for position, delete, network_key, cidr in reversed(changes):
+                if delete:
+                    del ip_network_list[position]
+                else:
+                    ip_network_list.insert(position,cidr)
+            return ip_network_list
+        # one pass over the old list: the items between two changes are taken from the same iterator, without a slice
+        new_list, items, cursor = [], iter(ip_network_list), 0
+        for position, delete, network_key, cidr in changes:
+            new_list.extend(itertools.islice(items,position-cursor))
+            if delete:
+                next(items)
+                cursor = position+1
+            else:
+                cursor = position
+                new_list.append(cidr)
+        new_list.extend(items)
+        return new_list
+    def __materialize(self):
+        """Copy a memory-mapped index to arrays and lists in memory before changing it. The lookups are the same, 
+        so the generation is kept."""
+        ipv4_index, ipv6_index, generation, ip_network_list = self.__index
+        if isinstance(self.__ip_network_list,_StringTable):
+            ipv4_index = _IPv4Index(*[array(typecode,bytes(getattr(ipv4_index,name))) for name, typecode in _SNAPSHOT_SECTIONS[4][:3]],list(ipv4_index.cidr),
+                                    *[array(typecode,bytes(getattr(ipv4_index,name))) for name, typecode in _SNAPSHOT_SECTIONS[4][3:]],list(ipv4_index.label),[],ipv4_index.jump)
+            ipv6_index = _IPv6Index(*[array(typecode,bytes(getattr(ipv6_index,name))) for name, typecode in _SNAPSHOT_SECTIONS[6][:5]],list(ipv6_index.cidr),
+                                    *[array(typecode,bytes(getattr(ipv6_index,name))) for name, typecode in _SNAPSHOT_SECTIONS[6][5:]],list(ipv6_index.label),[])
+            self.__ip_network_list = list(self.__ip_network_list)
+            self.__index = _Index(ipv4_index,ipv6_index,generation,self.__ip_network_list)
+    def __ip_network_list_position(self,ip_network_list:list,cidr:str)->int:
+        """Binary search of the position of a CIDR in the sorted ip_network_list, without sorting the list again."""
+        network_key = self.__network_sort_key(cidr)
+        low, high = 0, len(ip_network_list)
+        while low < high:
+            middle = (low+high) // 2
+            if self.__network_sort_key(ip_network_list[middle]) < network_key:
+                low = middle+1
+            else:
+                high = middle
+        return low
+    def __network_sort_key(self,cidr:str)->tuple:
+        version, first, last, prefixlen = _parse_network(cidr)
+        return (version,first,prefixlen)
+    def __index_add(self,index,first:int,last:int,prefixlen:int,cidr:str,payload:tuple,in_place:bool=False):
+        """Returns a new index with the CIDR inserted. Only the intervals between first and last are rebuilt: the intervals of less 
+        specific CIDRs are taken over by the new CIDR, the intervals of more specific CIDRs are kept and the gaps are filled. 
+        The given index is not changed, only the new slot is appended to its CIDR table and to the arrays of the slots, 
+        unless in_place is True (a private copy of the index, see _copy_index). If the CIDR is already in the index, its action, limit and label are replaced, 
+        its new named lists are added, and if it has an expiry time, it's replaced by the expiry time of the payload (0 makes 
+        it permanent). A permanent CIDR stays permanent.
+        
+        Returns None if the CIDR is already in the index with the same rule, in all the named lists of the payload and with 
+        the same expiry time."""
+        position = index.search(first)
+        covering_rule = index.rule[position] if position >= 0 and index.interval(position)[1] >= first else -1
+        # the parent is the most specific CIDR that covers the first IP and is not more specific than the new CIDR
+        parent = covering_rule
+        while parent >= 0 and index.prefixlen[parent] > prefixlen:
+            parent = index.parent[parent]
+        if parent >= 0 and index.prefixlen[parent] == prefixlen:
+            lists = self.__list_mask(payload[3])
+            rule_changed = (index.action[parent],index.limit[parent],index.label[parent]) != payload[:3]
+            # a CIDR added again without an expiry time becomes permanent, and a permanent CIDR is never made temporary
+            expires = payload[4] if index.expires[parent] else 0
+            if not rule_changed and lists & ~index.lists[parent] == 0 and expires == index.expires[parent]:
+                return None
+            if rule_changed:
+                index = self.__index_set_rule(index,parent,payload,in_place)
+            if expires != index.expires[parent]:
+                index = self.__index_set_expires(index,parent,expires,in_place)
+            if lists & ~index.lists[parent]:
+                index = self.__index_set_lists(index,parent,index.lists[parent] | lists,in_place)
+            return index
+        lists = self.__list_mask(payload[3])
+        slot = len(index.cidr)
+        index.cidr.append(cidr), index.label.append(payload[2])
+        # like the CIDR table, the arrays of the slots are appended even if the index is published: the lookups of the 
+        # given index never read the new slot. Only the parents of existing slots change, so only they are copied
+        prefixlen_array, action_array, limit_array, lists_array, expires_array = index.prefixlen, index.action, index.limit, index.lists, index.expires
+        parent_array = index.parent if in_place else array('i',index.parent)
+        prefixlen_array.append(prefixlen), parent_array.append(parent), action_array.append(payload[0]), limit_array.append(payload[1]), lists_array.append(lists)
+        expires_array.append(payload[4])
+        start, stop = (position if covering_rule >= 0 else position+1), index.search(last)+1
+        intervals, cursor, reparented = ([],[],[]), first, set()
+        for position in range(start,stop):
+            interval_first, interval_last = index.interval(position)
+            rule = index.rule[position]
+            if interval_first < first:
+                _append_interval(intervals,interval_first,first-1,rule)
+            if interval_first > cursor:
+                _append_interval(intervals,cursor,interval_first-1,slot)
+            if index.prefixlen[rule] < prefixlen:
+                _append_interval(intervals,max(interval_first,first),min(interval_last,last),slot)
+            else:
+                _append_interval(intervals,max(interval_first,first),min(interval_last,last),rule)
+                # the outermost CIDR inside the new CIDR becomes its child
+                if rule not in reparented:
+                    reparented.add(rule)
+                    while parent_array[rule] >= 0 and prefixlen_array[parent_array[rule]] > prefixlen:
+                        rule = parent_array[rule]
+                    parent_array[rule] = slot
+            if interval_last > last:
+                _append_interval(intervals,last+1,interval_last,index.rule[position])
+            cursor = min(interval_last,last)+1
+        if cursor <= last:
+            _append_interval(intervals,cursor,last,slot)
+        if in_place:
+            return index.splice_in_place(start,stop,*intervals)
+        return index.splice(start,stop,*intervals)._replace(parent=parent_array)
+    def __index_remove(self,index,first:int,last:int,prefixlen:int,in_place:bool=False,lists:int=None):
+        """Returns a new index without the CIDR. Its intervals are given back to its parent (or dropped if it has no 
+        parent) and its children are attached to its parent. Only the intervals between first and last are rebuilt. 
+        The slot of the CIDR is added to the free slots and is kept in the CIDR table for the lookups of the older index.
+        With in_place, the given index is changed instead (a private copy of the index, see _copy_index). If lists (a 
+        bitset of named lists) is given, the CIDR is only removed from these lists while it's in other named lists.
+        
+        Returns None if the CIDR is not in the index (or in none of the given named lists)."""
+        position = index.search(first)
+        if position < 0 or index.interval(position)[1] < first:
+            return None
+        slot = index.rule[position]
+        while slot >= 0 and index.prefixlen[slot] > prefixlen:
+            slot = index.parent[slot]
+        if slot < 0 or index.prefixlen[slot] != prefixlen:
+            return None
+        if lists is not None:
+            if index.lists[slot] & lists == 0:
+                return None
+            if index.lists[slot] & ~lists:
+                return self.__index_set_lists(index,slot,index.lists[slot] & ~lists,in_place)
+        parent_array = index.parent if in_place else array('i',index.parent)
+        parent = parent_array[slot]
+        # include the neighbour intervals, so the intervals given back to the parent can be merged with them
+        start, stop = max(position-1,0), min(index.search(last)+2,len(index.rule))
+        intervals, reparented = ([],[],[]), set()
+        for position in range(start,stop):
+            interval_first, interval_last = index.interval(position)
+            rule = index.rule[position]
+            if rule == slot:
+                if parent < 0:
+                    continue
+                rule = parent
+            elif first <= interval_first and interval_last <= last:
+                # walk up to the child of the removed CIDR, stopping at the CIDRs that were already visited
+                child = rule
+                while child not in reparented and parent_array[child] != slot:
+                    reparented.add(child)
+                    child = parent_array[child]
+                if child not in reparented:
+                    reparented.add(child)
+                    parent_array[child] = parent
+            _append_interval(intervals,interval_first,interval_last,rule)
+        parent_array[slot] = -1
+        if in_place:
+            index.free.append(slot)
+            return index.splice_in_place(start,stop,*intervals)
+        return index.splice(start,stop,*intervals)._replace(parent=parent_array,free=index.free+[slot])
+    def __index_set_lists(self,index,slot:int,lists:int,in_place:bool=False):
+        """Returns a new index with the bitset of named lists of a CIDR replaced. With in_place, the given index is changed instead."""
+        if in_place:
+            index.lists[slot] = lists
+            return index
+        lists_array = array('Q',index.lists)
+        lists_array[slot] = lists
+        return index._replace(lists=lists_array)
+    def __index_set_rule(self,index,slot:int,payload:tuple,in_place:bool=False):
+        """Returns a new index with the action, the limit and the label of a CIDR replaced. With in_place, the given index is changed instead."""
+        if in_place:
+            index.action[slot], index.limit[slot], index.label[slot] = payload[:3]
+            return index
+        action_array, limit_array, label_list = array('B',index.action), array('I',index.limit), list(index.label)
+        action_array[slot], limit_array[slot], label_list[slot] = payload[:3]
+        return index._replace(action=action_array,limit=limit_array,label=label_list)
+    def __index_set_expires(self,index,slot:int,expires:float,in_place:bool=False):
+        """Returns a new index with the expiry time of a CIDR replaced. With in_place, the given index is changed instead."""
+        if in_place:
+            index.expires[slot] = expires
+            return index
+        expires_array = array('d',index.expires)
+        expires_array[slot] = expires
+        return index._replace(expires=expires_array)
     ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
     ##──── CHECK IP ACCESS ───────────────────────────────────────────────────────────────────────────────────────────────────────────
-    def __check_iplong_access(self,iplong)->bool:
-        """Check if the IP address is in the IP/CIDR list.
+    def __cache_reset(self,generation:int):
+        """Discard all the cached results and move the caches to the given generation. The lru caches are replaced by 
+        new ones when the checks are bound again."""
+        if self.__cache_policy == "lru":
+            self.__ipv4_cache.generation = self.__ipv6_cache.generation = generation
+            self.__bind_checks()
+        else:
+            self.__ipv4_cache.reset(generation)
+            self.__ipv6_cache.reset(generation)
+    def __cache_invalidate(self,ranges:list,generation:int):
+        """Remove from the cache only the IPs inside the given ranges (version,first,last), with one pass over each cache, 
+        and move the caches to the new generation. The lru caches can't remove an IP, they are reset."""
+        if self.__cache_policy == "lru":
+            return self.__cache_reset(generation)
+        for version, cache in ((4,self.__ipv4_cache),(6,self.__ipv6_cache)):
+            version_ranges = sorted((first,last) for range_version, first, last in ranges if range_version == version)
+            if not version_ranges or not len(cache):
+                cache.generation = generation
+                continue
+            # an IP is inside a range if the greatest last IP of the ranges that start at or before it is not below it
+            first_list, last_list = [first for first, last in version_ranges], list(itertools.accumulate((last for first, last in version_ranges),max))
+            for iplong in list(cache):
+                position = bisect.bisect_right(first_list,iplong)-1
+                if position >= 0 and iplong <= last_list[position]:
+                    cache.pop(iplong)
+            cache.generation = generation
+    def __check_ipv4_cached(self,iplong:int)->Union[str,bool]:
+        cache = self.__ipv4_cache
+        # get() instead of catching a KeyError: a miss (ex: a scan of random IPs) doesn't pay for an exception
+        result = cache.protected.get(iplong,_NOT_CACHED)
+        if result is not _NOT_CACHED:
+            try:
+                cache.protected.move_to_end(iplong)
+            except KeyError:
+                pass
+            cache.hits += 1
+            return result
+        return self.__cache_miss(cache,iplong,self.__check_ipv4_access)
+    def __check_ipv6_cached(self,iplong:int)->Union[str,bool]:
+        cache = self.__ipv6_cache
+        # get() instead of catching a KeyError: a miss (ex: a scan of random IPs) doesn't pay for an exception
+        result = cache.protected.get(iplong,_NOT_CACHED)
+        if result is not _NOT_CACHED:
+            try:
+                cache.protected.move_to_end(iplong)
+            except KeyError:
+                pass
+            cache.hits += 1
+            return result
+        return self.__cache_miss(cache,iplong,self.__check_ipv6_access)
+    def __cache_miss(self,cache:_LookupCache,iplong:int,check_function)->Union[str,bool]:
+        """The IP is not in the protected segment: move it there if it's in the probation segment, otherwise check it and 
+        save the result in the probation segment."""
+        result = cache.promote(iplong)
+        if result is not _NOT_CACHED:
+            cache.hits += 1
+            return result
+        generation = self.__index.generation
+        result = check_function(iplong)
+        cache.misses += 1
+        # don't save the result if the list was changed during the check
+        if generation == cache.generation:
+            cache.admit(iplong,result)
+        return result
+    def cache_info(self)->namedtuple:
+        """Get the state of the lookup cache as a namedtuple with the hits, misses, hit_ratio (hits/(hits+misses), 0.0 before the 
+        first check), size (the number of cached IPs of both address families), max_size and generation (the generation of 
+        the index, incremented on each change of the list). The counters are not reset when the list changes."""
+        CacheInfo = namedtuple("CacheInfo", ["hits","misses","hit_ratio","size","max_size","generation"])
+        hits, misses = self.__ipv4_cache.hits+self.__ipv6_cache.hits, self.__ipv4_cache.misses+self.__ipv6_cache.misses
+        return CacheInfo(hits,misses,hits/(hits+misses) if hits+misses > 0 else 0.0,len(self.__ipv4_cache)+len(self.__ipv6_cache),
+                         max(self.__cache_size,0)*2,self.__index.generation)
+    def __check_ipv4_access(self,iplong:int)->Union[str,bool]:
+        """Check if the IPv4 address (as integer) is in the IPv4 index.
         
         Returns :
         - The CIDR of the network if the IP is in the IP list
         - False if the IP is not in the IP list OR if the IP list is empty.
         """
-        if self.__ip_network_list == []:
+        index = self.__index.ipv4
+        match_list_index = bisect.bisect_right(index.first, iplong)-1
+        if match_list_index >= 0 and iplong <= index.last[match_list_index]:
+            return index.cidr[index.rule[match_list_index]]
+        return False
+    def __check_ipv4_access_jump(self,iplong:int)->Union[str,bool]:
+        """Check if the IPv4 address (as integer) is in the IPv4 index, starting from the first-level table of the index. The 
+        binary search is done only among the intervals that start inside the /16 of the address, and it's skipped if no 
+        interval starts there."""
+        index = self.__index.ipv4
+        jump, bucket = index.jump, iplong >> 16
+        # an integer out of the IPv4 range has no item in the table, and no IPv4 network contains it
+        if not 0 <= bucket <= 0xFFFF:
             return False
-        match_list_index = bisect.bisect_right(self.__ip_network_list_first_iplong, iplong)-1
+        low, high = jump[bucket], jump[bucket+1]
+        match_list_index = (bisect.bisect_right(index.first, iplong, low, high) if low < high else low)-1
+        if match_list_index >= 0 and iplong <= index.last[match_list_index]:
+            return index.cidr[index.rule[match_list_index]]
+        return False
+    def __check_ipv6_access(self,iplong:int)->Union[str,bool]:
+        """Check if the IPv6 address (as integer) is in the IPv6 index. The 128-bit address is split in 2 halves of 64 bits and 
+        only the high half is searched, with one binary search. The low half is compared only when the /64 of the address 
+        holds the first or the last IP of an interval, that is only with networks longer than /64 (see _IPv6Index).
+        
+        Returns :
+        - The CIDR of the network if the IP is in the IP list
+        - False if the IP is not in the IP list OR if the IP list is empty.
+        """
+        index = self.__index.ipv6
+        iplong_hi = iplong >> 64
+        match_list_index = bisect.bisect_right(index.first_hi, iplong_hi)-1
+        if match_list_index < 0:
+            return False
+        if index.first_hi[match_list_index] == iplong_hi and (iplong & _MASK64) < index.first_lo[match_list_index]:
+            # the interval starts after the address inside its /64: search the intervals that start inside this /64
+            match_list_index = bisect.bisect_right(index.first_lo, iplong & _MASK64, bisect.bisect_left(index.first_hi, iplong_hi, 0, match_list_index), match_list_index)-1
+            if match_list_index < 0:
+                return False
+        last_hi = index.last_hi[match_list_index]
+        if iplong_hi < last_hi or (iplong_hi == last_hi and (iplong & _MASK64) <= index.last_lo[match_list_index]):
+            return index.cidr[index.rule[match_list_index]]
+        return False
+    def __check_ipv4_lists(self,iplong:int)->Union[str,tuple,bool]:
+        """Check if the IPv4 address (as integer) is in the named lists. Returns the result of __list_result() or False."""
+        index = self.__index.ipv4
+        match_list_index = index.search(iplong)
+        if match_list_index >= 0 and iplong <= index.last[match_list_index]:
+            return self.__list_result(_index_lists(index,index.rule[match_list_index]))
+        return False
+    def __check_ipv6_lists(self,iplong:int)->Union[str,tuple,bool]:
+        """Check if the IPv6 address (as integer) is in the named lists. Returns the result of __list_result() or False."""
+        index = self.__index.ipv6
+        match_list_index = index.search(iplong)
+        if match_list_index >= 0 and iplong <= index.interval(match_list_index)[1]:
+            return self.__list_result(_index_lists(index,index.rule[match_list_index]))
+        return False
+    def __list_result(self,bitset:int)->Union[str,tuple,bool]:
+        """Returns the names of the named lists of a bitset, or the first of them in the precedence, or False if the bitset is 
+        empty. The result of each bitset is computed once."""
         try:
-            result = (iplong >= self.__ip_network_list_first_iplong[match_list_index]) and (iplong <= self.__ip_network_list_last_iplong[match_list_index])
-            if result:
-                return self.__ip_network_list[match_list_index] 
+            return self.__list_results[bitset]
+        except KeyError:
+            names = self.__list_names_of(bitset)
+            if names and self.__precedence is not None:
+                result = next((name for name in self.__precedence if name in names),names[0])
             else:
-                return False
-        except:
-            return False
+                result = names or False
+            self.__list_results[bitset] = result
+            return result
     def __call__(self,ipaddr:str)->bool:
         """Check if the IP address is in the IP/CIDR list.
         
         Returns :
         - The CIDR of the network if the IP is in the IP list
+        - With named lists, a tuple with the names of the lists that contain the IP, or the name of the first of these lists 
+          in the precedence if it's given (see load_named_lists())
+        - A RateLimited with the client network if the IP is not in the IP list and exceeded the rate limit (see the rate_limit parameter)
         - False if the IP is not in the IP list OR if the IP list is empty.
         """
-        iplong = self.ip2int(ipaddr)
-        result = self.__check_iplong_access(iplong)
+        # the key of the statistics, with the conversions of ip2int(). An invalid IP is checked as 0 like in ip2int()
+        try:
+            key = self.__ip_key(ipaddr)
+        except TypeError: # an unhashable object (ex: a list) can't be a key of the lru_cache
+            key = 0
+        if key < _IPV6_KEY_FLAG:
+            result = self.__check_ipv4(key)
+        else:
+            result = self.__check_ipv6(key ^ _IPV6_KEY_FLAG)
+        if result:
+            self.__stats_save(key)
+            return result
+        return self.__rate_limit(key)
+    def check_int(self,iplong:int,family:int=socket.AF_INET)->Union[str,bool]:
+        """Check if an IP address given as an integer is in the IP/CIDR list. There is no string parsing, the integer goes 
+        straight to the cache and the interval search.
+        
+        Parameters :
+        - iplong (int): The IP address as an unsigned integer.
+        - family (int): The address family, socket.AF_INET or socket.AF_INET6. Default is socket.AF_INET.
+        
+        Returns :
+        - The CIDR of the network if the IP is in the IP list
+        - A RateLimited with the client network if the IP is not in the IP list and exceeded the rate limit
+        - False if the IP is not in the IP list OR if the IP list is empty OR if the integer is not an address of the 
+          family (0 to 2**32-1 for IPv4, 0 to 2**128-1 for IPv6) OR if the family is unknown.
+        """
+        try:
+            if family == socket.AF_INET:
+                if not 0 <= iplong <= 0xFFFFFFFF:
+                    return False
+                result = self.__check_ipv4(iplong)
+            elif family == socket.AF_INET6:
+                if not 0 <= iplong <= _HOSTMASK[6][0]:
+                    return False
+                result = self.__check_ipv6(iplong)
+                iplong |= _IPV6_KEY_FLAG
+            else:
+                return False
+        except TypeError:
+            return False
+        if result:
+            self.__stats_save(iplong)
+            return result
+        return self.__rate_limit(iplong)
+    def check_packed(self,packed:bytes)->Union[str,bool]:
+        """Check if an IP address given in packed format (ex: socket.inet_pton() or the PROXY protocol v2 header) is in the 
+        IP/CIDR list. The address family is given by the length: 4 bytes for IPv4 and 16 bytes for IPv6.
+        
+        Returns :
+        - The CIDR of the network if the IP is in the IP list
+        - A RateLimited with the client network if the IP is not in the IP list and exceeded the rate limit
+        - False if the IP is not in the IP list OR if the IP list is empty OR if the length is not 4 or 16 bytes.
+        """
+        if len(packed) == 4:
+            iplong = _unpack_ipv4(packed)[0]
+            result = self.__check_ipv4(iplong)
+        elif len(packed) == 16:
+            iplong = int.from_bytes(packed,byteorder='big')
+            result = self.__check_ipv6(iplong)
+            iplong |= _IPV6_KEY_FLAG
+        else:
+            return False
         if result:
             self.__stats_save(iplong)
+            return result
+        return self.__rate_limit(iplong)
+    def check_rule(self,ipaddr:str)->Union[Rule,bool]:
+        """Check if the IP address is in the IP/CIDR list and get the payload of the matched rule with the same binary search.
+        
+        Returns :
+        - A Rule(cidr,action,limit,label) with the most specific CIDR that contains the IP and its payload
+        - A RateLimited with the client network if the IP is not in the IP list and exceeded the rate limit
+        - False if the IP is not in the IP list OR if the IP list is empty.
+        """
+        iplong = self.ip2int(ipaddr)
+        if ipaddr.find(":") < 0:
+            index, key = self.__index.ipv4, iplong
+        else:
+            index, key = self.__index.ipv6, iplong | _IPV6_KEY_FLAG
+        position = index.search(iplong)
+        if position >= 0 and iplong <= index.interval(position)[1]:
+            slot = index.rule[position]
+            self.__stats_save(key)
+            return Rule(index.cidr[slot],index.action[slot],index.limit[slot],index.label[slot])
+        return self.__rate_limit(key)
+    ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    ##──── METRICS ───────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    def __bind_checks(self):
+        """Bind __check_ipv4 and __check_ipv6 to the cached checks or to the direct checks, after a change of the cache size, 
+        of the checks (named lists, first-level table) or of the metrics. The lru caches are replaced by new lru_caches of 
+        the checks, so a change of the index must be published before. With metrics, they are wrapped by the timed checks."""
+        if self.__cache_size > 0 and self.__cache_policy == "lru":
+            check_ipv4, check_ipv6 = self.__ipv4_cache.wrap(self.__check_ipv4_access), self.__ipv6_cache.wrap(self.__check_ipv6_access)
+        elif self.__cache_size > 0:
+            check_ipv4, check_ipv6 = self.__check_ipv4_cached, self.__check_ipv6_cached
+        else:
+            check_ipv4, check_ipv6 = self.__check_ipv4_access, self.__check_ipv6_access
+        if self.__metrics:
+            self.__check_ipv4_untimed, self.__check_ipv6_untimed = check_ipv4, check_ipv6
+            check_ipv4, check_ipv6 = self.__check_ipv4_timed, self.__check_ipv6_timed
+        self.__check_ipv4, self.__check_ipv6 = check_ipv4, check_ipv6
+    def __check_ipv4_timed(self,iplong:int)->Union[str,bool]:
+        start_time = time.perf_counter_ns()
+        result = self.__check_ipv4_untimed(iplong)
+        self.__latency_save(time.perf_counter_ns()-start_time)
         return result
+    def __check_ipv6_timed(self,iplong:int)->Union[str,bool]:
+        start_time = time.perf_counter_ns()
+        result = self.__check_ipv6_untimed(iplong)
+        self.__latency_save(time.perf_counter_ns()-start_time)
+        return result
+    def __latency_save(self,elapsed_ns:int):
+        try:
+            shard = self.__latency.local.shard
+        except AttributeError:
+            shard = self.__latency.thread_shard()
+        shard.buckets[elapsed_ns.bit_length()] += 1
+        shard.sum_ns += elapsed_ns
+    def __latency_merge(self)->tuple:
+        """Returns the buckets of the latency histogram and the sum of the durations in nanoseconds of all the threads."""
+        total, latency = _LatencyShard(), self.__latency
+        with latency.lock:
+            for shard in list(latency.shards):
+                total.merge(shard)
+        return total.buckets, total.sum_ns
+    def metrics_info(self)->namedtuple:
+        """Get the metrics as a namedtuple, or None if the parameter metrics is False:
+        
+        - lookups, latency_sum: the number of timed lookups (the object call, check_int() and check_packed(), from the cache 
+          to the end of the search) and the sum of their durations in seconds.
+        - latency_buckets: {upper bound in seconds:lookups} of the non-empty buckets of the histogram. The bucket of a 
+          lookup is the power of 2 nanoseconds above its duration.
+        - latency_percentiles: {0.5:seconds,0.9:...,0.99:...,0.999:...}, the upper bound of the bucket of each percentile.
+        - cache_hits, cache_misses, cache_hit_ratio: the counters of the lookup cache (see cache_info()).
+        - generation, networks, ipv4_intervals, ipv6_intervals: the generation of the index, the number of networks of the 
+          list and the number of intervals of each index.
+        - rebuilds, rebuild_duration, updates, update_duration: the number of full builds of the index and the duration 
+          in seconds of the last one, and the same for the incremental updates (add_ip(), remove_ip(), apply_changes()).
+        - reloads, reload_errors: the successful and the failed reloads (see reload_info()).
+        """
+        Metrics = namedtuple("Metrics", ["lookups","latency_sum","latency_buckets","latency_percentiles","cache_hits","cache_misses","cache_hit_ratio",
+                                         "generation","networks","ipv4_intervals","ipv6_intervals","rebuilds","rebuild_duration","updates","update_duration",
+                                         "reloads","reload_errors"])
+        if not self.__metrics:
+            return None
+        buckets, sum_ns = self.__latency_merge()
+        lookups, percentiles = sum(buckets), {}
+        for percentile in (0.5,0.9,0.99,0.999):
+            cumulative_count = 0
+            for bits, count in enumerate(buckets):
+                cumulative_count += count
+                if lookups > 0 and cumulative_count >= percentile*lookups:
+                    percentiles[percentile] = (1 << bits)/1e9
+                    break
+            else:
+                percentiles[percentile] = 0.0
+        cache_info, index, build_info = self.cache_info(), self.__index, self.__build_info
+        return Metrics(lookups,sum_ns/1e9,{(1 << bits)/1e9:count for bits, count in enumerate(buckets) if count > 0},percentiles,
+                       cache_info.hits,cache_info.misses,cache_info.hit_ratio,index.generation,len(self.__ip_network_list),len(index.ipv4.rule),len(index.ipv6.rule),
+                       build_info.rebuilds,build_info.rebuild_duration,build_info.updates,build_info.update_duration,self.__reloader.reloads,self.__reloader.errors)
+    def metrics_prometheus(self,prefix:str="fastaccesslimiter",labels:dict=None)->str:
+        """Returns the metrics in the Prometheus text exposition format, or an empty string if the parameter metrics is False. 
+        The labels (ex: {"list":"blocklist"}) are added to all the samples, to export several objects in the same response. 
+        The latency histogram has fixed buckets from 128 nanoseconds to 134 milliseconds."""
+        if not self.__metrics:
+            return ""
+        metrics, buckets = self.metrics_info(), self.__latency_merge()[0]
+        def sample(name:str,value,extra_labels:dict=None)->str:
+            label_dict = {**(labels or {}),**(extra_labels or {})}
+            label_text = ",".join(f'{key}="{str(label_value).replace(chr(92),chr(92)*2).replace(chr(34),chr(92)+chr(34)).replace(chr(10),chr(92)+"n")}"'
+                                  for key, label_value in label_dict.items())
+            return f"{prefix}_{name}{{{label_text}}} {value}" if label_text else f"{prefix}_{name} {value}"
+        lines = [f"# HELP {prefix}_lookup_duration_seconds The duration of the lookups, from the cache to the end of the search.",
+                 f"# TYPE {prefix}_lookup_duration_seconds histogram"]
+        for bits in _METRICS_BUCKETS:
+            lines.append(sample("lookup_duration_seconds_bucket",sum(buckets[:bits+1]),{"le":repr((1 << bits)/1e9)}))
+        lines += [sample("lookup_duration_seconds_bucket",metrics.lookups,{"le":"+Inf"}),sample("lookup_duration_seconds_sum",repr(metrics.latency_sum)),
+                  sample("lookup_duration_seconds_count",metrics.lookups)]
+        for name, metric_type, help_text, value_list in (
+                ("cache_hits_total","counter","The lookups answered by the cache.",[(self.__ipv4_cache.hits,{"family":"ipv4"}),(self.__ipv6_cache.hits,{"family":"ipv6"})]),
+                ("cache_misses_total","counter","The lookups that searched the index.",[(self.__ipv4_cache.misses,{"family":"ipv4"}),(self.__ipv6_cache.misses,{"family":"ipv6"})]),
+                ("index_generation","gauge","The generation of the index, incremented on each change of the list.",[(metrics.generation,None)]),
+                ("index_networks","gauge","The number of networks of the list.",[(metrics.networks,None)]),
+                ("index_intervals","gauge","The number of non-overlapping intervals of the index.",[(metrics.ipv4_intervals,{"family":"ipv4"}),(metrics.ipv6_intervals,{"family":"ipv6"})]),
+                ("index_rebuilds_total","counter","The full builds of the index.",[(metrics.rebuilds,None)]),
+                ("index_rebuild_duration_seconds","gauge","The duration of the last full build of the index.",[(repr(metrics.rebuild_duration),None)]),
+                ("index_updates_total","counter","The incremental updates of the index.",[(metrics.updates,None)]),
+                ("index_update_duration_seconds","gauge","The duration of the last incremental update of the index.",[(repr(metrics.update_duration),None)]),
+                ("reloads_total","counter","The successful reloads of the watched file.",[(metrics.reloads,None)]),
+                ("reload_errors_total","counter","The failed reloads of the watched file.",[(metrics.reload_errors,None)])):
+            lines += [f"# HELP {prefix}_{name} {help_text}",f"# TYPE {prefix}_{name} {metric_type}"]
+            lines += [sample(name,value,extra_labels) for value, extra_labels in value_list]
+        return "\n".join(lines)+"\n"
+    def metrics_reset(self)->bool:
+        """Reset the latency histogram of all the threads at once, replacing all the shards with one reference assignment."""
+        with self._lock:
+            self.__latency = _Stats(_LatencyShard)
+        return True
+    ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    ##──── RATE LIMIT ────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    def __rate_limit(self,iplong:int)->bool:
+        return False
+    def __rate_limit_enabled(self,iplong:int)->Union[RateLimited,bool]:
+        if self.__rate_limiter(iplong,time.monotonic()):
+            return RateLimited(self.__rate_limiter.network(iplong))
+        return False
+    def rate_limit_info(self)->namedtuple:
+        """Get the state of the rate limit as a namedtuple with the clients (the number of tracked clients) and the 
+        max_clients attributes. Returns None if the rate limit is disabled."""
+        RateLimitInfo = namedtuple("RateLimitInfo", ["clients","max_clients"])
+        if self.__rate_limiter is None:
+            return None
+        return RateLimitInfo(len(self.__rate_limiter.clients),self.__rate_limiter.max_clients)
+    ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    ##──── BATCH CHECK ───────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    def check_many(self,ip_list,family:int=socket.AF_INET,return_index:bool=False):
+        """Check a batch of IP addresses at once. The addresses are converted in bulk and, if NumPy is installed, all of 
+        them are resolved with one searchsorted against the index arrays. Without NumPy, a pure Python loop is used, that 
+        still skips the cache and the per-call overhead of the object call. Useful for offline jobs and log replays.
+        
+        Parameters :
+        - ip_list: A list of IP addresses as strings, a list of packed addresses (bytes with 4 or 16 bytes), a list of 
+          integers, or a NumPy array of integers (IPv4 only) or of packed addresses (dtype S4 or S16).
+        - family (int): The address family of the integers, socket.AF_INET or socket.AF_INET6. Default is socket.AF_INET.
+        - return_index (bool): Return the position of the matched CIDR in get_ip_network_list() (or -1) instead of the match mask. Default is False.
+        
+        Returns :
+        - A match mask, True if the IP is in the IP list (a NumPy bool array if NumPy is installed, otherwise a list of bool)
+        - If return_index is True, the positions of the matched CIDRs in get_ip_network_list(), -1 if the IP is not in the IP list.
+        
+        Invalid IP addresses are considered not in the IP list.
+        """
+        # the positions are resolved without the lock, but a change of a few CIDRs changes the ip_network_list in place, 
+        # so a batch that ran during a change is checked again, and with the lock after a few tries
+        for _ in range(_CHECK_MANY_RETRIES):
+            result = self.__check_many(ip_list,family,return_index)
+            if result is not None:
+                return result
+        with self._lock:
+            return self.__check_many(ip_list,family,return_index)
+    def __check_many(self,ip_list,family:int,return_index:bool):
+        """Returns the result of check_many(), or None if the positions were resolved while the ip_network_list was 
+        changed. The hits are saved only with a result."""
+        ipv4_position, ipv4_iplong, ipv6_position, ipv6_packed = self.__split_ip_list(ip_list,family)
+        # the whole batch is resolved against the same generation of the index, and the positions against the 
+        # ip_network_list of this generation if it was not changed meanwhile, without taking the lock
+        list_version = self.__list_version
+        ipv4_index, ipv6_index, generation, ip_network_list = self.__index
+        if np is not None:
+            ipv4_rule, ipv6_rule = self.__check_many_numpy(ipv4_index,ipv6_index,ipv4_iplong,ipv6_packed)
+            rule_slots = np.full(len(ip_list),-1,dtype=np.int64)
+            rule_slots[np.asarray(ipv4_position,dtype=np.int64)] = ipv4_rule
+            rule_slots[np.asarray(ipv6_position,dtype=np.int64)] = ipv6_rule
+            ipv4_match, ipv6_match = ipv4_rule >= 0, ipv6_rule >= 0
+            iplong_list, count_list = np.unique(np.asarray(ipv4_iplong)[ipv4_match],return_counts=True)
+            iplong_counts = dict(zip(iplong_list.tolist(),count_list.tolist()))
+            packed_list, count_list = np.unique(np.asarray(ipv6_packed)[ipv6_match],return_counts=True)
+            iplong_counts.update({int.from_bytes(packed.ljust(16,b"\0"),byteorder='big') | _IPV6_KEY_FLAG:count for packed,count in zip(packed_list.tolist(),count_list.tolist())})
+            if return_index:
+                # the rule slots are resolved to positions in the ip_network_list once per distinct matched rule
+                ipv4_slots, ipv6_slots = np.unique(ipv4_rule[ipv4_match]), np.unique(ipv6_rule[ipv6_match])
+                position_map = np.full(len(ipv4_index.cidr)+len(ipv6_index.cidr),-1,dtype=np.int64)
+                try:
+                    position_map[ipv4_slots] = [self.__ip_network_list_position(ip_network_list,ipv4_index.cidr[slot]) for slot in ipv4_slots.tolist()]
+                    position_map[ipv6_slots+len(ipv4_index.cidr)] = [self.__ip_network_list_position(ip_network_list,ipv6_index.cidr[slot]) for slot in ipv6_slots.tolist()]
+                except IndexError:
+                    return None
+                if list_version & 1 or list_version != self.__list_version:
+                    return None
+                rule_slots[np.asarray(ipv6_position,dtype=np.int64)[ipv6_match]] += len(ipv4_index.cidr)
+                result = np.where(rule_slots >= 0,position_map[rule_slots],-1)
+            else:
+                result = rule_slots >= 0
+            if iplong_counts:
+                self.__stats_save_many(iplong_counts)
+            return result
+        # pure Python fallback
+        result, iplong_counts = [-1] * len(ip_list), {}
+        for position, iplong in zip(ipv4_position,ipv4_iplong):
+            match_list_index = ipv4_index.search(iplong)
+            if match_list_index >= 0 and iplong <= ipv4_index.last[match_list_index]:
+                result[position] = ipv4_index.cidr[ipv4_index.rule[match_list_index]]
+                iplong_counts[iplong] = iplong_counts.get(iplong,0)+1
+        for position, packed in zip(ipv6_position,ipv6_packed):
+            iplong = int.from_bytes(packed,byteorder='big')
+            match_list_index = ipv6_index.search(iplong)
+            if match_list_index >= 0 and iplong <= ipv6_index.interval(match_list_index)[1]:
+                result[position] = ipv6_index.cidr[ipv6_index.rule[match_list_index]]
+                iplong |= _IPV6_KEY_FLAG
+                iplong_counts[iplong] = iplong_counts.get(iplong,0)+1
+        if return_index:
+            try:
+                positions = {cidr:self.__ip_network_list_position(ip_network_list,cidr) for cidr in set(result) if cidr != -1}
+            except IndexError:
+                return None
+            if list_version & 1 or list_version != self.__list_version:
+                return None
+            result = [positions[cidr] if cidr != -1 else -1 for cidr in result]
+        else:
+            result = [cidr != -1 for cidr in result]
+        if iplong_counts:
+            self.__stats_save_many(iplong_counts)
+        return result
+    def __split_ip_list(self,ip_list,family:int)->tuple:
+        """Split a batch of IP addresses by address family. 
+        
+        Returns the positions and the integers of the IPv4 addresses, and the positions and the packed bytes of the IPv6 addresses."""
+        ipv4_position, ipv4_iplong, ipv6_position, ipv6_packed = [], [], [], []
+        if np is not None and isinstance(ip_list,np.ndarray):
+            if ip_list.dtype.kind in "ui" and family == socket.AF_INET:
+                # the integers out of the IPv4 range are no match, like in a list, instead of wrapping around in astype()
+                valid = (ip_list >= 0) & (ip_list <= 0xFFFFFFFF)
+                return np.flatnonzero(valid), ip_list[valid].astype(np.uint32), ipv6_position, np.array([],dtype="S16")
+            elif ip_list.dtype.kind == "S" and ip_list.dtype.itemsize == 4:
+                return np.arange(len(ip_list)), np.ascontiguousarray(ip_list).view(">u4").astype(np.uint32), ipv6_position, np.array([],dtype="S16")
+            elif ip_list.dtype.kind == "S" and ip_list.dtype.itemsize == 16:
+                return ipv4_position, np.array([],dtype=np.uint32), np.arange(len(ip_list)), ip_list
+            raise ValueError(f"Unsupported NumPy array of dtype {ip_list.dtype} for the family {family}.")
+        for position, ipaddr in enumerate(ip_list):
+            try:
+                if isinstance(ipaddr,str):
+                    if ipaddr.find(":") < 0:
+                        ipv4_iplong.append(struct.unpack("!L",socket.inet_aton(ipaddr))[0])
+                        ipv4_position.append(position)
+                    else:
+                        ipv6_packed.append(socket.inet_pton(socket.AF_INET6,ipaddr))
+                        ipv6_position.append(position)
+                elif isinstance(ipaddr,(bytes,bytearray)):
+                    if len(ipaddr) == 4:
+                        ipv4_iplong.append(struct.unpack("!L",ipaddr)[0])
+                        ipv4_position.append(position)
+                    elif len(ipaddr) == 16:
+                        ipv6_packed.append(bytes(ipaddr))
+                        ipv6_position.append(position)
+                elif family == socket.AF_INET6:
+                    ipv6_packed.append(int(ipaddr).to_bytes(16,byteorder='big'))
+                    ipv6_position.append(position)
+                elif 0 <= ipaddr <= 0xFFFFFFFF:
+                    ipv4_iplong.append(int(ipaddr))
+                    ipv4_position.append(position)
+            except (OSError,ValueError,OverflowError,struct.error):
+                continue
+        if np is not None:
+            return ipv4_position, np.array(ipv4_iplong,dtype=np.uint32), ipv6_position, np.frombuffer(b"".join(ipv6_packed),dtype="S16")
+        return ipv4_position, ipv4_iplong, ipv6_position, ipv6_packed
+    def __check_many_numpy(self,ipv4_index:_IPv4Index,ipv6_index:_IPv6Index,ipv4_iplong,ipv6_packed)->tuple:
+        """Resolve the IPv4 integers (uint32 array) and the IPv6 packed addresses (S16 array) with one searchsorted per 
+        address family. The IPv6 boundaries are converted to big endian S16 arrays, that are sorted in the same order 
+        as the IP addresses. The arrays of a published index are never resized, so they are viewed without a copy and without the lock.
+        
+        Returns 2 arrays with the rule slot of each address, -1 if the address is not in the IP list."""
+        ipv4_rule = np.full(len(ipv4_iplong),-1,dtype=np.int64)
+        if len(ipv4_iplong) > 0 and len(ipv4_index.first) > 0:
+            first = np.frombuffer(ipv4_index.first,dtype=np.uint32)
+            last = np.frombuffer(ipv4_index.last,dtype=np.uint32)
+            position = np.searchsorted(first,ipv4_iplong,side="right")-1
+            match = (position >= 0) & (ipv4_iplong <= last[position])
+            ipv4_rule[match] = np.frombuffer(ipv4_index.rule,dtype=np.uint32)[position[match]]
+        ipv6_rule = np.full(len(ipv6_packed),-1,dtype=np.int64)
+        if len(ipv6_packed) > 0 and len(ipv6_index.first_hi) > 0:
+            first = np.empty((len(ipv6_index.first_hi),2),dtype=">u8")
+            first[:,0], first[:,1] = ipv6_index.first_hi, ipv6_index.first_lo
+            last = np.empty((len(ipv6_index.last_hi),2),dtype=">u8")
+            last[:,0], last[:,1] = ipv6_index.last_hi, ipv6_index.last_lo
+            first, last = first.view("S16").ravel(), last.view("S16").ravel()
+            position = np.searchsorted(first,ipv6_packed,side="right")-1
+            match = (position >= 0) & (ipv6_packed <= last[position])
+            ipv6_rule[match] = np.frombuffer(ipv6_index.rule,dtype=np.uint32)[position[match]]
+        return ipv4_rule, ipv6_rule
+    ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    ##──── NAMED LISTS ───────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    def load_named_lists(self,named_lists:dict,precedence:list=None)->bool:
+        """Load several named lists {name:ip_network_list} into the same index, ex: {"allow":[...],"deny":[...],"bad_asn":[...]}. 
+        The lists are merged, and each CIDR keeps the names of all the lists that have it. After that, the calls return the 
+        names of all the lists that contain the IP (a tuple in the order of the lists), found with a single binary search, 
+        or False. If precedence is given (ex: ["allow","deny"] to let the allowlist win), the calls return only the name 
+        of the first list of the precedence that contains the IP. Up to 64 lists, the items of a list can be CIDRs or rules.
+        
+        Returns :
+        - True if the lists were loaded
+        - False if the lists are invalid.
+        """
+        try:
+            # the names get their bits in the order of the lists
+            self.__list_mask(tuple(named_lists))
+            new_index = self.__prepare_ip_list(_named_list_rules(named_lists))
+            with self._lock:
+                self.__enable_named_lists(precedence)
+                self.__publish(*new_index)
+            return True
+        except:
+            return False
+    def get_named_lists(self)->dict:
+        """Returns the CIDRs of each named list as {name:[cidr,...]}, in the order of get_ip_network_list()."""
+        with self._lock:
+            rule_list = self.__rule_list(self.__index.ipv4,self.__index.ipv6,only_payloads=True)
+        named_lists = {name:[] for name in self.__list_names}
+        for item in rule_list:
+            if not isinstance(item,str) and len(item) > 4:
+                for name in item[4]:
+                    named_lists[name].append(item[0])
+        return named_lists
+    def check_lists(self,ipaddr:str)->tuple:
+        """Returns the names of all the named lists that contain the IP address, even if there is a precedence, or an empty tuple."""
+        iplong = self.ip2int(ipaddr)
+        index = self.__index.ipv4 if ipaddr.find(":") < 0 else self.__index.ipv6
+        position = index.search(iplong)
+        if position >= 0 and iplong <= index.interval(position)[1]:
+            return self.__list_names_of(_index_lists(index,index.rule[position]))
+        return ()
+    def __enable_named_lists(self,precedence:list=None):
+        """The calls return the names of the named lists instead of the CIDRs. The cached results are discarded."""
+        self.__precedence, self.__list_results = (tuple(precedence) if precedence is not None else None), {}
+        self.__check_ipv4_access, self.__check_ipv6_access = self.__check_ipv4_lists, self.__check_ipv6_lists
+        self.__cache_reset(self.__ipv4_cache.generation)
+    def __list_mask(self,names:tuple,register:bool=True)->int:
+        """Returns the bitset of the named lists. The new names get the next bits if register is True, otherwise they are ignored."""
+        bitset = 0
+        for name in names:
+            if name not in self.__list_names:
+                if not register:
+                    continue
+                with self.__list_lock:
+                    if name not in self.__list_names:
+                        if len(self.__list_names) >= _MAX_NAMED_LISTS:
+                            raise ValueError(f"Too many named lists, the maximum is {_MAX_NAMED_LISTS}.")
+                        self.__list_names.append(name)
+            bitset |= 1 << self.__list_names.index(name)
+        return bitset
+    def __list_names_of(self,bitset:int)->tuple:
+        """Returns the names of the named lists of a bitset, in the order of their bits."""
+        return tuple(name for bit, name in enumerate(self.__list_names) if bitset >> bit & 1) if bitset else ()
+    ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    ##──── SHARED MEMORY ─────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    def share_ip_network_list(self,shm_name:str,raise_on_error:bool=False)->bool:
+        """Publish the current index in shared memory as a new generation, to be used by the processes that called 
+        attach_ip_network_list(shm_name) (ex: the workers of gunicorn or uvicorn). Call it again after each change of the 
+        IP list (load_ip_network_list, add_ip, ...) to publish the new index. The workers don't parse anything, they 
+        map the index of the new generation and switch to it with one reference assignment.
+        
+        If a control segment with this name already exists (ex: the previous master process was restarted), the 
+        generations continue from the current one.
+        
+        Returns :
+        - True if the index was published
+        - False if the index could not be published. If raise_on_error is True, an exception will be raised.
+        """
+        try:
+            start_time = time.monotonic()
+            shared = self.__shared
+            if shared is None or not shared.owner or shared.name != shm_name:
+                self.close_shared_memory()
+                try:
+                    control = shared_memory.SharedMemory(shm_name,create=True,size=_SHARED_CONTROL.size)
+                    _SHARED_CONTROL.pack_into(control.buf,0,_SHARED_MAGIC,0)
+                except FileExistsError:
+                    control = _shared_memory_attach(shm_name)
+                    if bytes(control.buf[:len(_SHARED_MAGIC)]) != _SHARED_MAGIC:
+                        control.close()
+                        raise ValueError(f"The shared memory {shm_name} is not a FastAccessLimiter shared index.") from None
+                shared = self.__shared = _SharedMemory(shm_name,control,owner=True)
+            chunks = self.__snapshot_chunks()
+            generation = shared.control_generation()+1
+            segment = shared_memory.SharedMemory(f"{shm_name}_{generation}",create=True,size=sum(map(len,chunks)))
+            position = 0
+            for chunk in chunks:
+                segment.buf[position:position+len(chunk)] = chunk
+                position += len(chunk)
+            # the workers see the new generation only after its segment is complete
+            _SHARED_CONTROL.pack_into(shared.control.buf,0,_SHARED_MAGIC,generation)
+            previous, shared.segment, shared.generation = shared.segment, segment, generation
+            # the workers that still use the previous generation keep their mapping until they switch to the new one
+            try:
+                if previous is None:
+                    previous = _shared_memory_attach(f"{shm_name}_{generation-1}")
+                previous.close()
+                previous.unlink()
+            except FileNotFoundError:
+                pass
+            self.__debug(f"Elapsed time to share the generation {generation} in {segment.name} ({segment.size} bytes): {time.monotonic()-start_time:.9f} seconds")
+            return True
+        except Exception as ERR:
+            if raise_on_error:
+                raise ERR from None
+            return False
+    def attach_ip_network_list(self,shm_name:str,refresh_interval:float=1.0,raise_on_error:bool=False)->bool:
+        """Use the index shared by another process with share_ip_network_list(shm_name). The lookups are served straight 
+        from the shared memory, so all the workers use the same copy of the index. A daemon thread checks the generation 
+        every refresh_interval seconds and switches to the new index when it changes. With refresh_interval=0, call 
+        refresh_ip_network_list() to switch. In a pre-fork server, call it in each worker after the fork.
+        
+        A change of the IP list in a worker (add_ip, remove_ip, ...) copies the index to the memory of the worker, and 
+        is replaced by the next generation.
+        
+        Returns :
+        - True if the shared memory was attached
+        - False if the shared memory could not be attached. If raise_on_error is True, an exception will be raised.
+        """
+        try:
+            self.close_shared_memory()
+            control = _shared_memory_attach(shm_name)
+            if bytes(control.buf[:len(_SHARED_MAGIC)]) != _SHARED_MAGIC:
+                control.close()
+                raise ValueError(f"The shared memory {shm_name} is not a FastAccessLimiter shared index.") from None
+            shared = self.__shared = _SharedMemory(shm_name,control,owner=False)
+            self.refresh_ip_network_list()
+            if refresh_interval > 0:
+                threading.Thread(target=self.__shared_memory_refresh_loop,args=(shared,refresh_interval),daemon=True,
+                                 name=f"FastAccessLimiter-{shm_name}").start()
+            return True
+        except Exception as ERR:
+            if raise_on_error:
+                raise ERR from None
+            return False
+    def refresh_ip_network_list(self)->bool:
+        """Switch to the newest generation of the attached shared memory.
+        
+        Returns :
+        - True if a new generation was attached
+        - False if the generation did not change OR if there is no attached shared memory.
+        """
+        shared = self.__shared
+        if shared is None or shared.owner:
+            return False
+        generation = shared.control_generation()
+        if generation == shared.generation:
+            return False
+        try:
+            segment = _shared_memory_attach(f"{shared.name}_{generation}")
+        except FileNotFoundError:
+            # the generation was replaced while it was attached, the next refresh will get the newest one
+            return False
+        start_time = time.monotonic()
+        new_index = self.__snapshot_index(segment.buf,f"shared memory {segment.name}")
+        with self._lock:
+            if self.__shared is not shared:
+                segment.close()
+                return False
+            self.__publish(*new_index)
+            if shared.segment is not None:
+                shared.retired.append(shared.segment)
+            shared.segment, shared.generation = segment, generation
+        shared.release()
+        self.__debug(f"Elapsed time to attach the generation {generation} of {shared.name}: {time.monotonic()-start_time:.9f} seconds")
+        return True
+    def close_shared_memory(self)->bool:
+        """Stop using the shared memory. A worker copies the current index to its own memory and keeps working with it. 
+        The owner removes the shared memory, the workers that are attached to it keep the last generation.
+        
+        Returns :
+        - True if the shared memory was closed
+        - False if there is no shared memory.
+        """
+        with self._lock:
+            shared, self.__shared = self.__shared, None
+            if shared is None:
+                return False
+            shared.stop.set()
+            if not shared.owner:
+                self.__materialize()
+        for segment in shared.retired+[shared.segment,shared.control]:
+            if segment is not None:
+                try:
+                    segment.close()
+                except BufferError:
+                    pass
+                if shared.owner:
+                    try:
+                        segment.unlink()
+                    except FileNotFoundError:
+                        pass
+        return True
+    def shared_memory_info(self)->namedtuple:
+        """Returns the shared memory information as SharedMemoryInfo(name,owner,generation,size), or None if the 
+        index is not shared. The generation is the generation in use by this process and the size is the size of its segment."""
+        shared = self.__shared
+        if shared is None:
+            return None
+        SharedMemoryInfo = namedtuple("SharedMemoryInfo", ["name","owner","generation","size"])
+        return SharedMemoryInfo(shared.name,shared.owner,shared.generation,shared.segment.size if shared.segment is not None else 0)
+    def __shared_memory_refresh_loop(self,shared:_SharedMemory,refresh_interval:float):
+        while not shared.stop.wait(refresh_interval):
+            try:
+                self.refresh_ip_network_list()
+            except Exception as ERR:
+                self.__debug(f"Failed to refresh the shared memory {shared.name}: {str(ERR)}")
+    ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    ##──── HOT RELOAD ────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    def watch_ip_network_list(self,json_filename:str,interval:float=1.0,callback=None)->bool:
+        """Watch a file of the IP list (json, json.gz or binary snapshot) in a daemon thread, and reload it when it 
+        changes. The file is checked every interval seconds by its inode, modification time and size, so a file that 
+        is replaced (ex: written to a temporary file and renamed) or rewritten is reloaded. The file is opened and 
+        parsed in the thread, and the new index is swapped in only if it was parsed successfully, otherwise the 
+        current IP list is kept, the error is saved in reload_info() and the file is read again at each interval until 
+        it's reloaded. The file is loaded for the first time by the 
+        thread, right after the call. The callback (optional) is called with this object after each successful reload 
+        (ex: to call share_ip_network_list()). Only one file is watched, a new call replaces the watched file.
+        
+        Returns :
+        - True if the watcher was started
+        - False if the interval is not a positive number.
+        """
+        if interval <= 0:
+            return False
+        self.stop_watch_ip_network_list()
+        reloader = self.__reloader
+        reloader.filename, reloader.stop = json_filename, threading.Event()
+        threading.Thread(target=self.__watch_loop,args=(json_filename,interval,callback,reloader.stop),daemon=True,
+                         name=f"FastAccessLimiter-watch-{os.path.basename(json_filename)}").start()
+        return True
+    def stop_watch_ip_network_list(self)->bool:
+        """Stop watching the file of watch_ip_network_list(). The current IP list is kept.
+        
+        Returns :
+        - True if the watcher was stopped
+        - False if there is no watched file.
+        """
+        reloader = self.__reloader
+        if reloader.filename is None:
+            return False
+        reloader.stop.set()
+        reloader.filename = None
+        return True
+    async def open_ip_network_list_async(self,json_filename:str,executor=None)->bool:
+        """Open the IP list from a file like open_ip_network_list(), in an executor of the running event loop, so an 
+        asyncio application keeps serving requests while the file is decoded and parsed. The default executor of the 
+        loop is used if executor is None. The result is saved in reload_info().
+        
+        Returns :
+        - True if the IP list was opened from the file
+        - False if the file could not be opened. The error is in reload_info().last_error.
+        """
+        return await asyncio.get_running_loop().run_in_executor(executor,self.__reload,json_filename)
+    def reload_info(self)->namedtuple:
+        """Returns the reload information as ReloadInfo(filename,reloads,errors,last_reload,duration,last_error): the 
+        watched file (or None), the number of successful and failed reloads, the time.time() of the last successful 
+        reload, the duration in seconds of the last reload and the error of the last reload (None if it was successful)."""
+        ReloadInfo = namedtuple("ReloadInfo", ["filename","reloads","errors","last_reload","duration","last_error"])
+        reloader = self.__reloader
+        return ReloadInfo(reloader.filename,reloader.reloads,reloader.errors,reloader.last_reload,reloader.duration,reloader.last_error)
+    def __reload(self,json_filename:str)->bool:
+        """Open the IP list from a file and save the result of the reload."""
+        reloader = self.__reloader
+        start_time = time.monotonic()
+        try:
+            self.open_ip_network_list(json_filename,raise_on_error=True)
+        except Exception as ERR:
+            reloader.errors += 1
+            reloader.duration, reloader.last_error = time.monotonic()-start_time, f"{type(ERR).__name__}: {str(ERR)}"
+            self.__debug(f"Failed to reload the file {json_filename}: {reloader.last_error}")
+            return False
+        reloader.reloads += 1
+        reloader.duration, reloader.last_reload, reloader.last_error = time.monotonic()-start_time, time.time(), None
+        self.__debug(f"Elapsed time to reload the file {json_filename}: {reloader.duration:.9f} seconds")
+        return True
+    def __watch_loop(self,json_filename:str,interval:float,callback,stop:threading.Event):
+        file_key = None
+        while not stop.is_set():
+            try:
+                file_stat = os.stat(json_filename)
+                new_file_key = (file_stat.st_ino,file_stat.st_mtime_ns,file_stat.st_size)
+            except OSError as ERR:
+                new_file_key, self.__reloader.last_error = None, f"{type(ERR).__name__}: {str(ERR)}"
+            # the key is saved only after a successful reload, so a file that failed (ex: read while it was written) is 
+            # retried at each interval until it's reloaded
+            if new_file_key is not None and new_file_key != file_key and self.__reload(json_filename):
+                file_key = new_file_key
+                if callback is not None:
+                    try:
+                        callback(self)
+                    except Exception as ERR:
+                        self.__debug(f"Failed to run the reload callback of the file {json_filename}: {str(ERR)}")
+            stop.wait(interval)
+    ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    ##──── CHANGE JOURNAL ────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    def open_journal(self,journal_filename:str,snapshot_filename:str=None,max_records:int=10000,fsync:bool=False,raise_on_error:bool=False)->bool:
+        """Replay a journal of changes on top of the current IP list (ex: the last snapshot opened by open_ip_network_list()), 
+        and keep it open to append the changes of add_ip(), remove_ip() and apply_changes(). Each change is one JSON line 
+        {"add":[...],"remove":[...]} that is written before the change is published. All the records are replayed on one 
+        copy of the index, and a record that was cut by a crash at the end of the journal is discarded. The changes of 
+        load_ip_network_list(), extend_ip_network_list() and open_ip_network_list() are not journaled: save them with 
+        compact_journal().
+        
+        Parameters :
+        - journal_filename (str): The journal file. It is created if it does not exist.
+        - snapshot_filename (str): The snapshot (json, json.gz or .bin) written by compact_journal(). If it is given, the 
+          journal is compacted automatically when it has max_records records. Default is None (no automatic compaction).
+        - max_records (int): The number of records that triggers the automatic compaction. Default is 10000.
+        - fsync (bool): Flag to sync each record to the disk before the change is published. Default is False (the record 
+          is flushed to the operating system, that is enough to survive a crash of the process but not of the machine).
+        - raise_on_error (bool): Flag to raise an exception if an error occurs. Default is False.
+        
+        Returns :
+        - True if the journal was replayed and opened
+        - False if the journal could not be opened. If raise_on_error is True, an exception will be raised.
+        """
+        try:
+            start_time = time.monotonic()
+            self.close_journal()
+            journal = self.__journal
+            with journal.lock:
+                batches, offset = [], 0
+                if os.path.exists(journal_filename):
+                    with open(journal_filename, "rb") as f:
+                        for line in f:
+                            try:
+                                record = json.loads(line) if line[-1:] == b"\n" else None
+                                batches.append((record.get("add",[]),record.get("remove",[])))
+                            except (ValueError,AttributeError):
+                                break
+                            offset += len(line)
+                added = removed = invalid = 0
+                if batches:
+                    with self._lock:
+                        added, removed, invalid = self.__apply_changes(batches)
+                journal.file = open(journal_filename, "ab")
+                # discard a record that was cut by a crash, the next records are appended after the last complete record
+                journal.file.truncate(offset)
+                journal.filename, journal.snapshot_filename, journal.max_records, journal.fsync = journal_filename, snapshot_filename, max_records, fsync
+                journal.records = len(batches)
+                self.__debug(f"Elapsed time to replay {len(batches)} records of the journal {journal_filename} ({added} added, "
+                             f"{removed} removed, {invalid} invalid): {time.monotonic()-start_time:.9f} seconds")
+                self.__journal_compact_if_full()
+            return True
+        except Exception as ERR:
+            if raise_on_error:
+                raise ERR from None
+            return False
+    def compact_journal(self,snapshot_filename:str=None,raise_on_error:bool=False)->bool:
+        """Save the current IP list as a new snapshot and empty the journal. The snapshot is written to a temporary file 
+        that replaces the snapshot_filename (or the snapshot_filename of open_journal()), so a crash never leaves a broken 
+        snapshot, and a journal that was not emptied because of a crash can be replayed again on top of the new snapshot. 
+        The changes wait for the end of the compaction.
+        
+        Returns :
+        - True if the journal was compacted
+        - False if there is no open journal or the snapshot could not be saved. If raise_on_error is True, an exception will be raised.
+        """
+        try:
+            with self.__journal.lock:
+                self.__journal_compact(snapshot_filename)
+            return True
+        except Exception as ERR:
+            if raise_on_error:
+                raise ERR from None
+            return False
+    def close_journal(self)->bool:
+        """Close the journal of open_journal(). The changes are no longer journaled.
+        
+        Returns :
+        - True if the journal was closed
+        - False if there is no open journal.
+        """
+        journal = self.__journal
+        with journal.lock:
+            if journal.file is None:
+                return False
+            journal.file.close()
+            journal.file = journal.filename = journal.snapshot_filename = None
+            journal.records = 0
+        return True
+    def journal_info(self)->namedtuple:
+        """Returns the journal information as JournalInfo(filename,snapshot_filename,records,compactions,last_compaction): 
+        the open journal (or None), its snapshot, the number of records in the journal, the number of compactions and 
+        the time.time() of the last compaction."""
+        JournalInfo = namedtuple("JournalInfo", ["filename","snapshot_filename","records","compactions","last_compaction"])
+        journal = self.__journal
+        return JournalInfo(journal.filename,journal.snapshot_filename,journal.records,journal.compactions,journal.last_compaction)
+    def __journal_write(self,add_list:list,remove_list:list):
+        """Append a record of changes to the journal, if it is open. Must be called with the journal lock and the lock held."""
+        journal = self.__journal
+        if journal.file is None:
+            return
+        journal.file.write(json.dumps({"add":add_list,"remove":remove_list},ensure_ascii=False,separators=(",",":")).encode()+b"\n")
+        journal.file.flush()
+        if journal.fsync:
+            os.fsync(journal.file.fileno())
+        journal.records += 1
+    def __journal_compact_if_full(self):
+        """Compact the journal when it has max_records records and a snapshot file. Must be called with the journal lock held."""
+        journal = self.__journal
+        if journal.file is not None and journal.snapshot_filename is not None and journal.records >= journal.max_records:
+            try:
+                self.__journal_compact()
+            except Exception as ERR:
+                self.__debug(f"Failed to compact the journal {journal.filename}: {str(ERR)}")
+    def __journal_compact(self,snapshot_filename:str=None):
+        """Save the snapshot and empty the journal. Must be called with the journal lock held, so no change is published 
+        between the snapshot and the truncation of the journal."""
+        journal = self.__journal
+        snapshot_filename = snapshot_filename or journal.snapshot_filename
+        if journal.file is None:
+            raise ValueError("There is no open journal.")
+        if snapshot_filename is None:
+            raise ValueError("There is no snapshot file to compact the journal.")
+        start_time = time.monotonic()
+        # the temporary file keeps the extension of the snapshot, that gives the format of save_ip_network_list()
+        temp_filename = f"{snapshot_filename}.{os.getpid()}.tmp{os.path.splitext(snapshot_filename)[1]}"
+        try:
+            self.save_ip_network_list(temp_filename,raise_on_error=True)
+            os.replace(temp_filename,snapshot_filename)
+        finally:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+        journal.file.truncate(0)
+        if journal.fsync:
+            os.fsync(journal.file.fileno())
+        journal.records, journal.compactions, journal.last_compaction = 0, journal.compactions+1, time.time()
+        self.__debug(f"Elapsed time to compact the journal {journal.filename} into {snapshot_filename}: {time.monotonic()-start_time:.9f} seconds")
+    ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    ##──── EXPIRY ────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
+    def remove_expired(self)->int:
+        """Remove the CIDRs whose TTL has expired (see add_ip()) now, in one update of the index. The expired CIDRs are also 
+        removed by a daemon thread, that wakes up at the end of the tick (expiry_interval) of the next expiry time, like a 
+        timer wheel, so the CIDRs that expire in the same tick are removed together. If a journal is open, each batch is 
+        journaled.
+        
+        Returns the number of CIDRs removed."""
+        start_time, expiry = time.monotonic(), self.__expiry
+        with self.__journal.lock:
+            with self._lock:
+                due_list = self.__expiry_due(time.time())
+                try:
+                    removed = self.__apply_changes([([],[cidr for expires, cidr in due_list])],journal=True)[1] if due_list else 0
+                except Exception:
+                    # the CIDRs that were not removed are tried again in the next batch
+                    for entry in due_list:
+                        heapq.heappush(expiry.heap,entry)
+                    raise
+            self.__journal_compact_if_full()
+        if removed > 0:
+            expiry.expired, expiry.batches = expiry.expired+removed, expiry.batches+1
+            expiry.last_batch, expiry.duration = time.time(), time.monotonic()-start_time
+            self.__debug(f"Elapsed time to remove {removed} expired CIDRs: {expiry.duration:.9f} seconds")
+        return removed
+    def get_ttl(self,ipaddr_cidr:str)->Union[float,None]:
+        """Returns the number of seconds before the IP/CIDR expires (0.0 if it's expired and waits for the next batch of 
+        removal), or None if the IP/CIDR has no TTL or is not in the IP list."""
+        network = _parse_network(self.get_cidr_format(ipaddr_cidr)) if isinstance(ipaddr_cidr,str) else None
+        if network is None:
+            return None
+        index = self.__index.ipv4 if network[0] == 4 else self.__index.ipv6
+        slot = self.__index_slot(index,network[1],network[3])
+        if slot < 0 or not index.expires[slot]:
+            return None
+        return max(index.expires[slot]-time.time(),0.0)
+    def expiry_info(self)->namedtuple:
+        """Returns the expiry information as ExpiryInfo(pending,next_expiry,expired,batches,last_batch,duration): the number 
+        of expiry times in the heap (including the stale ones of the CIDRs removed or added again since), the earliest 
+        expiry time (time.time(), or None), the number of expired CIDRs removed, the number of batches of removal, the 
+        time.time() of the last batch and its duration in seconds."""
+        ExpiryInfo = namedtuple("ExpiryInfo", ["pending","next_expiry","expired","batches","last_batch","duration"])
+        expiry = self.__expiry
+        with self._lock:
+            pending, next_expiry = len(expiry.heap), expiry.heap[0][0] if expiry.heap else None
+        return ExpiryInfo(pending,next_expiry,expiry.expired,expiry.batches,expiry.last_batch,expiry.duration)
+    def __index_slot(self,index,first:int,prefixlen:int)->int:
+        """Returns the slot of a CIDR given by its first IP and its prefix length in an index, or -1."""
+        position = index.search(first)
+        if position < 0 or index.interval(position)[1] < first:
+            return -1
+        slot = index.rule[position]
+        while slot >= 0 and index.prefixlen[slot] > prefixlen:
+            slot = index.parent[slot]
+        return slot if slot >= 0 and index.prefixlen[slot] == prefixlen else -1
+    def __expiry_entries(self,ipv4_index:_IPv4Index,ipv6_index:_IPv6Index)->list:
+        """Returns the (expires,cidr) of all the CIDRs of the indexes that have an expiry time."""
+        entries = []
+        for index in (ipv4_index,ipv6_index):
+            free = set(index.free)
+            entries.extend((expires,index.cidr[slot]) for slot, expires in enumerate(index.expires) if expires and slot not in free)
+        return entries
+    def __expiry_schedule(self,entries:list,replace:bool=False):
+        """Add the (expires,cidr) entries to the heap, or replace the heap with them, and start or wake up the expiry thread. 
+        Must be called with the lock held. The workers attached to a shared index don't expire anything, the owner of the 
+        index removes the expired CIDRs and shares the next generation."""
+        expiry = self.__expiry
+        if self.__shared is not None and not self.__shared.owner:
+            entries, replace = [], True
+        if replace:
+            heapq.heapify(entries)
+            expiry.heap = entries
+        else:
+            for entry in entries:
+                heapq.heappush(expiry.heap,entry)
+        if not expiry.heap:
+            return
+        if expiry.thread is None:
+            expiry.thread = threading.Thread(target=self.__expiry_loop,args=(expiry,),daemon=True,name="FastAccessLimiter-expiry")
+            expiry.thread.start()
+        else:
+            expiry.wakeup.set()
+    def __expiry_due(self,now:float)->list:
+        """Pop the entries of the heap that expired at now, and returns the (expires,cidr) of the CIDRs that are still in the 
+        index with the same expiry time. Must be called with the lock held."""
+        heap, index, due_list = self.__expiry.heap, self.__index, []
+        while heap and heap[0][0] <= now:
+            expires, cidr = heapq.heappop(heap)
+            version, first, last, prefixlen = _parse_network(cidr)
+            family_index = index.ipv4 if version == 4 else index.ipv6
+            slot = self.__index_slot(family_index,first,prefixlen)
+            if slot >= 0 and family_index.expires[slot] == expires:
+                due_list.append((expires,cidr))
+        return due_list
+    def __expiry_loop(self,expiry:_Expiry):
+        """Remove the expired CIDRs in batches until there is nothing more to expire."""
+        while True:
+            with self._lock:
+                if not expiry.heap:
+                    expiry.thread = None
+                    return
+                # the entries are pushed with the lock held, so an entry pushed after this wakes up the thread again
+                next_expiry = expiry.heap[0][0]
+                delay = (-(-next_expiry // expiry.interval)*expiry.interval if expiry.interval > 0 else next_expiry)-time.time()
+                expiry.wakeup.clear()
+            if delay > 0:
+                expiry.wakeup.wait(delay)
+                continue
+            try:
+                if self.remove_expired() > 0 and expiry.callback is not None:
+                    expiry.callback(self)
+            except Exception as ERR:
+                self.__debug(f"Failed to remove the expired CIDRs: {str(ERR)}")
+                time.sleep(max(expiry.interval,0.1))
     ##────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────────
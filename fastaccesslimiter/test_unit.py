@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
-import unittest, json, os
-from fastaccesslimiter import FastAccessLimiter
+import unittest, json, os, sys, threading, socket, time, asyncio, gzip, bz2, lzma, tempfile
+from fastaccesslimiter import FastAccessLimiter, RateLimited, Rule
 
 class TestFastAccessLimiter(unittest.TestCase):
     def test_01_ip_network_list_empty(self):
@@ -76,6 +76,580 @@ class TestFastAccessLimiter(unittest.TestCase):
         stats = accessLimiter.stats_info()
         self.assertEqual(stats.hits,0)
 
+    def test_16_check_ip_access_address_family(self): # IPv4 and IPv6 networks don't share the same integer space
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.1','2001:db8::/32','2001:db8:ffff:1::/64'])
+        self.assertEqual(limiter('10.0.0.1'),'10.0.0.1/32')
+        self.assertFalse(limiter('::a00:1'))
+        self.assertEqual(limiter('2001:db8:1234::1'),'2001:db8::/32')
+        self.assertEqual(limiter('2001:db8:ffff:1:ffff:ffff:ffff:ffff'),'2001:db8:ffff:1::/64')
+        self.assertFalse(limiter('2001:db9::1'))
+        self.assertEqual(limiter.get_ip_network_list(),['10.0.0.1/32','2001:db8::/32','2001:db8:ffff:1::/64'])
+        self.assertEqual(limiter.stats_info().top_hits,{'10.0.0.1':1,'2001:db8:1234::1':1,'2001:db8:ffff:1:ffff:ffff:ffff:ffff':1})
+
+    def test_17_check_ip_access_nested_networks(self): # the most specific network wins, the enclosing network covers the rest
+        limiter = FastAccessLimiter(ip_network_list=['10.1.2.0/24','10.0.0.0/8','10.1.2.128/25','10.0.0.0/16','2001:db8::/32','2001:db8::/48'])
+        self.assertEqual(limiter('10.200.0.1'),'10.0.0.0/8')
+        self.assertEqual(limiter('10.0.5.1'),'10.0.0.0/16')
+        self.assertEqual(limiter('10.1.2.1'),'10.1.2.0/24')
+        self.assertEqual(limiter('10.1.2.200'),'10.1.2.128/25')
+        self.assertEqual(limiter('10.1.3.0'),'10.0.0.0/8')
+        self.assertEqual(limiter('10.255.255.255'),'10.0.0.0/8')
+        self.assertFalse(limiter('11.0.0.0'))
+        self.assertEqual(limiter('2001:db8:0:1::1'),'2001:db8::/48')
+        self.assertEqual(limiter('2001:db8:1::1'),'2001:db8::/32')
+        self.assertEqual(len(limiter.get_ip_network_list()),6)
+
+    def test_18_add_remove_nested_networks(self): # add_ip and remove_ip update the index incrementally
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8','10.1.2.128/25'])
+        self.assertEqual(limiter('10.1.2.1'),'10.0.0.0/8')
+        self.assertTrue(limiter.add_ip('10.1.2.0/24'))
+        self.assertIsNone(limiter.add_ip('10.1.2.0/24'))
+        self.assertEqual(limiter('10.1.2.1'),'10.1.2.0/24')
+        self.assertEqual(limiter('10.1.2.129'),'10.1.2.128/25')
+        self.assertTrue(limiter.remove_ip('10.0.0.0/8'))
+        self.assertIsNone(limiter.remove_ip('10.0.0.0/8'))
+        self.assertFalse(limiter('10.200.0.1'))
+        self.assertTrue(limiter.remove_ip('10.1.2.0/24'))
+        self.assertFalse(limiter('10.1.2.1'))
+        self.assertEqual(limiter('10.1.2.129'),'10.1.2.128/25')
+        self.assertTrue(limiter.add_ip('2001:db8::1'))
+        self.assertEqual(limiter('2001:db8::1'),'2001:db8::1/128')
+        self.assertEqual(limiter.get_ip_network_list(),['10.1.2.128/25','2001:db8::1/128'])
+
+    def test_19_check_many(self): # batch check with NumPy (if installed) or the pure Python fallback
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8','10.1.2.0/24','2001:db8::/32'])
+        ip_list = ['10.1.2.3','11.0.0.1','2001:db8::1','::a00:1','invalid','10.9.9.9']
+        self.assertEqual([bool(item) for item in limiter.check_many(ip_list)],[True,False,True,False,False,True])
+        self.assertEqual([int(item) for item in limiter.check_many(ip_list,return_index=True)],[1,-1,2,-1,-1,0])
+        self.assertEqual([bool(item) for item in limiter.check_many([167837954,184549377])],[True,False])
+        self.assertEqual([bool(item) for item in limiter.check_many([b'\x0a\x01\x02\x03',bytes(16)])],[True,False])
+        stats = limiter.stats_info()
+        self.assertEqual(stats.hits,8)
+        self.assertEqual(stats.top_hits['10.1.2.3'],3)
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        if np is not None: # the integers out of the IPv4 range are no match, they don't wrap around to 10.1.2.3
+            self.assertEqual([int(item) for item in limiter.check_many(np.array([167838211-2**32,167838211+2**32,167838211]),return_index=True)],[-1,-1,1])
+            self.assertEqual([bool(item) for item in limiter.check_many(np.array([2**64-1,167838211],dtype=np.uint64))],[False,True])
+        # the positions are resolved against the published index without taking the lock of the writers
+        result_list = []
+        with limiter._lock:
+            thread = threading.Thread(target=lambda: result_list.append(limiter.check_many(ip_list,return_index=True)))
+            thread.start()
+            thread.join(5)
+        self.assertEqual([int(item) for item in result_list[0]],[1,-1,2,-1,-1,0])
+        # add_ip and remove_ip change the list in place, the positions of a batch that ran meanwhile are never a mix of 2 generations
+        limiter, stop_event = FastAccessLimiter(ip_network_list=['10.0.0.0/8'],with_stats=False), threading.Event()
+        def toggle():
+            while not stop_event.is_set():
+                limiter.add_ip('1.0.0.0/24')
+                limiter.remove_ip('1.0.0.0/24')
+        thread, switch_interval = threading.Thread(target=toggle), sys.getswitchinterval()
+        sys.setswitchinterval(0.00001)
+        thread.start()
+        try:
+            result_set = {tuple(int(item) for item in limiter.check_many(['1.0.0.1','10.0.0.1'],return_index=True)) for _ in range(3000)}
+        finally:
+            sys.setswitchinterval(switch_interval)
+            stop_event.set()
+            thread.join(5)
+        self.assertLessEqual(result_set,{(0,1),(-1,0)})
+
+    def test_20_save_open_snapshot(self): # binary snapshot served straight from the memory-mapped file
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8','10.1.2.0/24','2001:db8::/32'])
+        test_rules_filebin = test_rules_file.replace('.json','.bin')
+        self.assertTrue(limiter.save_ip_network_list(test_rules_filebin))
+        snapshot_limiter = FastAccessLimiter()
+        self.assertTrue(snapshot_limiter.open_ip_network_list(test_rules_filebin))
+        self.assertEqual(snapshot_limiter.get_ip_network_list(),limiter.get_ip_network_list())
+        self.assertEqual(snapshot_limiter('10.1.2.3'),'10.1.2.0/24')
+        self.assertEqual(snapshot_limiter('2001:db8::1'),'2001:db8::/32')
+        self.assertFalse(snapshot_limiter('11.0.0.1'))
+        self.assertTrue(snapshot_limiter.remove_ip('10.1.2.0/24'))
+        self.assertEqual(snapshot_limiter('10.1.2.3'),'10.0.0.0/8')
+        # a snapshot without IPv4 networks, rewritten while another object has it memory-mapped
+        ipv6_limiter = FastAccessLimiter(ip_network_list=['2001:db8::/32','2001:db8:1::/48'])
+        self.assertTrue(ipv6_limiter.save_ip_network_list(test_rules_filebin))
+        snapshot_limiter = FastAccessLimiter()
+        self.assertTrue(snapshot_limiter.open_ip_network_list(test_rules_filebin))
+        self.assertEqual(snapshot_limiter.get_ip_network_list(),['2001:db8::/32','2001:db8:1::/48'])
+        self.assertTrue(limiter.save_ip_network_list(test_rules_filebin))
+        self.assertEqual((snapshot_limiter('2001:db8:1::1'),snapshot_limiter('10.1.2.3')),('2001:db8:1::/48',False))
+        self.assertTrue(snapshot_limiter.open_ip_network_list(test_rules_filebin))
+        self.assertEqual(snapshot_limiter.get_ip_network_list(),limiter.get_ip_network_list())
+        self.assertEqual([name for name in os.listdir(os.path.dirname(test_rules_filebin)) if name.startswith(os.path.basename(test_rules_filebin)+'.')],[])
+        os.remove(test_rules_filebin)
+
+    def test_21_prepare_strict_cidrs(self): # invalid CIDRs are discarded, IPs without suffix become /32 or /128
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.10/8','10.0.0.0/33','1.2.3','01.2.3.4','a.b.c.d','','1.1.1.1','1.1.1.1/32','10.0.0.0/ 8',
+                                                     'c1a5:9ba4:8d92:636e:60fd:8756:430b:0000/64','c1a5:9ba4:8d92:636e::/64','2001:db8::1'])
+        self.assertEqual(limiter.get_ip_network_list(),['1.1.1.1/32','2001:db8::1/128','c1a5:9ba4:8d92:636e::/64'])
+        limiter.load_ip_network_list(['0.0.0.0/0'])
+        self.assertEqual(limiter('255.255.255.255'),'0.0.0.0/0')
+        self.assertFalse(limiter('::1'))
+
+    def test_22_reload_during_lookups(self): # the lookups see the old or the new list, never a mix of both
+        list_a, list_b = ['10.0.0.0/8','2001:db8::/32'], ['10.%d.0.0/16' % item for item in range(0,256,2)]
+        limiter = FastAccessLimiter(ip_network_list=list_a,cache_size=0)
+        def reload():
+            for count in range(200):
+                limiter.load_ip_network_list(list_b if count % 2 == 0 else list_a)
+                limiter.add_ip('10.1.0.0/16'), limiter.remove_ip('10.1.0.0/16')
+        thread = threading.Thread(target=reload)
+        thread.start()
+        while thread.is_alive():
+            self.assertIn(limiter('10.2.3.4'),['10.0.0.0/8','10.2.0.0/16'])
+            self.assertIn(limiter('10.3.3.4'),['10.0.0.0/8',False])
+            self.assertIn(limiter('2001:db8::1'),['2001:db8::/32',False])
+        thread.join()
+        self.assertEqual(limiter('10.2.3.4'),'10.0.0.0/8')
+
+    def test_23_check_int_packed(self): # integer and packed addresses skip the string parsing
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8','2001:db8::/32'])
+        self.assertEqual(limiter.check_int(167837954),'10.0.0.0/8')
+        self.assertFalse(limiter.check_int(184549377))
+        self.assertEqual(limiter.check_int(0x20010db8000000000000000000000001,socket.AF_INET6),'2001:db8::/32')
+        self.assertFalse(limiter.check_int(167837954,socket.AF_INET6))
+        self.assertEqual(limiter.check_packed(socket.inet_pton(socket.AF_INET,'10.1.2.3')),'10.0.0.0/8')
+        self.assertEqual(limiter.check_packed(socket.inet_pton(socket.AF_INET6,'2001:db8::1')),'2001:db8::/32')
+        self.assertFalse(limiter.check_packed(bytes(16)))
+        self.assertFalse(limiter.check_packed(b'\x0a\x01\x02'))
+        self.assertEqual(limiter.stats_info().top_hits,{'10.1.2.3':1,'10.1.1.2':1,'2001:db8::1':2})
+        # the object call never raises on a value that is not an IP string, it's checked as 0 like an invalid IP
+        self.assertEqual([limiter(ipaddr) for ipaddr in (None,123,b'10.1.2.3',['10.1.2.3'],'invalid','2001:db8::invalid')],[False]*6)
+        # the integers out of the range of the family, the values that are not integers and the unknown families never match
+        full_limiter = FastAccessLimiter(ip_network_list=['0.0.0.0/0','::/0'])
+        self.assertEqual([full_limiter.check_int(iplong) for iplong in (0,2**32-1,2**32,2**40,-1,None)],['0.0.0.0/0','0.0.0.0/0',False,False,False,False])
+        self.assertEqual([full_limiter.check_int(iplong,socket.AF_INET6) for iplong in (0,2**128-1,2**128,-1,'::1')],['::/0','::/0',False,False,False])
+        self.assertFalse(full_limiter.check_int(1,socket.AF_UNIX))
+        self.assertEqual(full_limiter.stats_info().hits,4)
+
+    def test_24_stats_sketch(self): # the heavy hitters are kept with a fixed number of counters
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8','2001:db8::/32'],top_hits=2,stats_sketch_size=4,cache_size=0)
+        for count in range(100):
+            limiter('10.0.0.1'), limiter('2001:db8::1'), limiter('10.1.%d.%d' % (count // 250,count % 250))
+        stats = limiter.stats_info()
+        self.assertEqual(stats.hits,300)
+        self.assertEqual(list(stats.top_hits),['10.0.0.1','2001:db8::1'])
+        self.assertLessEqual(stats.top_hits['10.0.0.1']-100,300 // 4)
+        limiter.check_many(['10.0.0.1','10.0.0.1','10.9.9.9'])
+        self.assertEqual(limiter.stats_info().hits,303)
+        limiter.stats_reset()
+        self.assertEqual(limiter.stats_info(),(0,{}))
+
+    def test_25_stats_threads(self): # each thread counts its hits in its own shard, no hit is lost
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8'],cache_size=0)
+        def worker():
+            for count in range(2000):
+                limiter('10.0.0.%d' % (count % 10))
+        thread_list = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        stats = limiter.stats_info()
+        self.assertEqual(stats.hits,8000)
+        self.assertEqual(stats.top_hits['10.0.0.9'],800)
+        # the shards of the finished threads are merged into one shard, with the sketch too
+        for limiter_item in (limiter,FastAccessLimiter(ip_network_list=['10.0.0.0/8'],cache_size=0,stats_sketch_size=4)):
+            for _ in range(50):
+                thread = threading.Thread(target=limiter_item,args=('10.0.0.1',))
+                thread.start()
+                thread.join()
+            self.assertLessEqual(len(limiter_item._FastAccessLimiter__stats.shards),1)
+        self.assertEqual(limiter.stats_info().hits,8050)
+        self.assertEqual(limiter.stats_info().top_hits['10.0.0.1'],850)
+        self.assertTrue(limiter.stats_reset())
+        limiter('10.0.0.1')
+        self.assertEqual(limiter.stats_info(),(1,{'10.0.0.1':1}))
+
+    def test_26_rate_limit(self): # the IPs that are not in the list are limited per client network
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8'],rate_limit=(3,60),rate_limit_prefixlen=(24,64),rate_limit_clients=2)
+        self.assertEqual([limiter('1.2.3.%d' % item) for item in range(4)],[False,False,False,'1.2.3.0/24'])
+        self.assertIsInstance(limiter('1.2.3.200'),RateLimited)
+        self.assertEqual([limiter('10.0.0.1') for item in range(5)],['10.0.0.0/8']*5)
+        self.assertEqual([limiter.check_int(0x20010db8000000000000000000000001+item,socket.AF_INET6) for item in range(4)][-1],'2001:db8::/64')
+        self.assertFalse(limiter.check_packed(socket.inet_pton(socket.AF_INET,'5.6.7.8')))
+        self.assertEqual(limiter.rate_limit_info(),(2,2))
+        self.assertIsNone(FastAccessLimiter().rate_limit_info())
+        for kwargs in ({'rate_limit':(0,60)},{'rate_limit':(10,0)},{'rate_limit':(-1,60)},{'rate_limit':(10,60),'rate_limit_prefixlen':(33,64)},
+                       {'rate_limit':(10,60),'rate_limit_prefixlen':(24,129)},{'rate_limit':(10,60),'rate_limit_prefixlen':(-1,64)},{'rate_limit':(10,60),'rate_limit_prefixlen':('24',64)}):
+            with self.assertRaises(ValueError):
+                FastAccessLimiter(**kwargs)
+
+    def test_27_rules(self): # each CIDR carries an action, a limit and a label, saved and opened with the list
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8',('10.1.0.0/16',2,100,'scrapers'),['2001:db8::1',1],('1.2.3.0/24',256)])
+        self.assertEqual(limiter.get_ip_network_list(),['10.0.0.0/8','10.1.0.0/16','2001:db8::1/128'])
+        self.assertEqual(limiter.check_rule('10.1.2.3'),Rule('10.1.0.0/16',2,100,'scrapers'))
+        self.assertEqual(limiter.check_rule('10.2.0.1'),('10.0.0.0/8',0,0,''))
+        self.assertEqual(limiter.check_rule('2001:db8::1'),('2001:db8::1/128',1,0,''))
+        self.assertFalse(limiter.check_rule('11.0.0.1'))
+        self.assertTrue(limiter.add_ip('10.1.2.0/24',action=5,limit=7,label='x'))
+        self.assertFalse(limiter.add_ip('10.1.3.0/24',action=-1))
+        self.assertEqual(limiter.check_rule('10.1.2.3'),('10.1.2.0/24',5,7,'x'))
+        # adding a CIDR again with another rule replaces its rule, the same rule is not added again
+        self.assertEqual(limiter('10.1.2.3'),'10.1.2.0/24')
+        self.assertTrue(limiter.add_ip('10.1.2.0/24',action=6,limit=8,label='y'))
+        self.assertIsNone(limiter.add_ip('10.1.2.0/24',action=6,limit=8,label='y'))
+        self.assertEqual(limiter.check_rule('10.1.2.3'),('10.1.2.0/24',6,8,'y'))
+        self.assertTrue(limiter.add_ip('2001:db8::1',action=3,label='v6'))
+        self.assertEqual(limiter.check_rule('2001:db8::1'),('2001:db8::1/128',3,0,'v6'))
+        self.assertTrue(limiter.add_ip('2001:db8::1',action=1))
+        for test_filename in (test_rules_file.replace('.json','_rules.json'),test_rules_file.replace('.json','_rules.bin')):
+            self.assertTrue(limiter.save_ip_network_list(test_filename))
+            opened_limiter = FastAccessLimiter()
+            self.assertTrue(opened_limiter.open_ip_network_list(test_filename))
+            self.assertEqual(opened_limiter.get_ip_network_list(with_rules=True),limiter.get_ip_network_list(with_rules=True))
+            self.assertEqual(opened_limiter.check_rule('10.1.9.9'),('10.1.0.0/16',2,100,'scrapers'))
+            os.remove(test_filename)
+
+    def test_28_shared_memory(self): # the workers attach the index shared by the owner and switch to each new generation
+        shm_name = f"fastaccesslimiter_unit_test_{os.getpid()}"
+        owner = FastAccessLimiter(ip_network_list=['10.0.0.0/8',('2001:db8::/32',1,0,'v6')])
+        self.assertTrue(owner.share_ip_network_list(shm_name))
+        worker = FastAccessLimiter(cache_size=0)
+        self.assertTrue(worker.attach_ip_network_list(shm_name,refresh_interval=0))
+        self.assertEqual(worker('10.1.1.1'),'10.0.0.0/8')
+        self.assertEqual(worker.check_rule('2001:db8::1'),('2001:db8::/32',1,0,'v6'))
+        self.assertEqual(worker.shared_memory_info().generation,1)
+        self.assertFalse(worker.refresh_ip_network_list())
+        owner.load_ip_network_list(['192.168.0.0/16'])
+        self.assertTrue(owner.share_ip_network_list(shm_name))
+        self.assertEqual(worker('10.1.1.1'),'10.0.0.0/8')
+        self.assertTrue(worker.refresh_ip_network_list())
+        self.assertFalse(worker('10.1.1.1'))
+        self.assertEqual(worker('192.168.1.1'),'192.168.0.0/16')
+        self.assertEqual(worker.shared_memory_info()[:3],(shm_name,False,2))
+        self.assertTrue(worker.close_shared_memory())
+        self.assertEqual(worker.get_ip_network_list(),['192.168.0.0/16'])
+        self.assertTrue(owner.close_shared_memory())
+        self.assertFalse(FastAccessLimiter().attach_ip_network_list(shm_name))
+        self.assertIsNone(owner.shared_memory_info())
+
+    def test_29_shared_stats(self): # stats_info() sums the hits and the top hits saved by each process in the shared memory
+        shm_name = f"fastaccesslimiter_unit_test_stats_{os.getpid()}"
+        first = FastAccessLimiter(ip_network_list=['10.0.0.0/8','2001:db8::/32'],cache_size=0)
+        second = FastAccessLimiter(ip_network_list=['10.0.0.0/8','2001:db8::/32'],cache_size=0)
+        for _ in range(3):
+            first('10.0.0.1')
+        self.assertTrue(first.share_stats(shm_name,max_processes=2,flush_interval=0))
+        self.assertTrue(second.share_stats(shm_name,flush_interval=0))
+        self.assertFalse(FastAccessLimiter().share_stats(shm_name,flush_interval=0))
+        for _ in range(2):
+            second('10.0.0.1')
+            second('2001:db8::1')
+        self.assertEqual(first.stats_info().hits,3)
+        self.assertTrue(second.close_shared_stats())
+        self.assertEqual(first.stats_info(),(7,{'10.0.0.1':5,'2001:db8::1':2}))
+        self.assertEqual(second.stats_info().hits,4)
+        self.assertTrue(first.stats_reset())
+        self.assertEqual(first.stats_info(),(0,{}))
+        self.assertTrue(first.close_shared_stats(unlink=True))
+        self.assertFalse(first.close_shared_stats())
+
+    def test_30_hot_reload(self): # the watched file is reloaded in a thread when it changes, and a broken file keeps the current list
+        test_filename = test_rules_file.replace('.json','_watch.json')
+        def write_and_wait(content,reloads,errors):
+            if content is not None:
+                # replace the file at once, the watcher must not see it empty while it's written
+                with open(test_filename+'.tmp','w') as f:
+                    f.write(content)
+                os.utime(test_filename+'.tmp',ns=(time.time_ns(),time.time_ns()+reloads+errors))
+                os.replace(test_filename+'.tmp',test_filename)
+            # a file that failed is read again at each interval, so there are at least `errors` errors
+            deadline = time.monotonic()+5
+            while (limiter.reload_info().reloads != reloads or limiter.reload_info().errors < errors) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(limiter.reload_info().reloads,reloads)
+            self.assertGreaterEqual(limiter.reload_info().errors,errors)
+        callback_list = []
+        limiter = FastAccessLimiter(cache_size=0)
+        self.assertFalse(limiter.stop_watch_ip_network_list())
+        with open(test_filename,'w') as f:
+            f.write(json.dumps(['10.0.0.0/8']))
+        self.assertTrue(limiter.watch_ip_network_list(test_filename,interval=0.01,callback=callback_list.append))
+        write_and_wait(None,1,0)
+        self.assertEqual(limiter('10.1.1.1'),'10.0.0.0/8')
+        write_and_wait(json.dumps(['192.168.0.0/16']),2,0)
+        self.assertFalse(limiter('10.1.1.1'))
+        write_and_wait('["192.168.0.0/16",',2,1)
+        self.assertEqual(limiter('192.168.1.1'),'192.168.0.0/16')
+        self.assertIsNotNone(limiter.reload_info().last_error)
+        self.assertEqual(callback_list,[limiter,limiter])
+        # the end of a file read while it was written, with the same inode, modification time and size, is reloaded
+        write_and_wait(None,2,2)
+        file_stat = os.stat(test_filename)
+        with open(test_filename,'r+') as f:
+            f.write('["172.16.0.0/12"] ')
+        os.utime(test_filename,ns=(file_stat.st_atime_ns,file_stat.st_mtime_ns))
+        write_and_wait(None,3,2)
+        self.assertEqual(limiter('172.16.1.1'),'172.16.0.0/12')
+        self.assertIsNone(limiter.reload_info().last_error)
+        self.assertEqual(callback_list,[limiter,limiter,limiter])
+        self.assertTrue(limiter.stop_watch_ip_network_list())
+        self.assertIsNone(limiter.reload_info().filename)
+        with open(test_filename,'w') as f:
+            f.write(json.dumps(['172.16.0.0/12']))
+        self.assertTrue(asyncio.run(limiter.open_ip_network_list_async(test_filename)))
+        self.assertEqual(limiter('172.16.1.1'),'172.16.0.0/12')
+        self.assertIsNone(limiter.reload_info().last_error)
+        os.remove(test_filename)
+
+    def test_31_streaming_feeds(self): # text, CSV and ;-commented feeds, compressed or not, are parsed line by line
+        feed = "# FireHOL netset\n; Spamhaus DROP\n\n1.10.16.0/20 ; SBL256894\n2.56.192.0/22 # comment\n10.0.0.1\t extra words\n2001:db8::/32\ninvalid\n"
+        expected_list = ['1.10.16.0/20','2.56.192.0/22','10.0.0.1/32','2001:db8::/32']
+        limiter = FastAccessLimiter()
+        for extension, opener in (('.netset',open),('.txt.gz',gzip.open),('.txt.bz2',bz2.open),('.txt.xz',lzma.open)):
+            test_filename = test_rules_file.replace('.json','_feed'+extension)
+            with opener(test_filename,'wt') as f:
+                f.write(feed)
+            self.assertTrue(limiter.open_ip_network_list(test_filename))
+            self.assertEqual(limiter.get_ip_network_list(),expected_list)
+            os.remove(test_filename)
+        test_filename = test_rules_file.replace('.json','_feed.csv')
+        with open(test_filename,'w') as f:
+            f.write("cidr,action,limit,label\n# comment\n10.0.0.0/8\n10.1.0.0/16,2,100,scrapers\n\"2001:db8::/32\",1,,v6\n1.2.3.0/24,300\n")
+        self.assertTrue(limiter.open_ip_network_list(test_filename))
+        self.assertEqual(limiter.get_ip_network_list(with_rules=True),[('10.0.0.0/8',0,0,''),('10.1.0.0/16',2,100,'scrapers'),('2001:db8::/32',1,0,'v6')])
+        os.remove(test_filename)
+        # a JSON file is detected by its content, and the format can be forced
+        test_filename = test_rules_file.replace('.json','_feed.list')
+        with open(test_filename,'w') as f:
+            f.write(' ["10.0.0.0/8",["2001:db8::/32",1]]')
+        self.assertTrue(limiter.open_ip_network_list(test_filename))
+        self.assertEqual(limiter.get_ip_network_list(),['10.0.0.0/8','2001:db8::/32'])
+        self.assertTrue(limiter.open_ip_network_list(test_filename,file_format="text"))
+        self.assertEqual(limiter.get_ip_network_list(),[])
+        self.assertFalse(limiter.open_ip_network_list(test_filename,file_format="xml"))
+        os.remove(test_filename)
+        # any iterator is parsed in one pass
+        self.assertTrue(limiter.load_ip_network_list(cidr for cidr in ['10.0.0.0/8',('10.1.0.0/16',3)]))
+        self.assertEqual(limiter.check_rule('10.1.1.1'),('10.1.0.0/16',3,0,''))
+
+    def test_32_compaction(self): # adjacent and contained networks with the same payload are collapsed, and their original CIDRs are kept
+        ip_network_list = ['10.0.0.0/24','10.0.1.0/24','10.0.2.0/24','10.0.3.0/24','10.0.2.5','10.0.4.0/24',('10.0.5.0/24',1),
+                           '192.168.0.0/16',('192.168.1.0/24',2),('192.168.1.8/32',2),'2001:db8::/33','2001:db8:8000::/33']
+        limiter = FastAccessLimiter(ip_network_list=ip_network_list,compact=True)
+        self.assertEqual(limiter.get_ip_network_list(),['10.0.0.0/22','10.0.4.0/24','10.0.5.0/24','192.168.0.0/16','192.168.1.0/24','2001:db8::/32'])
+        self.assertEqual(limiter.compaction_info(),(12,6,2,4))
+        self.assertEqual(limiter('10.0.2.5'),'10.0.0.0/22')
+        self.assertEqual(limiter.check_rule('192.168.1.8'),('192.168.1.0/24',2,0,''))
+        self.assertEqual(limiter.get_original_cidrs('10.0.0.0/22'),['10.0.0.0/24','10.0.1.0/24','10.0.2.0/24','10.0.2.5/32','10.0.3.0/24'])
+        self.assertEqual(limiter.get_original_cidrs('192.168.1.0/24'),['192.168.1.0/24','192.168.1.8/32'])
+        self.assertEqual(limiter.get_original_cidrs('10.0.4.0/24'),['10.0.4.0/24'])
+        self.assertEqual(limiter.get_original_cidrs('10.0.6.0/24'),[])
+        # the original CIDRs are kept when the compacted list is extended
+        self.assertTrue(limiter.extend_ip_network_list(['10.0.6.0/23']))
+        self.assertEqual(limiter.get_ip_network_list()[:3],['10.0.0.0/22','10.0.4.0/24','10.0.5.0/24'])
+        self.assertTrue(limiter.remove_ip('10.0.5.0/24'))
+        self.assertTrue(limiter.extend_ip_network_list(['10.0.5.0/24']))
+        self.assertEqual(limiter.get_ip_network_list()[:2],['10.0.0.0/21','192.168.0.0/16'])
+        self.assertEqual(len(limiter.get_original_cidrs('10.0.0.0/21')),8)
+        self.assertIsNone(FastAccessLimiter(ip_network_list=ip_network_list).compaction_info())
+    def test_33_change_journal(self): # a batch of changes is applied at once, journaled, replayed on the snapshot and compacted into a new snapshot
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8','10.1.0.0/16','192.168.0.0/24','2001:db8::/32'],cache_size=16)
+        self.assertEqual(limiter('10.1.2.3'),'10.1.0.0/16')
+        self.assertEqual(limiter.apply_changes(add_list=['10.1.2.3',['172.16.0.0/12',2,10,'vpn'],'2001:db8::1','10.0.0.0/8','999.0.0.0/8'],
+                                               remove_list=['10.1.0.0/16','192.168.0.0/24','10.10.0.0/16']),(3,2,1))
+        self.assertEqual(limiter.get_ip_network_list(),['10.0.0.0/8','10.1.2.3/32','172.16.0.0/12','2001:db8::/32','2001:db8::1/128'])
+        self.assertEqual(limiter('10.1.2.3'),'10.1.2.3/32')
+        self.assertEqual(limiter('10.1.2.4'),'10.0.0.0/8')
+        self.assertEqual(limiter.check_rule('172.16.1.1'),('172.16.0.0/12',2,10,'vpn'))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            snapshot_file, journal_file = os.path.join(temp_dir,'list.bin'), os.path.join(temp_dir,'list.journal')
+            self.assertTrue(limiter.save_ip_network_list(snapshot_file))
+            self.assertTrue(limiter.open_journal(journal_file,snapshot_filename=snapshot_file,max_records=3))
+            self.assertEqual(limiter.apply_changes(add_list=[['192.0.2.0/24',1,0,'']],remove_list=['10.0.0.0/8']),(1,1,0))
+            self.assertTrue(limiter.add_ip('198.51.100.7'))
+            self.assertIsNone(limiter.add_ip('198.51.100.7'))
+            self.assertEqual(limiter.journal_info().records,2)
+            # the snapshot and the journal give the same list, and a record cut by a crash is discarded
+            with open(journal_file,'a') as f:
+                f.write('{"add":["203.0.113.')
+            replica = FastAccessLimiter()
+            self.assertTrue(replica.open_ip_network_list(snapshot_file))
+            self.assertTrue(replica.open_journal(journal_file))
+            self.assertEqual(replica.get_ip_network_list(with_rules=True),limiter.get_ip_network_list(with_rules=True))
+            replica.close_journal()
+            self.assertTrue(limiter.remove_ip('198.51.100.7'))
+            self.assertEqual(limiter.journal_info()[2:4],(0,1))
+            self.assertEqual(os.path.getsize(journal_file),0)
+            replica = FastAccessLimiter()
+            self.assertTrue(replica.open_ip_network_list(snapshot_file))
+            self.assertEqual(replica.get_ip_network_list(),limiter.get_ip_network_list())
+            self.assertTrue(limiter.close_journal())
+            self.assertFalse(limiter.compact_journal())
+
+    def test_34_named_lists(self): # several named lists share one index and a single search returns the names of the lists, or the first one of the precedence
+        limiter = FastAccessLimiter(named_lists={'allow':['10.1.0.0/16','2001:db8::/48'],'deny':['10.0.0.0/8','2001:db8::/32'],'bad_asn':['10.1.2.0/24']},cache_size=16)
+        self.assertEqual(limiter('10.1.2.3'),('allow','deny','bad_asn'))
+        self.assertEqual(limiter('10.200.0.1'),('deny',))
+        self.assertEqual(limiter('2001:db8::1'),('allow','deny'))
+        self.assertFalse(limiter('11.0.0.1'))
+        self.assertTrue(limiter.add_ip('192.0.2.0/24',lists=['deny','tor']))
+        self.assertEqual(limiter('192.0.2.1'),('deny','tor'))
+        self.assertIsNone(limiter.remove_ip('192.0.2.0/24',lists=['allow']))
+        self.assertTrue(limiter.remove_ip('10.1.2.0/24',lists=['bad_asn']))
+        self.assertEqual(limiter('10.1.2.3'),('allow','deny'))
+        self.assertEqual(limiter.get_named_lists(),{'allow':['10.1.0.0/16','2001:db8::/48'],'deny':['10.0.0.0/8','192.0.2.0/24','2001:db8::/32'],
+                                                    'bad_asn':[],'tor':['192.0.2.0/24']})
+        self.assertTrue(limiter.load_named_lists({'allow':['10.1.0.0/16'],'deny':['10.0.0.0/8']},precedence=['allow','deny']))
+        self.assertEqual(limiter('10.1.2.3'),'allow')
+        self.assertEqual(limiter('10.2.0.1'),'deny')
+        self.assertEqual(limiter.check_lists('10.1.2.3'),('allow','deny'))
+        self.assertEqual(limiter.check_lists('11.0.0.1'),())
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for filename in ('lists.json','lists.bin'):
+                self.assertTrue(limiter.save_ip_network_list(os.path.join(temp_dir,filename)))
+                replica = FastAccessLimiter(named_lists={'allow':[],'deny':[]},precedence=['deny','allow'])
+                self.assertTrue(replica.open_ip_network_list(os.path.join(temp_dir,filename)))
+                self.assertEqual(replica('10.1.2.3'),'deny')
+                self.assertEqual(replica.check_lists('10.1.2.3'),('allow','deny'))
+                self.assertEqual(replica.get_named_lists()['allow'],['10.1.0.0/16'])
+                self.assertEqual(replica.get_named_lists()['deny'],['10.0.0.0/8'])
+
+    def test_35_ipv4_jump_table(self): # the first-level table of the upper 16 bits gives the same results, and it follows the changes of the list
+        network_list = ['0.0.0.0/1','10.0.0.0/8','10.1.0.0/16','10.1.2.0/24','10.1.2.3','172.16.255.255','192.168.0.0/15','2001:db8::/32']
+        limiter, plain = FastAccessLimiter(ip_network_list=network_list,ipv4_jump_table=True,cache_size=0), FastAccessLimiter(ip_network_list=network_list,cache_size=0)
+        ip_list = ['0.0.0.0','9.255.255.255','10.0.0.0','10.1.2.3','10.1.2.4','10.1.255.255','10.2.0.0','127.255.255.255','128.0.0.0',
+                   '172.16.255.254','172.16.255.255','172.17.0.0','192.167.255.255','192.169.255.255','192.170.0.0','255.255.255.255','2001:db8::1']
+        self.assertEqual([limiter(ipaddr) for ipaddr in ip_list],[plain(ipaddr) for ipaddr in ip_list])
+        for changes in ((['10.1.128.0/17','172.16.0.0/12','200.0.0.0/7'],['10.1.2.3']),(['255.255.255.255'],['10.0.0.0/8','0.0.0.0/1']),([],['192.168.0.0/15'])):
+            limiter.apply_changes(*changes)
+            plain.apply_changes(*changes)
+            self.assertEqual([limiter(ipaddr) for ipaddr in ip_list],[plain(ipaddr) for ipaddr in ip_list])
+            self.assertEqual(limiter.check_rule('10.1.200.1'),plain.check_rule('10.1.200.1'))
+        # the integers out of the IPv4 range are not in the list with or without the table
+        limiter.add_ip('0.0.0.0/0'), plain.add_ip('0.0.0.0/0')
+        for iplong in (-1,-(1 << 16),1 << 32,1 << 40):
+            self.assertFalse(limiter._FastAccessLimiter__check_ipv4_access_jump(iplong))
+            self.assertEqual(limiter._FastAccessLimiter__check_ipv4_access_jump(iplong),plain._FastAccessLimiter__check_ipv4_access(iplong))
+            self.assertEqual(limiter._FastAccessLimiter__index.ipv4.search(iplong),plain._FastAccessLimiter__index.ipv4.search(iplong))
+        limiter.remove_ip('0.0.0.0/0'), plain.remove_ip('0.0.0.0/0')
+        self.assertTrue(limiter.add_ip('10.1.2.0/23'))
+        self.assertEqual(limiter('10.1.3.255'),'10.1.2.0/23')
+        self.assertTrue(limiter.remove_ip('10.1.2.0/23'))
+        self.assertEqual(limiter('10.1.3.255'),'10.1.0.0/16')
+
+    def test_36_lookup_cache(self): # the cache of each object keeps the hot IPs during a scan, follows the generation of the index and reports its hit ratio
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8','2001:db8::/32'],cache_size=100)
+        hot_list = [f'10.0.0.{host}' for host in range(50)]+['2001:db8::1']
+        # more hot IPs than the probation segment of the cache (20 IPs) are remembered by its history and protected on the next miss
+        for _ in range(3):
+            for ipaddr in hot_list:
+                limiter(ipaddr)
+        self.assertEqual(limiter.cache_info()[:2],(21+51,51+30))
+        for host in range(10000):
+            limiter(f'11.{host // 256}.{host % 256}.1')
+        misses = limiter.cache_info().misses
+        self.assertTrue(all(limiter(ipaddr) for ipaddr in hot_list))
+        self.assertEqual(limiter.cache_info().misses,misses)
+        self.assertLessEqual(limiter.cache_info().size,200)
+        # a change removes only the IPs of the changed CIDR, a new list replaces the cache
+        self.assertTrue(limiter.add_ip('10.0.0.0/28'))
+        self.assertEqual(limiter.cache_info().generation,2)
+        self.assertEqual([limiter(ipaddr) for ipaddr in ('10.0.0.1','10.0.0.20')],['10.0.0.0/28','10.0.0.0/8'])
+        self.assertEqual(limiter.cache_info().misses,misses+1)
+        self.assertTrue(limiter.load_ip_network_list(['10.0.0.0/16']))
+        self.assertEqual((limiter('10.0.0.20'),limiter('2001:db8::1')),('10.0.0.0/16',False))
+        self.assertEqual(limiter.cache_info()[1:],(misses+3,(limiter.cache_info().hits)/(limiter.cache_info().hits+misses+3),2,200,3))
+        self.assertEqual(FastAccessLimiter(cache_size=0).cache_info().max_size,0)
+        # the lru cache is replaced on each change of the index, and its counters are kept
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8','2001:db8::/32'],cache_size=100,cache_policy='lru')
+        for _ in range(3):
+            for ipaddr in hot_list:
+                limiter(ipaddr)
+        self.assertEqual(limiter.cache_info(),(102,51,102/153,51,200,1))
+        self.assertTrue(limiter.add_ip('10.0.0.0/28'))
+        self.assertEqual(limiter.cache_info()[3:],(0,200,2))
+        self.assertEqual([limiter(ipaddr) for ipaddr in ('10.0.0.1','10.0.0.1','2001:db8::1')],['10.0.0.0/28','10.0.0.0/28','2001:db8::/32'])
+        self.assertEqual(limiter.cache_info()[:4],(103,53,103/156,2))
+        with self.assertRaises(ValueError):
+            FastAccessLimiter(cache_policy='lfu')
+
+    def test_37_metrics(self): # the lookups of all the threads are counted in the histogram, the builds and updates are timed, and the Prometheus export is consistent
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8','2001:db8::/32'],metrics=True)
+        self.assertEqual(FastAccessLimiter().metrics_info(),None)
+        self.assertEqual(FastAccessLimiter().metrics_prometheus(),"")
+        def lookups():
+            for _ in range(100):
+                limiter('10.0.0.1'), limiter('11.0.0.1'), limiter.check_int(0x20010db8 << 96,socket.AF_INET6)
+        thread_list = [threading.Thread(target=lookups) for _ in range(4)]
+        [thread.start() for thread in thread_list]
+        [thread.join() for thread in thread_list]
+        # the shards of the finished threads are merged into one shard
+        self.assertEqual(len(limiter._FastAccessLimiter__latency.shards),1)
+        self.assertTrue(limiter.add_ip('12.0.0.0/8'))
+        metrics = limiter.metrics_info()
+        self.assertEqual((metrics.lookups,sum(metrics.latency_buckets.values()),metrics.cache_hits+metrics.cache_misses),(1200,1200,1200))
+        self.assertEqual((metrics.generation,metrics.networks,metrics.ipv4_intervals,metrics.ipv6_intervals,metrics.rebuilds,metrics.updates),(2,3,2,1,1,1))
+        self.assertTrue(metrics.latency_sum > 0 and metrics.rebuild_duration > 0 and metrics.update_duration > 0)
+        self.assertTrue(metrics.latency_percentiles[0.5] <= metrics.latency_percentiles[0.99] <= max(metrics.latency_buckets))
+        prometheus_lines = limiter.metrics_prometheus(prefix="acl",labels={"list":"block"}).splitlines()
+        self.assertIn('acl_lookup_duration_seconds_bucket{list="block",le="+Inf"} 1200',prometheus_lines)
+        self.assertIn('acl_lookup_duration_seconds_count{list="block"} 1200',prometheus_lines)
+        self.assertIn('acl_index_intervals{list="block",family="ipv6"} 1',prometheus_lines)
+        bucket_counts = [int(line.split()[-1]) for line in prometheus_lines if line.startswith("acl_lookup_duration_seconds_bucket")]
+        self.assertEqual(bucket_counts,sorted(bucket_counts))
+        self.assertTrue(limiter.metrics_reset())
+        self.assertEqual((limiter.metrics_info().lookups,limiter.metrics_info().updates),(0,1))
+
+    def test_38_ipv6_prefix_search(self): # the /64 and shorter networks are found by the high halves, the longer networks also by the low halves
+        limiter = FastAccessLimiter(ip_network_list=['2001:db8::/48','2001:db8:0:1::/64','2001:db8:0:1::8000:0/112','2001:db8:0:1:ffff::/128','2001:db8:0:3::/64'],cache_size=0)
+        expected_results = {'2001:db8::':'2001:db8::/48','2001:db8:0:1::':'2001:db8:0:1::/64','2001:db8:0:1::7fff:ffff':'2001:db8:0:1::/64',
+                            '2001:db8:0:1::8000:0':'2001:db8:0:1::8000:0/112','2001:db8:0:1::8000:ffff':'2001:db8:0:1::8000:0/112',
+                            '2001:db8:0:1::8001:0':'2001:db8:0:1::/64','2001:db8:0:1:ffff::':'2001:db8:0:1:ffff::/128','2001:db8:0:1:ffff::1':'2001:db8:0:1::/64',
+                            '2001:db8:0:2::':'2001:db8::/48','2001:db8:0:3:ffff:ffff:ffff:ffff':'2001:db8:0:3::/64','2001:db8:0:ffff:ffff:ffff:ffff:ffff':'2001:db8::/48',
+                            '2001:db8:1::':False,'2001:db7:ffff:ffff:ffff:ffff:ffff:ffff':False,'::':False,'invalid::ip':False}
+        self.assertEqual({ipaddr:limiter(ipaddr) for ipaddr in expected_results},expected_results)
+        self.assertTrue(limiter.add_ip('2001:db8:0:2::1/128'))
+        self.assertTrue(limiter.remove_ip('2001:db8:0:1::/64'))
+        self.assertEqual([limiter(ipaddr) for ipaddr in ('2001:db8:0:2::','2001:db8:0:2::1','2001:db8:0:2::2','2001:db8:0:1::1','2001:db8:0:1::8000:1')],
+                         ['2001:db8::/48','2001:db8:0:2::1/128','2001:db8::/48','2001:db8::/48','2001:db8:0:1::8000:0/112'])
+
+    def test_39_ttl(self): # the CIDRs added with a TTL are removed in one batch per tick, and their expiry times are saved with the list
+        limiter = FastAccessLimiter(ip_network_list=['10.0.0.0/8'],expiry_interval=0.05)
+        self.assertFalse(limiter.add_ip('203.0.113.7',ttl=0))
+        self.assertTrue(limiter.add_ip('198.51.100.0/24',action=2,ttl=7200))
+        self.assertTrue(limiter.add_ip('198.51.100.0/24',action=2,ttl=3600))
+        # a CIDR with a TTL added again without ttl becomes permanent, and a permanent CIDR is never made temporary
+        self.assertTrue(limiter.add_ip('203.0.113.0/24',ttl=3600))
+        self.assertTrue(limiter.add_ip('203.0.113.0/24'))
+        self.assertIsNone(limiter.get_ttl('203.0.113.0/24'))
+        self.assertIsNone(limiter.add_ip('203.0.113.0/24',ttl=0.1))
+        self.assertIsNone(limiter.add_ip('10.0.0.0/8',ttl=0.1))
+        self.assertEqual(limiter.apply_changes(add_list=[['10.0.0.0/8',0,0,"",[],time.time()+0.1]]).added,0)
+        self.assertEqual((limiter.get_ttl('203.0.113.0/24'),limiter.get_ttl('10.0.0.0/8')),(None,None))
+        self.assertTrue(limiter.remove_ip('203.0.113.0/24'))
+        self.assertTrue(3590 < limiter.get_ttl('198.51.100.0/24') <= 3600)
+        self.assertEqual((limiter.get_ttl('10.0.0.0/8'),limiter.get_ttl('11.0.0.0/8')),(None,None))
+        expires = time.time()+0.1
+        self.assertEqual(limiter.apply_changes(add_list=[['203.0.113.7',0,0,"",[],expires],['2001:db8::/64',0,0,"",[],expires]]).added,2)
+        self.assertEqual(limiter('2001:db8::1'),'2001:db8::/64')
+        for _ in range(100):
+            if limiter.expiry_info().expired == 2:
+                break
+            time.sleep(0.05)
+        self.assertEqual((limiter('203.0.113.7'),limiter('2001:db8::1'),limiter('198.51.100.1')),(False,False,'198.51.100.0/24'))
+        self.assertEqual(limiter.expiry_info()[2:4],(2,1))
+        self.assertEqual(limiter.remove_expired(),0)
+        # the expiry times are kept by the JSON files and the snapshots, and an expired CIDR is removed after the list is opened
+        self.assertTrue(limiter.add_ip('192.0.2.1',ttl=0.1))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for filename in ('rules.json','rules.bin'):
+                self.assertTrue(limiter.save_ip_network_list(os.path.join(temp_dir,filename)))
+                opened_limiter = FastAccessLimiter(expiry_interval=0.05)
+                self.assertTrue(opened_limiter.open_ip_network_list(os.path.join(temp_dir,filename)))
+                self.assertTrue(3590 < opened_limiter.get_ttl('198.51.100.0/24') <= 3600)
+                self.assertEqual(opened_limiter.get_ip_network_list(with_rules=True)[-1],Rule('198.51.100.0/24',2,0,''))
+                for _ in range(100):
+                    if opened_limiter('192.0.2.1') is False:
+                        break
+                    time.sleep(0.05)
+                self.assertEqual(opened_limiter.get_ip_network_list(),['10.0.0.0/8','198.51.100.0/24'])
+
 if __name__ == '__main__':
     test_rules_file = '/tmp/fastaccesslimiter_unit_test.json'
     test_rules_filegz = test_rules_file+'.gz'